@@ -0,0 +1,238 @@
+"""
+Аутентификация по токену с кешем.
+
+TokenAuthentication из DRF на каждый запрос делает запрос Token + User.
+CachedTokenAuthentication ищет пользователя по ключу токена в двух уровнях:
+
+1. ограниченный LRU-кеш в памяти процесса с коротким временем жизни
+   (AUTH_TOKEN_LOCAL_CACHE_SIZE записей, AUTH_TOKEN_LOCAL_CACHE_TTL секунд);
+2. общий кеш Django (AUTH_TOKEN_CACHE_TTL секунд).
+
+В кеше хранятся значения полей пользователя без хеша пароля (cached_fields):
+запрос получает загруженного пользователя, и проверки прав (is_staff,
+is_superuser) и представления (username) не обращаются к базе.
+
+Запрос к базе выполняется только при промахе обоих уровней. Удаление
+токена, изменение или удаление пользователя сбрасывают записи сигналами
+(accounts/signals.py): общий кеш - сразу во всех процессах, кеш в памяти -
+в текущем процессе, а в остальных запись устаревает не позже чем через
+AUTH_TOKEN_LOCAL_CACHE_TTL секунд.
+
+Второй уровень используется, только если кеш Django действительно общий
+для процессов (Redis, Memcached, база, файлы). С LocMemCache у каждого
+воркера свой кеш, и отозванный токен оставался бы действительным в других
+воркерах до AUTH_TOKEN_CACHE_TTL, поэтому работает только первый уровень
+с его коротким временем жизни.
+
+aauthenticate() - та же проверка для асинхронных представлений
+(booking/async_views.py): общий кеш и база - через асинхронный API.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+from booking_spaceses.metrics import cache_lookup
+
+TOKEN_KEY = 'accounts:token:user:{key}'
+ME_KEY = 'accounts:me:{user_id}'
+
+# Кеши, которые у каждого процесса свои: сброс записи в одном процессе
+# не виден в остальных
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache_configured():
+    return settings.CACHES['default']['BACKEND'] not in PER_PROCESS_CACHES
+
+
+class LocalTTLCache:
+    """Потокобезопасный LRU-кеш с ограниченным временем жизни записей"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_tokens = LocalTTLCache(
+    getattr(settings, 'AUTH_TOKEN_LOCAL_CACHE_SIZE', 1024),
+    getattr(settings, 'AUTH_TOKEN_LOCAL_CACHE_TTL', 10)
+)
+
+
+def cached_fields():
+    """Поля пользователя в записи кеша: все, кроме хеша пароля, в порядке модели"""
+    return [
+        field.attname for field in get_user_model()._meta.concrete_fields
+        if field.attname != 'password'
+    ]
+
+
+def token_entry(token):
+    return tuple(getattr(token.user, name) for name in cached_fields())
+
+
+def entry_user(entry):
+    """Пользователь из записи кеша; отложен только пароль"""
+    user = get_user_model().from_db(None, cached_fields(), entry)
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        model = self.get_model()
+        shared = shared_cache_configured()
+
+        entry = cache_lookup('token_local', local_tokens.get(key))
+        if entry is None and shared:
+            entry = cache_lookup('token', cache.get(TOKEN_KEY.format(key=key)))
+        if entry is None:
+            try:
+                token = model.objects.select_related('user').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            entry = token_entry(token)
+            if shared:
+                cache.set(TOKEN_KEY.format(key=key), entry, settings.AUTH_TOKEN_CACHE_TTL)
+        local_tokens.set(key, entry)
+
+        user = entry_user(entry)
+        return (user, model(key=key, user=user))
+
+
+async def session_user(request):
+    """
+    Пользователь сессии. request.auser() появился в Django 5.0; в более
+    ранних версиях ленивый request.user вычисляется в потоке
+    """
+    auser = getattr(request, 'auser', None)
+    if auser is not None:
+        return await auser()
+    return await sync_to_async(lambda: request.user)()
+
+
+async def aauthenticate(request):
+    """
+    Пользователь запроса для асинхронных представлений: по заголовку
+    "Authorization: Token <ключ>", иначе по сессии. None - анонимный запрос
+    """
+    from rest_framework.authtoken.models import Token
+
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != CachedTokenAuthentication.keyword.lower().encode():
+        user = await session_user(request)
+        return user if user.is_authenticated else None
+    if len(auth) == 1:
+        raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+    if len(auth) > 2:
+        raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        raise exceptions.AuthenticationFailed(
+            _('Invalid token header. Token string should not contain invalid characters.')
+        )
+
+    shared = shared_cache_configured()
+    entry = cache_lookup('token_local', local_tokens.get(key))
+    if entry is None and shared:
+        entry = cache_lookup('token', await cache.aget(TOKEN_KEY.format(key=key)))
+    if entry is None:
+        try:
+            token = await Token.objects.select_related('user').aget(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        entry = token_entry(token)
+        if shared:
+            await cache.aset(TOKEN_KEY.format(key=key), entry, settings.AUTH_TOKEN_CACHE_TTL)
+    local_tokens.set(key, entry)
+    return entry_user(entry)
+
+
+def invalidate_token(key):
+    cache.delete(TOKEN_KEY.format(key=key))
+    local_tokens.delete(key)
+
+
+def invalidate_user(user_id):
+    """Сбрасывает токены пользователя и кеш ответа MeView"""
+    from rest_framework.authtoken.models import Token
+
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(key)
+    cache.delete(ME_KEY.format(user_id=user_id))
+
+
+def _me(user):
+    return {
+        'username': user.username,
+        'is_superuser': user.is_superuser,
+        'is_admin': user.is_superuser
+    }
+
+
+def me_payload(user):
+    """
+    Ответ MeView из кеша; сбрасывается при изменении пользователя.
+    Без общего кеша ответ строится каждый раз
+    """
+    if not shared_cache_configured():
+        return _me(user)
+    key = ME_KEY.format(user_id=user.pk)
+    payload = cache_lookup('me', cache.get(key))
+    if payload is None:
+        payload = _me(user)
+        cache.set(key, payload, settings.AUTH_TOKEN_CACHE_TTL)
+    return payload
+
+
+async def ame_payload(user):
+    if not shared_cache_configured():
+        return _me(user)
+    key = ME_KEY.format(user_id=user.pk)
+    payload = cache_lookup('me', await cache.aget(key))
+    if payload is None:
+        payload = _me(user)
+        await cache.aset(key, payload, settings.AUTH_TOKEN_CACHE_TTL)
+    return payload
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import ME_KEY, invalidate_token, invalidate_user
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """
+    Сбрасывает кеш аутентификации удаленного токена после фиксации транзакции:
+    до нее параллельный запрос еще видит токен в базе и может вернуть его в кеш
+    """
+    key = instance.key
+    transaction.on_commit(lambda: invalidate_token(key))
+
+
+@receiver(post_save, sender=User)
+def invalidate_changed_user(sender, instance, created, **kwargs):
+    # Деактивация, смена прав или пароля - закешированный пользователь устарел
+    if created:
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    # Токены удаляются каскадно и сбрасываются своим сигналом
+    key = ME_KEY.format(user_id=instance.pk)
+    transaction.on_commit(lambda: cache.delete(key))
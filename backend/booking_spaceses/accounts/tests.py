@@ -1,3 +1,98 @@
-from django.test import TestCase
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import TOKEN_KEY, cached_fields, local_tokens
+
+User = get_user_model()
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def shared_cache(directory):
+    return {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        local_tokens.clear()
+        self.user = User.objects.create_user(username='alice', password='secret-password')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def tearDown(self):
+        local_tokens.clear()
+
+    def me(self):
+        return self.client.get('/api/auth/me/')
+
+    def expired(self):
+        """Время после истечения записей кеша в памяти процесса"""
+        return mock.patch('accounts.authentication.time.monotonic', return_value=time.monotonic() + local_tokens.ttl + 1)
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_per_process_cache_uses_only_local_tier(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.assertIsNone(cache.get(TOKEN_KEY.format(key=self.token.key)))
+        self.assertIsNotNone(local_tokens.get(self.token.key))
+
+        # Отзыв в другом процессе: без сигналов текущего процесса запись
+        # в памяти живет до AUTH_TOKEN_LOCAL_CACHE_TTL
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM authtoken_token WHERE key = %s', [self.token.key])
+        self.assertEqual(self.me().status_code, 200)
+        with self.expired():
+            self.assertEqual(self.me().status_code, 401)
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_per_process_cache_sees_deactivation_in_other_process(self):
+        self.assertEqual(self.me().status_code, 200)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.expired():
+            self.assertEqual(self.me().status_code, 401)
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_cached_user_is_fully_loaded(self):
+        self.assertEqual(self.me().status_code, 200)
+        # is_staff для IsAdminUser и username/is_superuser для MeView - без запросов
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/bookings/all/').status_code, 403)
+            self.assertEqual(self.me().data['username'], 'alice')
+
+    def test_shared_cache_holds_user_fields_without_password(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(CACHES=shared_cache(directory)):
+            response = self.me()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['username'], 'alice')
+            entry = dict(zip(cached_fields(), cache.get(TOKEN_KEY.format(key=self.token.key))))
+            self.assertNotIn('password', entry)
+            self.assertEqual((entry['id'], entry['username'], entry['is_staff']), (self.user.pk, 'alice', False))
+
+            # Запись из общего кеша: пользователь без запросов к базе
+            local_tokens.clear()
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get('/api/bookings/all/').status_code, 403)
+
+    def test_shared_cache_revoked_token_is_rejected(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(CACHES=shared_cache(directory)):
+            self.assertEqual(self.me().status_code, 200)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.token.delete()
+            local_tokens.clear()
+            self.assertEqual(self.me().status_code, 401)
+
+    def test_shared_cache_deactivated_user_is_rejected(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(CACHES=shared_cache(directory)):
+            self.assertEqual(self.me().status_code, 200)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.is_active = False
+                self.user.save()
+            self.assertEqual(self.me().status_code, 401)
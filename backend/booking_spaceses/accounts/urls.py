@@ -1,8 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from .views import RegisterView, LoginView, MeView
 
-urlpatterns = [
-    path('register/', RegisterView.as_view(), name='register'),
-    path('login/', LoginView.as_view(), name='login'),
-    path('me/', MeView.as_view(), name='me'),
-]
\ No newline at end of file
+
+def build_urlpatterns(async_views=False):
+    if async_views:
+        from booking.async_views import me
+    else:
+        me = MeView.as_view()
+    return [
+        path('register/', RegisterView.as_view(), name='register'),
+        path('login/', LoginView.as_view(), name='login'),
+        path('me/', me, name='me'),
+    ]
+
+
+urlpatterns = build_urlpatterns(settings.API_ASYNC_VIEWS)
@@ -4,6 +4,7 @@ from rest_framework.authtoken.models import Token
 from django.contrib.auth import get_user_model
 from rest_framework.response import Response
 from .serializers import UserSerializer
+from .authentication import me_payload
 from rest_framework.views import APIView
 
 User = get_user_model()
@@ -29,8 +30,4 @@ class MeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        return Response({
-            'username': request.user.username,
-            'is_superuser': request.user.is_superuser,
-            'is_admin': request.user.is_superuser
-        })
+        return Response(me_payload(request.user))
@@ -1,5 +1,73 @@
-from django.contrib import admin
-from .models import Space, Booking
+from datetime import datetime
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import bulk
+from .models import Space, Booking, BookingSeries, SeriesException
+
+# Таблицы меньше этого размера админка считает точным COUNT(*)
+ESTIMATED_COUNT_MIN = 10000
+
+
+def estimated_count(model, using):
+    """Оценка числа строк таблицы по статистике PostgreSQL или None"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 - таблица еще не анализировалась
+    return row[0] if row and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор списков админки без фильтров: число строк берется из
+    pg_class.reltuples вместо COUNT(*) по всей таблице. Число страниц
+    приблизительное; с фильтрами, поиском и на SQLite - обычный COUNT(*)
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_MIN:
+                return estimate
+        return super().count
+
+
+class DateRangeQuerySet(models.QuerySet):
+    """
+    QuerySet списков админки: годы и месяцы date_hierarchy строятся по
+    MIN/MAX (индекс по дате) вместо DISTINCT по усеченным датам всех строк.
+    Месяцы и годы без записей внутри диапазона тоже попадают в список
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        first, last = timezone.localtime(bounds['first']), timezone.localtime(bounds['last'])
+        if kind == 'year':
+            keys = [(year, 1) for year in range(first.year, last.year + 1)]
+        else:
+            keys = [
+                divmod(month, 12) for month in range(first.year * 12 + first.month - 1, last.year * 12 + last.month)
+            ]
+            keys = [(year, month + 1) for year, month in keys]
+        periods = [timezone.make_aware(datetime(year, month, 1)) for year, month in keys]
+        return periods if order == 'ASC' else periods[::-1]
 
 
 @admin.register(Space)
@@ -8,8 +76,78 @@ class SpaceAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
 
+class BookingActionForm(ActionForm):
+    space = forms.ModelChoiceField(
+        queryset=Space.objects.only('id', 'name').order_by('name'), required=False,
+        label='Пространство для переноса'
+    )
+
+
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
-    list_display = ['user', 'space', 'start_time', 'duration']
+    list_display = ['id', 'user', 'space', 'start_time', 'end_time', 'duration']
     list_filter = ['space', 'start_time']
     search_fields = ['user__username', 'description']
+    # __str__ брони обращается к пользователю и пространству
+    list_select_related = ['user', 'space']
+    # Индекс booking_start_id_idx: и сортировка, и фильтры по датам
+    date_hierarchy = 'start_time'
+    ordering = ['-start_time', '-id']
+    raw_id_fields = ['user']
+    autocomplete_fields = ['space']
+    paginator = EstimatedCountPaginator
+    # Без второго COUNT(*) по всей таблице при фильтрах
+    show_full_result_count = False
+    action_form = BookingActionForm
+    actions = ['cancel_bookings', 'move_bookings']
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return DateRangeQuerySet(queryset.model, queryset.query, queryset.db)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # delete_selected удаляет брони по одной с сигналами на каждую
+        # и выводит все удаляемые объекты на странице подтверждения
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.action(permissions=['delete'], description='Отменить выбранные брони')
+    def cancel_bookings(self, request, queryset):
+        cancelled = bulk.cancel_bookings(queryset)
+        self.message_user(request, f'Отменено броней: {cancelled}', messages.SUCCESS)
+
+    @admin.action(permissions=['change'], description='Перенести выбранные брони в пространство')
+    def move_bookings(self, request, queryset):
+        space = None
+        space_id = request.POST.get('space')
+        if space_id and space_id.isdigit():
+            space = Space.objects.filter(pk=space_id).first()
+        if space is None:
+            self.message_user(request, 'Выберите пространство для переноса', messages.ERROR)
+            return
+        moved, conflicts = bulk.move_bookings(queryset, space)
+        if conflicts:
+            shown = ', '.join(str(booking_id) for booking_id in conflicts[:20])
+            more = f' и еще {len(conflicts) - 20}' if len(conflicts) > 20 else ''
+            self.message_user(
+                request,
+                f'Брони не перенесены: в пространстве "{space.name}" заняты слоты броней {shown}{more}',
+                messages.ERROR
+            )
+            return
+        self.message_user(request, f'Перенесено броней в "{space.name}": {len(moved)}', messages.SUCCESS)
+
+
+class SeriesExceptionInline(admin.TabularInline):
+    model = SeriesException
+    extra = 0
+
+
+@admin.register(BookingSeries)
+class BookingSeriesAdmin(admin.ModelAdmin):
+    list_display = ['user', 'space', 'start_time', 'frequency', 'until']
+    list_filter = ['space', 'frequency']
+    list_select_related = ['user', 'space']
+    search_fields = ['user__username', 'description']
+    inlines = [SeriesExceptionInline]
@@ -7,18 +7,17 @@ class BookingConfig(AppConfig):
 
     def ready(self):
         """
-        Вызывается при запуске приложения Django
-        Автоматически очищаем старые бронирования при старте
+        Вызывается при запуске приложения Django.
+        Очистка старых бронирований здесь не выполняется: этим занимается
+        воркер очистки (booking/retention.py)
         """
-        try:
-            from .models import Booking
-            # Очищаем старые бронирования при запуске приложения
-            deleted_count = Booking.cleanup_old_bookings()
-            if deleted_count > 0:
-                print(f"При запуске приложения удалено {deleted_count} старых бронирований")
-            
-            # Импортируем сигналы для их регистрации
-            from . import signals
-        except Exception as e:
-            # Игнорируем ошибки при миграциях
-            pass
+        from django.conf import settings
+        from django.core.signals import request_started
+
+        # Импортируем сигналы для их регистрации
+        from . import signals
+
+        if settings.BOOKING_RETENTION_IN_PROCESS:
+            from .retention import start_retention_worker
+            # Поток стартует с первым запросом, а не при импорте приложения
+            request_started.connect(start_retention_worker, dispatch_uid='booking-retention-worker')
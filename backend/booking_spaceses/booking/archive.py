@@ -0,0 +1,203 @@
+"""
+Архив удаленных бронирований.
+
+Перед удалением устаревшие брони выгружаются потоком (QuerySet.iterator)
+в сжатые файлы JSON Lines, разбитые по месяцам начала брони. Каждая порция
+очистки записывается в месяц отдельным законченным файлом-сегментом:
+``BOOKING_ARCHIVE_DIR/bookings/2025-05/<время>-<случайный id>.jsonl.gz``.
+Сегмент пишется во временный файл, сбрасывается на диск и только затем
+переименовывается, поэтому прерванная запись не портит архив: до
+переименования порция из базы не удаляется, а недописанный временный
+файл при чтении игнорируется. Каждая запись сегмента - одна бронь с
+отметкой ROLLUP_FIELD: очистка удаляет брони в обход сводок использования
+(booking/utilization.py), и бронь остается в них учтенной. В сегментах,
+записанных до появления отметки, брони в сводках могут отсутствовать.
+
+Чтение - read_partition(), возврат брони в базу - restore_partition()
+(команда ``python manage.py restore_bookings 2025-05``).
+"""
+import gzip
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+ARCHIVE_FIELDS = ['id', 'user_id', 'space_id', 'start_time', 'duration', 'end_time', 'description']
+# Отметка записи архива: бронь учтена в сводках использования
+ROLLUP_FIELD = 'in_rollups'
+
+
+def archive_root(directory=None):
+    return Path(directory or settings.BOOKING_ARCHIVE_DIR) / 'bookings'
+
+
+def partition_path(month, directory=None):
+    """Каталог сегментов месяца"""
+    return archive_root(directory) / month
+
+
+def partition_for(start_time):
+    """Месяц (YYYY-MM) брони в локальном часовом поясе"""
+    return timezone.localtime(start_time).strftime('%Y-%m')
+
+
+def partition_segments(month, directory=None):
+    """Законченные сегменты месяца в порядке записи"""
+    path = partition_path(month, directory)
+    if not path.is_dir():
+        return []
+    return sorted(path.glob('*.jsonl.gz'))
+
+
+def fsync_directory(path):
+    """Сбрасывает на диск запись каталога (переименование файла в нем)"""
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class ArchiveWriter:
+    """
+    Накапливает брони порции по месяцам; flush() записывает их сегментами.
+    Порцию можно удалять из базы только после flush()
+    """
+
+    def __init__(self, directory=None):
+        self.root = archive_root(directory)
+        self._rows = {}
+        self.written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, row):
+        line = json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+        self._rows.setdefault(partition_for(row['start_time']), []).append(line.encode('utf-8'))
+
+    def write_queryset(self, queryset, chunk_size=None):
+        """
+        Выгружает брони очистки потоком, не загружая модели в память.
+        Очистка не вычитает брони из сводок, поэтому записи отмечены ROLLUP_FIELD
+        """
+        chunk_size = chunk_size or settings.BOOKING_ARCHIVE_CHUNK_SIZE
+        for row in queryset.order_by('pk').values(*ARCHIVE_FIELDS).iterator(chunk_size=chunk_size):
+            row[ROLLUP_FIELD] = True
+            self.write(row)
+
+    def _write_segment(self, month, lines):
+        directory = self.root / month
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}.jsonl.gz'
+        temporary = directory / f'{name}.tmp'
+        try:
+            with open(temporary, 'wb') as segment:
+                with gzip.GzipFile(fileobj=segment, mode='wb') as archive_file:
+                    archive_file.writelines(lines)
+                segment.flush()
+                os.fsync(segment.fileno())
+            os.replace(temporary, directory / name)
+        except BaseException:
+            temporary.unlink(missing_ok=True)
+            raise
+        fsync_directory(directory)
+
+    def flush(self):
+        """Записывает накопленные брони на диск: вызывается перед удалением порции из базы"""
+        for month, lines in self._rows.items():
+            self._write_segment(month, lines)
+            self.written += len(lines)
+        self._rows.clear()
+
+    def close(self):
+        # Незаписанные брони отбрасываются: их порция из базы не удалялась
+        self._rows.clear()
+
+
+def list_partitions(directory=None):
+    """Месяцы, для которых есть архив, по возрастанию"""
+    root = archive_root(directory)
+    if not root.exists():
+        return []
+    return sorted(path.name for path in root.iterdir() if path.is_dir() and partition_segments(path.name, directory))
+
+
+def read_partition(month, directory=None):
+    """
+    Брони месяца из архива (словари с полями ARCHIVE_FIELDS и ROLLUP_FIELD)
+    в порядке записи: внутри сегмента - по возрастанию id.
+
+    Память не зависит от размера архива: повторы между сегментами не
+    отсекаются. Бронь попадает в архив повторно, если очистку прервали между
+    записью сегмента и удалением порции или если восстановленную бронь снова
+    удалила очистка; restore_partition() пропускает повторы по базе.
+    """
+    for segment in partition_segments(month, directory):
+        with gzip.open(segment, 'rt', encoding='utf-8') as archive_file:
+            for line in archive_file:
+                row = json.loads(line)
+                row['start_time'] = parse_datetime(row['start_time'])
+                row['end_time'] = parse_datetime(row['end_time'])
+                row.setdefault(ROLLUP_FIELD, False)
+                yield row
+
+
+def restore_partition(month, directory=None, batch_size=1000):
+    """
+    Возвращает брони месяца в таблицу booking_booking через bulk_create.
+
+    Брони, которые уже есть в базе (и повторы записей архива), пропускаются;
+    брони удаленных пользователей или пространств не восстанавливаются.
+    О восстановленных бронях сообщает сигнал bookings_bulk_created
+    (restored=True): версии расписания и лент и события обновляются так же,
+    как при пакетном создании, а к сводкам использования прибавляются только
+    брони без отметки ROLLUP_FIELD - остальные очистка в сводках оставила.
+    Возвращает пару (восстановлено, пропущено).
+    """
+    from django.contrib.auth import get_user_model
+    from .models import Booking, Space
+    from .signals import bookings_bulk_created
+
+    User = get_user_model()
+    user_ids = set(User.objects.values_list('pk', flat=True))
+    space_ids = set(Space.objects.values_list('pk', flat=True))
+    restored = skipped = 0
+    batch = {}
+
+    def flush_batch():
+        with transaction.atomic():
+            existing = set(Booking.objects.filter(pk__in=list(batch)).values_list('pk', flat=True))
+            new_bookings = [booking for pk, booking in batch.items() if pk not in existing]
+            if new_bookings:
+                Booking.objects.bulk_create(new_bookings)
+                bookings_bulk_created.send(sender=Booking, bookings=new_bookings, restored=True)
+        batch.clear()
+        return len(new_bookings), len(existing)
+
+    for row in read_partition(month, directory):
+        if row['user_id'] not in user_ids or row['space_id'] not in space_ids or row['id'] in batch:
+            skipped += 1
+            continue
+        in_rollups = row.pop(ROLLUP_FIELD)
+        booking = batch[row['id']] = Booking(**row)
+        booking._in_rollups = in_rollups
+        if len(batch) >= batch_size:
+            created, duplicates = flush_batch()
+            restored += created
+            skipped += duplicates
+    if batch:
+        created, duplicates = flush_batch()
+        restored += created
+        skipped += duplicates
+    return restored, skipped
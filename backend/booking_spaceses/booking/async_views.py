@@ -0,0 +1,135 @@
+"""
+Асинхронные представления чтения для ASGI (настройка API_ASYNC_VIEWS).
+
+Те же ответы, что у SpaceListView, SpaceDetailView, SpaceBookingsView,
+UserBookingsListView и MeView, но без DRF: кеш и ORM вызываются через
+асинхронный API Django, и один процесс uvicorn обслуживает много запросов
+одновременно, пока они ждут кеш или базу. ETag и 304 - как у синхронных
+представлений (conditional_response).
+
+Отличия от DRF-представлений:
+
+- ответ всегда JSON, браузерного API нет;
+- постраничная выдача (?cursor=, ?page_size=) передается синхронному
+  представлению через sync_to_async;
+- сборка расписания дня при промахе кеша (брони и серии)
+  остается синхронной и выполняется в потоке запроса.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from rest_framework import exceptions
+from rest_framework.exceptions import ValidationError
+
+from accounts.authentication import CachedTokenAuthentication, aauthenticate, ame_payload
+from . import schedule
+from .catalogue import aget_catalogue
+from .flat import BOOKING_FLAT
+from .models import Booking
+from .pagination import BookingCursorPagination
+from .renderers import FastJSONRenderer
+from .views import SpaceBookingsView, UserBookingsListView, day_schedule, parse_day
+
+space_bookings_paginated = sync_to_async(SpaceBookingsView.as_view())
+user_bookings_paginated = sync_to_async(UserBookingsListView.as_view())
+
+
+def json_response(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def conditional_json_response(request, data, etag, last_modified=None):
+    """conditional_response() из booking/views.py для асинхронных представлений"""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = json_response(data)
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def paginated(request):
+    return (
+        BookingCursorPagination.cursor_query_param in request.GET
+        or BookingCursorPagination.page_size_query_param in request.GET
+    )
+
+
+def not_authenticated(detail):
+    response = json_response({'detail': detail}, status=401)
+    response['WWW-Authenticate'] = CachedTokenAuthentication.keyword
+    return response
+
+
+async def authenticated_user(request):
+    """Пользователь запроса или ответ 401, как у IsAuthenticated"""
+    try:
+        user = await aauthenticate(request)
+    except exceptions.AuthenticationFailed as error:
+        return None, not_authenticated(error.detail)
+    if user is None:
+        return None, not_authenticated(exceptions.NotAuthenticated.default_detail)
+    return user, None
+
+
+@require_safe
+async def space_list(request):
+    catalogue = await aget_catalogue()
+    return conditional_json_response(request, catalogue['spaces'], catalogue['etag'], catalogue['last_modified'])
+
+
+@require_safe
+async def space_detail(request, pk):
+    catalogue = await aget_catalogue()
+    entry = catalogue['by_id'].get(pk)
+    if entry is None:
+        return json_response({'detail': exceptions.NotFound.default_detail}, status=404)
+    space, etag = entry
+    return conditional_json_response(request, space, etag, catalogue['last_modified'])
+
+
+@require_safe
+async def space_bookings(request, space_id):
+    if paginated(request):
+        return await space_bookings_paginated(request, space_id=space_id)
+    try:
+        date = parse_day(request.GET.get('date'))
+    except ValidationError as error:
+        return json_response(error.detail, status=400)
+
+    if not schedule.versioned():
+        data = await sync_to_async(day_schedule)(space_id, date)
+        return conditional_json_response(request, data, schedule.etag(space_id, date, schedule.content_version(data)))
+
+    version = await schedule.aget_version(space_id, date)
+    etag = schedule.etag(space_id, date, version)
+    data = None
+    if get_conditional_response(request, etag=etag) is None:
+        data = await schedule.aget_payload(space_id, date, version)
+        if data is None:
+            data = await sync_to_async(day_schedule)(space_id, date)
+            await schedule.aset_payload(space_id, date, version, data)
+    return conditional_json_response(request, data, etag)
+
+
+@require_safe
+async def user_bookings(request):
+    if paginated(request):
+        return await user_bookings_paginated(request)
+    user, error = await authenticated_user(request)
+    if error is not None:
+        return error
+    queryset = Booking.objects.filter(user_id=user.pk).order_by('start_time', 'id')
+    return json_response(await BOOKING_FLAT.arows(queryset))
+
+
+@require_safe
+async def me(request):
+    user, error = await authenticated_user(request)
+    if error is not None:
+        return error
+    return json_response(await ame_payload(user))
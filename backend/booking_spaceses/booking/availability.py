@@ -0,0 +1,113 @@
+"""
+Поиск свободных слотов по всем пространствам за диапазон дат.
+
+Все брони диапазона читаются одним запросом, отсортированными по
+(space_id, start_time), и обходятся за один проход: для каждого
+пространства и дня рабочие часы "вычитают" занятые интервалы, расширенные
+на минимальный промежуток между бронями. Вхождения серий разворачиваются
+только для запрошенного диапазона.
+"""
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .models import Booking, BOOKING_MIN_GAP, BOOKING_MAX_DURATION
+from .recurrence import occurrences_between
+
+
+def days_between(date_from, date_to):
+    """Даты от date_from до date_to включительно"""
+    day = date_from
+    while day <= date_to:
+        yield day
+        day += timedelta(days=1)
+
+
+def _work_window(space, day, now):
+    """Рабочие часы пространства в указанный день, без уже прошедшего времени"""
+    start = timezone.make_aware(datetime.combine(day, space.work_start))
+    end = timezone.make_aware(datetime.combine(day, space.work_end))
+    if now > start:
+        # Бронировать в прошлом нельзя: начинаем со следующей целой минуты
+        start = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    return start, end
+
+
+def _slot(start, end):
+    minutes = int((end - start).total_seconds() // 60)
+    return {
+        'start': timezone.localtime(start).isoformat(),
+        'end': timezone.localtime(end).isoformat(),
+        'duration': minutes,
+        'max_booking_duration': min(minutes, BOOKING_MAX_DURATION),
+    }
+
+
+def space_free_slots(space, intervals, date_from, date_to, min_duration, now):
+    """
+    Свободные слоты одного пространства по дням.
+
+    intervals - пары (start_time, end_time), отсортированные по start_time.
+    """
+    min_length = timedelta(minutes=min_duration)
+    gap = BOOKING_MIN_GAP
+    first = 0
+    days = []
+    for day in days_between(date_from, date_to):
+        window_start, window_end = _work_window(space, day, now)
+        slots = []
+        if window_start < window_end:
+            # Брони, закончившиеся до начала окна, не влияют и на следующие дни
+            while first < len(intervals) and intervals[first][1] + gap <= window_start:
+                first += 1
+            cursor = window_start
+            position = first
+            while position < len(intervals) and intervals[position][0] - gap < window_end:
+                busy_start = intervals[position][0] - gap
+                busy_end = intervals[position][1] + gap
+                if busy_start - cursor >= min_length:
+                    slots.append(_slot(cursor, busy_start))
+                cursor = max(cursor, busy_end)
+                position += 1
+            if window_end - cursor >= min_length:
+                slots.append(_slot(cursor, window_end))
+        days.append({'date': day.isoformat(), 'slots': slots})
+    return days
+
+
+def free_slots(spaces, date_from, date_to, min_duration, now=None):
+    """
+    Свободные слоты всех переданных пространств за даты [date_from, date_to].
+    """
+    now = now or timezone.now()
+    spaces = sorted(spaces, key=lambda space: space.pk)
+    range_start = timezone.make_aware(datetime.combine(date_from, datetime.min.time()))
+    range_end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+
+    rows = Booking.objects.filter(
+        space__in=[space.pk for space in spaces],
+        start_time__lt=range_end + BOOKING_MIN_GAP,
+        end_time__gt=range_start - BOOKING_MIN_GAP
+    ).order_by('space_id', 'start_time').values_list('space_id', 'start_time', 'end_time')
+
+    intervals_by_space = {space.pk: [] for space in spaces}
+    for space_id, start_time, end_time in rows:
+        intervals_by_space[space_id].append((start_time, end_time))
+    series_occurrences = occurrences_between(
+        list(intervals_by_space), range_start - BOOKING_MIN_GAP, range_end + BOOKING_MIN_GAP
+    )
+    for space_id, occurrences in series_occurrences.items():
+        if occurrences:
+            intervals_by_space[space_id] = sorted(
+                intervals_by_space[space_id] + [(item.start_time, item.end_time) for item in occurrences]
+            )
+
+    return [
+        {
+            'space': space.pk,
+            'days': space_free_slots(
+                space, intervals_by_space[space.pk], date_from, date_to, min_duration, now
+            ),
+        }
+        for space in spaces
+    ]
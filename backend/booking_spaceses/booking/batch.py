@@ -0,0 +1,224 @@
+"""
+Пакетное создание броней.
+
+Пакет проверяется целиком за фиксированное число запросов, которое не
+зависит от размера пакета:
+
+1. пространства пакета - один запрос;
+2. блокировка строк пространств (select_for_update) - один запрос;
+3. существующие брони в окрестности броней пакета - один запрос;
+4. серии пространств в окрестности пакета - один запрос (и второй
+   за исключениями серий, если серии нашлись);
+5. число будущих броней пользователя по пространствам - один запрос, и
+   его действующих серий (серия - одна активная бронь) - второй;
+6. вставка - один bulk_create.
+
+Пересечения с существующими бронями, вхождениями серий и между бронями
+пакета ищутся в памяти по индексу интервалов (booking/intervals.py),
+собранному из результатов запросов 3 и 4. Режим atomic создает все брони или ни одной,
+режим partial создает прошедшие проверку и возвращает ошибки остальных.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction, OperationalError
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .exceptions import BookingConflict
+from .intervals import SpaceIntervalIndex
+from .models import Space, Booking, BOOKING_MIN_GAP, BOOKING_MAX_DURATION, BOOKING_MAX_ACTIVE
+from .recurrence import active_series, series_between, expand
+from .serializers import (
+    BookingBatchItemSerializer,
+    PAST_ERROR,
+    OVERLAP_ERROR,
+    WORKING_HOURS_ERROR,
+    ACTIVE_LIMIT_ERROR,
+    DURATION_ERROR,
+)
+from .signals import bookings_bulk_created
+
+ATOMIC = 'atomic'
+PARTIAL = 'partial'
+
+
+class BatchResult:
+    """Созданные брони и ошибки по номерам элементов пакета"""
+
+    def __init__(self):
+        self.created = []
+        self.errors = {}
+
+    def reject(self, position, error):
+        self.errors[position] = error if isinstance(error, dict) else {'non_field_errors': [error]}
+
+    def error_list(self):
+        return [{'index': position, 'errors': self.errors[position]} for position in sorted(self.errors)]
+
+
+class BatchBookingCreator:
+    def __init__(self, user, items, mode=ATOMIC):
+        self.user = user
+        self.items = items
+        self.mode = mode
+        self.result = BatchResult()
+
+    def run(self):
+        candidates = self._validate_fields()
+        candidates = self._validate_rules(candidates)
+
+        attempts = settings.BOOKING_CREATE_ATTEMPTS
+        for attempt in range(1, attempts + 1):
+            try:
+                with transaction.atomic():
+                    # В режиме atomic расписание проверяется и при ошибках полей,
+                    # чтобы вернуть клиенту все ошибки пакета сразу
+                    accepted = self._validate_schedule(candidates)
+                    if self.mode == ATOMIC and self.result.errors:
+                        return self.result
+                    self.result.created = self._insert(accepted)
+                    return self.result
+            except OperationalError:
+                # Взаимная блокировка или таймаут ожидания блокировки
+                if attempt == attempts:
+                    raise BookingConflict("Spaces are busy, please retry the batch.")
+                # Ошибки расписания прошлой попытки перепроверяются заново
+                for position, _ in candidates:
+                    self.result.errors.pop(position, None)
+                time.sleep(0.05 * attempt)
+
+    def _validate_fields(self):
+        """Проверка полей каждого элемента без обращения к базе"""
+        candidates = []
+        for position, item in enumerate(self.items):
+            serializer = BookingBatchItemSerializer(data=item)
+            if serializer.is_valid():
+                data = serializer.validated_data
+                data['end_time'] = data['start_time'] + timedelta(minutes=data['duration'])
+                candidates.append((position, data))
+            else:
+                self.result.reject(position, serializer.errors)
+        return candidates
+
+    def _validate_rules(self, candidates):
+        """Правила, не зависящие от других броней: прошлое, рабочие часы, длительность"""
+        space_ids = {data['space'] for _, data in candidates}
+        self.spaces = Space.objects.only('id', 'work_start', 'work_end').in_bulk(space_ids)
+        now = timezone.now()
+        valid = []
+        for position, data in candidates:
+            space = self.spaces.get(data['space'])
+            if space is None:
+                self.result.reject(position, {'space': [f"Space {data['space']} does not exist."]})
+                continue
+            if data['start_time'] < now:
+                self.result.reject(position, PAST_ERROR)
+                continue
+            if not self.user.is_superuser:
+                work_start, work_end = space.work_start, space.work_end
+                start, end = data['start_time'].time(), data['end_time'].time()
+                if not (work_start <= start < work_end and work_start < end <= work_end):
+                    self.result.reject(
+                        position, WORKING_HOURS_ERROR.format(work_start=work_start, work_end=work_end)
+                    )
+                    continue
+                if data['duration'] > BOOKING_MAX_DURATION:
+                    self.result.reject(position, DURATION_ERROR)
+                    continue
+            valid.append((position, data))
+        return valid
+
+    def _validate_schedule(self, candidates):
+        """
+        Пересечения и лимит активных броней под блокировкой пространств.
+        Брони пакета проверяются по порядку, принятые сразу попадают в
+        индекс и участвуют в проверке следующих.
+        """
+        if not candidates:
+            return []
+        space_ids = sorted({data['space'] for _, data in candidates})
+        # Единый порядок блокировки исключает взаимоблокировку с другими пакетами
+        list(Space.objects.select_for_update().filter(pk__in=space_ids).order_by('pk').values_list('pk', flat=True))
+
+        windows = {}
+        for _, data in candidates:
+            start, end = windows.get(data['space'], (data['start_time'], data['end_time']))
+            windows[data['space']] = (min(start, data['start_time']), max(end, data['end_time']))
+        neighbourhood = Q()
+        for space_id, (start, end) in windows.items():
+            neighbourhood |= Q(
+                space_id=space_id,
+                start_time__lt=end + BOOKING_MIN_GAP,
+                end_time__gt=start - BOOKING_MIN_GAP
+            )
+        existing = Booking.objects.filter(neighbourhood).only('id', 'space_id', 'start_time', 'end_time')
+        indexes = {
+            space_id: SpaceIntervalIndex(space_id, start - BOOKING_MIN_GAP)
+            for space_id, (start, end) in windows.items()
+        }
+        for booking in existing:
+            indexes[booking.space_id].add(booking)
+        earliest = min(start for start, _ in windows.values())
+        latest = max(end for _, end in windows.values())
+        # Вхождения серий получают отрицательные ключи после ключей броней пакета
+        key = -len(self.items)
+        for series in series_between(space_ids, earliest - BOOKING_MIN_GAP, latest + BOOKING_MIN_GAP):
+            start, end = windows[series.space_id]
+            for occurrence in expand(series, start - BOOKING_MIN_GAP, end + BOOKING_MIN_GAP):
+                key -= 1
+                occurrence.pk = key
+                indexes[series.space_id].add(occurrence)
+
+        active = {}
+        if not self.user.is_superuser:
+            active = dict(
+                Booking.objects.filter(
+                    user=self.user,
+                    space_id__in=space_ids,
+                    start_time__gt=timezone.now()
+                ).order_by().values('space_id').annotate(total=Count('id')).values_list('space_id', 'total')
+            )
+            for space_id, total in active_series(self.user, space_ids).items():
+                active[space_id] = active.get(space_id, 0) + total
+
+        accepted = []
+        for position, data in candidates:
+            space_id = data['space']
+            index = indexes[space_id]
+            if index.overlapping(data['start_time'] - BOOKING_MIN_GAP, data['end_time'] + BOOKING_MIN_GAP):
+                self.result.reject(position, OVERLAP_ERROR)
+                continue
+            if not self.user.is_superuser and active.get(space_id, 0) >= BOOKING_MAX_ACTIVE:
+                self.result.reject(position, ACTIVE_LIMIT_ERROR)
+                continue
+            active[space_id] = active.get(space_id, 0) + 1
+            # Отрицательный id - еще не сохраненная бронь пакета
+            index.add(Booking(
+                id=-position - 1, space_id=space_id, start_time=data['start_time'], end_time=data['end_time']
+            ))
+            accepted.append(data)
+        return accepted
+
+    def _insert(self, accepted):
+        bookings = [
+            Booking(
+                user=self.user,
+                space_id=data['space'],
+                start_time=data['start_time'],
+                duration=data['duration'],
+                end_time=data['end_time'],
+                description=data['description'],
+            )
+            for data in accepted
+        ]
+        if bookings:
+            Booking.objects.bulk_create(bookings)
+            bookings_bulk_created.send(sender=Booking, bookings=bookings)
+        return bookings
+
+
+def create_batch(user, items, mode=ATOMIC):
+    """Создает брони пакета; возвращает BatchResult"""
+    return BatchBookingCreator(user, items, mode).run()
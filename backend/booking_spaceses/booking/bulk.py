@@ -0,0 +1,121 @@
+"""
+Массовые операции с бронями для админки: отмена и перенос в другое пространство.
+
+Операция выполняется запросами над набором броней, а не по одной брони:
+
+1. отмена - порции id набора по возрастанию читаются values_list() под
+   блокировкой строк и удаляются одним DELETE (Booking.delete_ids, без
+   объектов модели и post_delete на каждую бронь), так что "выбрать все"
+   не держит в памяти весь набор;
+2. перенос - брони набора читаются одним запросом под блокировкой
+   (select_for_update), блокируются целевое пространство, брони и серии
+   пространства в окрестности набора (как при пакетном создании,
+   booking/batch.py), пересечения проверяются в памяти по индексу
+   интервалов, затем UPDATE по порциям id.
+
+Вместо post_save и post_delete на каждую бронь отправляются сигналы
+bookings_bulk_deleted (на каждую порцию) и bookings_bulk_moved: версии
+расписания и лент, сводки использования и push-канал обновляются по
+порции или набору сразу (booking/signals.py).
+"""
+from collections import namedtuple
+
+from django.db import transaction
+
+from .intervals import SpaceIntervalIndex
+from .models import Space, Booking, BOOKING_MIN_GAP
+from .recurrence import series_between, expand
+from .signals import bookings_bulk_deleted, bookings_bulk_moved
+
+# id броней в одном DELETE или UPDATE
+BULK_BATCH_SIZE = 1000
+
+# Удаленная бронь в сигнале bookings_bulk_deleted: id, день расписания
+# и лента - по пространству, пользователю и началу, сводки - по интервалу
+DeletedBooking = namedtuple('DeletedBooking', 'pk space_id user_id start_time end_time')
+
+
+def locked_bookings(queryset):
+    """Брони набора под блокировкой строк, без присоединенных таблиц"""
+    return list(queryset.select_related(None).select_for_update().order_by('start_time', 'id'))
+
+
+def id_batches(bookings):
+    ids = [booking.pk for booking in bookings]
+    for start in range(0, len(ids), BULK_BATCH_SIZE):
+        yield ids[start:start + BULK_BATCH_SIZE]
+
+
+def cancel_bookings(queryset):
+    """Удаляет брони набора порциями по id; возвращает число удаленных броней"""
+    rows = queryset.select_related(None).order_by('pk').values_list(*DeletedBooking._fields)
+    cancelled, last_pk = 0, 0
+    with transaction.atomic():
+        while True:
+            batch = [
+                DeletedBooking(*row)
+                for row in rows.filter(pk__gt=last_pk).select_for_update()[:BULK_BATCH_SIZE]
+            ]
+            if not batch:
+                break
+            cancelled += Booking.delete_ids([booking.pk for booking in batch], using=queryset.db)
+            last_pk = batch[-1].pk
+            bookings_bulk_deleted.send(sender=Booking, bookings=batch)
+    return cancelled
+
+
+def move_conflicts(space, bookings):
+    """
+    id броней, которые нельзя перенести в пространство space: пересечения с
+    его бронями, вхождениями серий и с переносимыми бронями, принятыми раньше
+    """
+    start = bookings[0].start_time
+    end = max(booking.end_time for booking in bookings)
+    index = SpaceIntervalIndex(space.pk, start - BOOKING_MIN_GAP)
+    existing = Booking.objects.filter(
+        space=space,
+        start_time__lt=end + BOOKING_MIN_GAP,
+        end_time__gt=start - BOOKING_MIN_GAP
+    ).only('id', 'space_id', 'start_time', 'end_time')
+    for booking in existing:
+        index.add(booking)
+    # Вхождения серий получают отрицательные ключи
+    key = 0
+    for series in series_between([space.pk], start - BOOKING_MIN_GAP, end + BOOKING_MIN_GAP):
+        for occurrence in expand(series, start - BOOKING_MIN_GAP, end + BOOKING_MIN_GAP):
+            key -= 1
+            occurrence.pk = key
+            index.add(occurrence)
+
+    conflicts = []
+    for booking in bookings:
+        if index.overlapping(booking.start_time - BOOKING_MIN_GAP, booking.end_time + BOOKING_MIN_GAP):
+            conflicts.append(booking.pk)
+            continue
+        index.add(Booking(id=booking.pk, space_id=space.pk, start_time=booking.start_time, end_time=booking.end_time))
+    return conflicts
+
+
+def move_bookings(queryset, space):
+    """
+    Переносит брони набора в пространство space целиком или не переносит ни
+    одной. Возвращает (перенесенные брони, id конфликтующих броней).
+    Рабочие часы и лимит активных броней не проверяются, как для броней
+    суперпользователя
+    """
+    with transaction.atomic():
+        list(Space.objects.select_for_update().filter(pk=space.pk).values_list('pk', flat=True))
+        bookings = [booking for booking in locked_bookings(queryset) if booking.space_id != space.pk]
+        if not bookings:
+            return [], []
+        conflicts = move_conflicts(space, bookings)
+        if conflicts:
+            return [], conflicts
+
+        previous = {booking.pk: booking.space_id for booking in bookings}
+        for ids in id_batches(bookings):
+            Booking.objects.filter(pk__in=ids).update(space=space)
+        for booking in bookings:
+            booking.space = space
+        bookings_bulk_moved.send(sender=Booking, bookings=bookings, previous=previous)
+    return bookings, []
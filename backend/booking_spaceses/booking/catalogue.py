@@ -0,0 +1,79 @@
+"""
+Кеш каталога пространств.
+
+Сериализованный список пространств хранится в кеше Django вместе с ETag
+(хеш содержимого) и временем последнего изменения. Кеш сбрасывается
+сигналами post_save/post_delete модели Space, поэтому списку и карточке
+пространства не нужно обращаться к базе, пока пространства не меняются.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from booking_spaceses.metrics import cache_lookup
+
+CATALOGUE_KEY = 'booking:spaces:catalogue'
+CHANGED_AT_KEY = 'booking:spaces:changed-at'
+
+
+def _etag(data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode('utf-8')
+    return '"%s"' % hashlib.md5(payload).hexdigest()
+
+
+def _spaces():
+    from .models import Space
+
+    return Space.objects.order_by('id')
+
+
+def _catalogue(spaces, last_modified):
+    return {
+        'spaces': spaces,
+        'etag': _etag(spaces),
+        'by_id': {space['id']: (space, _etag(space)) for space in spaces},
+        'last_modified': last_modified,
+    }
+
+
+def _build():
+    from .flat import SPACE_FLAT
+
+    # Форма ответа SpaceSerializer, но без создания объектов модели.
+    # Время изменения общее для всех процессов, если кеш общий
+    return _catalogue(
+        SPACE_FLAT.rows(_spaces()), cache.get_or_set(CHANGED_AT_KEY, int(time.time()), None)
+    )
+
+
+def get_catalogue():
+    """Каталог из кеша; при промахе строится одним запросом к базе"""
+    catalogue = cache_lookup('catalogue', cache.get(CATALOGUE_KEY))
+    if catalogue is None:
+        catalogue = _build()
+        # Время жизни ограничивает устаревание при кеше в памяти процесса:
+        # сигнал сбрасывает кеш только в том процессе, где изменили пространство
+        cache.set(CATALOGUE_KEY, catalogue, settings.BOOKING_CATALOGUE_CACHE_TTL)
+    return catalogue
+
+
+async def aget_catalogue():
+    """get_catalogue() для асинхронных представлений"""
+    from .flat import SPACE_FLAT
+
+    catalogue = cache_lookup('catalogue', await cache.aget(CATALOGUE_KEY))
+    if catalogue is None:
+        catalogue = _catalogue(
+            await SPACE_FLAT.arows(_spaces()), await cache.aget_or_set(CHANGED_AT_KEY, int(time.time()), None)
+        )
+        await cache.aset(CATALOGUE_KEY, catalogue, settings.BOOKING_CATALOGUE_CACHE_TTL)
+    return catalogue
+
+
+def invalidate_catalogue():
+    cache.set(CHANGED_AT_KEY, int(time.time()), None)
+    cache.delete(CATALOGUE_KEY)
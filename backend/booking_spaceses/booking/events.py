@@ -0,0 +1,216 @@
+"""
+События расписания для push-канала (Server-Sent Events, booking/streams.py).
+
+Сигналы броней и серий после фиксации транзакции публикуют событие
+через брокер. Событие относится к пространству и набору дней:
+
+    {"type": "booking.created", "space": 1, "dates": ["2024-01-15"], "booking": {...}}
+
+Подписчик слушает пространство целиком или один его день. Брокер задается
+настройкой BOOKING_EVENT_BROKER:
+
+- InProcessBroker (по умолчанию) - раздача подписчикам своего процесса;
+  подходит, когда API обслуживает один ASGI-процесс;
+- PostgresBroker - события идут через LISTEN/NOTIFY PostgreSQL и доходят
+  до подписчиков всех процессов и серверов.
+
+Другой общий брокер (например, Redis) - подкласс InProcessBroker, который
+в publish() отправляет событие в общую шину, а полученные из нее события
+передает в dispatch().
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Очередь подписчика переполнена: клиент должен перечитать расписание
+OVERFLOW = object()
+# Событие "перечитайте расписание пространства": доходит до всех подписчиков
+# пространства, в том числе подписанных на отдельные дни
+RESET = 'reset'
+
+
+class Subscription:
+    """Очередь событий одного клиента в цикле событий его соединения"""
+
+    def __init__(self, broker, key, max_size):
+        self.broker = broker
+        self.key = key
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Вызывается в потоке цикла событий подписчика
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Медленный клиент не должен копить события без предела
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self, timeout):
+        """Следующее событие или None, если за timeout секунд событий не было"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, space_id, day=None):
+        """Подписка на пространство или на один день; вызывается внутри цикла событий"""
+        key = (space_id, day.isoformat() if day is not None else None)
+        subscription = Subscription(self, key, settings.BOOKING_EVENTS_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[subscription.key].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.key]
+
+    def publish(self, event):
+        self.dispatch(event)
+
+    def dispatch(self, event):
+        """Раздает событие подписчикам пространства и подписчикам его дней"""
+        keys = [(event['space'], None)] + [(event['space'], day) for day in event['dates']]
+        with self._lock:
+            if event['type'] == RESET:
+                keys = [key for key in self._subscribers if key[0] == event['space']]
+            targets = [
+                subscription for key in keys for subscription in self._subscribers.get(key, ())
+            ]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Цикл событий уже закрыт - соединение завершилось
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Брокер через LISTEN/NOTIFY: publish() отправляет NOTIFY, а поток-слушатель
+    процесса получает события всех процессов (и свои) и раздает их подписчикам.
+    Поток стартует при первой подписке, поэтому процессы без подписчиков
+    (воркеры очистки, команды) только публикуют.
+    """
+    channel = 'booking_events'
+    # pg_notify принимает строку короче 8000 байт
+    max_payload = 7999
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, event):
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, self.encode(event)])
+
+    def encode(self, event):
+        """
+        Событие для NOTIFY. Не помещается - отправляются только id брони
+        или серии (клиент дочитает ее расписанием), а если и так много дней -
+        событие RESET пространства
+        """
+        payload = json.dumps(event, cls=DjangoJSONEncoder)
+        if len(payload.encode()) <= self.max_payload:
+            return payload
+        slim = {
+            key: {'id': value['id']} if isinstance(value, dict) and 'id' in value else value
+            for key, value in event.items()
+        }
+        payload = json.dumps(slim, cls=DjangoJSONEncoder)
+        if len(payload.encode()) <= self.max_payload:
+            return payload
+        logger.warning('Booking event %s is too large for NOTIFY, sending reset', event['type'])
+        return json.dumps({'type': RESET, 'space': event['space'], 'dates': []})
+
+    def subscribe(self, space_id, day=None):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='booking-events', daemon=True)
+                self._listener.start()
+        return super().subscribe(space_id, day)
+
+    def _listen(self):
+        from django.db import connections
+
+        while True:
+            # Отдельное соединение: соединения Django привязаны к потокам запросов
+            listener = connections.create_connection('default')
+            try:
+                listener.ensure_connection()
+                listener.set_autocommit(True)
+                raw = listener.connection
+                with raw.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                while True:
+                    if select.select([raw], [], [], 5) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        notify = raw.notifies.pop(0)
+                        self.dispatch(json.loads(notify.payload))
+            except Exception:
+                logger.exception('Booking event listener failed, reconnecting')
+            finally:
+                listener.close()
+            threading.Event().wait(1)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.BOOKING_EVENT_BROKER)()
+    return _broker
+
+
+def publish(event_type, space_id, dates, **payload):
+    """Публикует событие; ошибки брокера не должны ломать запись брони"""
+    event = {
+        'type': event_type,
+        'space': space_id,
+        'dates': sorted({day.isoformat() for day in dates}),
+        **payload,
+    }
+    try:
+        get_broker().publish(event)
+    except Exception:
+        logger.exception('Could not publish booking event %s', event_type)
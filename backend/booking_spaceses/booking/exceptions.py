@@ -0,0 +1,9 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class BookingConflict(APIException):
+    """Слот занят параллельным запросом, который успел создать бронь раньше"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Time slot has just been booked by another request."
+    default_code = 'booking_conflict'
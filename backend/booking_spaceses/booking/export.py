@@ -0,0 +1,241 @@
+"""
+Выгрузка броней потоком: CSV и iCalendar (RFC 5545).
+
+Брони читаются QuerySet.iterator(chunk_size) вместе с пользователем и
+пространством (select_related) и отдаются StreamingHttpResponse порциями по
+BOOKING_EXPORT_CHUNK_SIZE броней: память не растет с числом броней, и
+выгрузка за год идет так же, как за день. Вхождения серий разворачиваются
+на окно выгрузки (export_series) и вливаются в поток броней по времени начала. Под ASGI порции читаются в потоке
+запроса (aiterate), иначе Django собрал бы весь ответ в памяти.
+
+Календарные ленты (booking/feeds.py) - ICS пространства и пользователя.
+Календари опрашивают ленты каждые несколько минут, поэтому у каждой ленты
+есть версия в кеше, как у расписания дня (booking/schedule.py): сигналы
+броней и серий меняют версии пространства и пользователя, и пока версия та же,
+лента отвечает 304 без чтения броней (лента пользователя - одним запросом
+проверки токена).
+"""
+import csv
+import hashlib
+import heapq
+import uuid
+from datetime import timedelta, timezone as dt_timezone
+from itertools import islice
+from operator import attrgetter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from booking_spaceses.metrics import cache_lookup
+
+FEED_VERSION_KEY = 'booking:feed:version:{kind}:{pk}'
+SPACE_FEED = 'space'
+USER_FEED = 'user'
+
+CSV_HEADER = [
+    'id', 'space_id', 'space', 'user_id', 'username', 'start_time', 'end_time', 'duration', 'description', 'series_id'
+]
+# Ячейки, которые табличные редакторы считают формулами
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def export_queryset(bookings):
+    return bookings.select_related('user', 'space').order_by('start_time', 'id')
+
+
+def export_series(series, start=None, end=None):
+    """
+    Вхождения серий запроса в [start, end) с пользователем и пространством
+    серии; без границ - все вхождения. Серий у пользователя немного
+    (BOOKING_MAX_ACTIVE на пространство), поэтому вхождения собираются в список
+    """
+    from .recurrence import series_occurrences
+
+    if start is not None:
+        series = series.filter(until__gte=timezone.localtime(start).date() - timedelta(days=1))
+    if end is not None:
+        series = series.filter(start_time__lt=end)
+    series = series.select_related('user', 'space').prefetch_related('exceptions')
+    return series_occurrences(series, start, end)
+
+
+def chunked(queryset, render, chunk_size=None, occurrences=()):
+    """
+    Строки render(бронь), склеенные порциями по chunk_size броней;
+    вхождения серий вливаются в поток броней по времени начала
+    """
+    chunk_size = chunk_size or settings.BOOKING_EXPORT_CHUNK_SIZE
+    items = queryset.iterator(chunk_size=chunk_size)
+    if occurrences:
+        items = heapq.merge(items, occurrences, key=attrgetter('start_time'))
+    lines = []
+    for booking in items:
+        lines.append(render(booking))
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+async def aiterate(chunks):
+    """Асинхронный итератор по синхронному: каждая порция читается в потоке запроса"""
+    chunks = iter(chunks)
+    next_chunks = sync_to_async(lambda: list(islice(chunks, 1)))
+    while True:
+        parts = await next_chunks()
+        if not parts:
+            return
+        yield parts[0]
+
+
+class Echo:
+    """Файл для csv.writer, который возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    value = '' if value is None else str(value)
+    if value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(queryset, chunk_size=None, occurrences=()):
+    writer = csv.writer(Echo())
+    # Часовой пояс один на всю выгрузку, а не поиск текущего на каждую бронь
+    tz = timezone.get_current_timezone()
+
+    def render(booking):
+        return writer.writerow([csv_cell(value) for value in (
+            booking.pk, booking.space_id, booking.space.name, booking.user_id, booking.user.username,
+            booking.start_time.astimezone(tz).isoformat(), booking.end_time.astimezone(tz).isoformat(),
+            booking.duration, booking.description, getattr(booking, 'series_id', None),
+        )])
+
+    yield writer.writerow(CSV_HEADER)
+    yield from chunked(queryset, render, chunk_size, occurrences)
+
+
+def ics_escape(text):
+    return (
+        text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+    )
+
+
+def ics_line(line):
+    """Строка ICS с переносом длиннее 75 байт (продолжение начинается с пробела)"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, current, size = [], '', 0
+    for char in line:
+        length = len(char.encode('utf-8'))
+        # Первая строка - 75 байт, продолжения - 74 байта и пробел
+        if size + length > (75 if not parts else 74):
+            parts.append(current)
+            current, size = '', 0
+        current += char
+        size += length
+    parts.append(current)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def ics_time(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def event_uid(booking):
+    """UID события: у вхождения серии - номер серии и день вхождения"""
+    if booking.pk is None:
+        return f'series-{booking.series_id}-{timezone.localtime(booking.start_time):%Y%m%d}'
+    return f'booking-{booking.pk}'
+
+
+def ics_chunks(queryset, name, summary, host, chunk_size=None, occurrences=()):
+    """
+    Календарь VCALENDAR. summary(бронь) - заголовок события; для ленты
+    пространства в нем нет имени пользователя, как и в расписании
+    """
+    stamp = ics_time(timezone.now())
+
+    def render(booking):
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:{event_uid(booking)}@{host}',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{ics_time(booking.start_time)}',
+            f'DTEND:{ics_time(booking.end_time)}',
+            f'SUMMARY:{ics_escape(summary(booking))}',
+            f'LOCATION:{ics_escape(booking.space.name)}',
+        ]
+        if booking.description:
+            lines.append(f'DESCRIPTION:{ics_escape(booking.description)}')
+        lines.append('END:VEVENT')
+        return ''.join(ics_line(line) for line in lines)
+
+    yield ''.join(ics_line(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Booking Spaces//Bookings//RU',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{ics_escape(name)}',
+    ])
+    yield from chunked(queryset, render, chunk_size, occurrences)
+    yield ics_line('END:VCALENDAR')
+
+
+def feed_window_start():
+    """Начало окна ленты: прошлые брони за BOOKING_FEED_PAST_DAYS дней"""
+    return timezone.now() - timedelta(days=settings.BOOKING_FEED_PAST_DAYS)
+
+
+def feed_version(kind, pk):
+    key = FEED_VERSION_KEY.format(kind=kind, pk=pk)
+    version = cache_lookup('feed', cache.get(key))
+    if version is None:
+        version = cache.get_or_set(key, uuid.uuid4().hex, settings.BOOKING_FEED_CACHE_TTL)
+    return version
+
+
+def feed_etag(kind, pk, version):
+    # День в ETag: окно ленты сдвигается раз в сутки
+    payload = f'{kind}:{pk}:{version}:{timezone.localdate().isoformat()}'
+    return '"%s"' % hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def bump_feeds(pairs):
+    """Сбрасывает версии лент для набора пар (вид ленты, id)"""
+    cache.delete_many([FEED_VERSION_KEY.format(kind=kind, pk=pk) for kind, pk in pairs])
+
+
+def series_feeds(series):
+    return {(SPACE_FEED, series.space_id), (USER_FEED, series.user_id)}
+
+
+def booking_feeds(bookings):
+    pairs = set()
+    for booking in bookings:
+        pairs.add((SPACE_FEED, booking.space_id))
+        pairs.add((USER_FEED, booking.user_id))
+    return pairs
+
+
+def user_feed_token(user):
+    """Секрет адреса ленты пользователя (FeedToken); создается при первом запросе"""
+    from .models import FeedToken
+
+    return FeedToken.for_user(user).key
+
+
+def user_from_feed_token(token):
+    """id активного пользователя по секрету ленты или None"""
+    from .models import FeedToken
+
+    return FeedToken.objects.filter(key=token, user__is_active=True).values_list('user_id', flat=True).first()
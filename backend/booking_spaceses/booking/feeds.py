@@ -0,0 +1,103 @@
+"""
+Календарные ленты броней в формате iCalendar для подписки из календарей.
+
+GET /api/feeds/spaces/<id>.ics - брони пространства (без имен пользователей);
+GET /api/feeds/users/<токен>.ics - брони пользователя. Календари не умеют
+передавать заголовок Authorization, поэтому ленту пользователя открывает
+случайный токен в адресе (FeedToken); адрес своей ленты - GET /api/feeds/,
+новый адрес взамен прежнего - POST /api/feeds/regenerate/.
+
+Лента содержит брони и вхождения серий, закончившиеся не раньше
+BOOKING_FEED_PAST_DAYS дней назад, и все будущие. Пока версия ленты не менялась (booking/export.py),
+повторный запрос с If-None-Match получает 304 без чтения броней.
+"""
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .export import (
+    SPACE_FEED, USER_FEED, aiterate, export_queryset, export_series, feed_etag, feed_version, feed_window_start,
+    ics_chunks, user_feed_token, user_from_feed_token,
+)
+from .models import Booking, BookingSeries, FeedToken, Space
+
+ICS_CONTENT_TYPE = 'text/calendar; charset=utf-8'
+
+
+def streaming_response(request, chunks, content_type, filename=None):
+    if isinstance(request, ASGIRequest):
+        chunks = aiterate(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def feed_response(request, kind, pk, build):
+    """Лента с ETag: при совпадении версии - 304, иначе build() строит календарь"""
+    etag = feed_etag(kind, pk, feed_version(kind, pk))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        name, bookings, series, summary = build()
+        chunks = ics_chunks(
+            export_queryset(bookings), name, summary, request.get_host(),
+            occurrences=export_series(series, start=feed_window_start())
+        )
+        response = streaming_response(request, chunks, ICS_CONTENT_TYPE)
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_safe
+def space_feed(request, space_id):
+    def build():
+        space = get_object_or_404(Space.objects.only('id', 'name'), pk=space_id)
+        bookings = Booking.objects.filter(space_id=space.pk, end_time__gte=feed_window_start())
+        series = BookingSeries.objects.filter(space_id=space.pk)
+        return space.name, bookings, series, lambda booking: booking.description or booking.space.name
+
+    return feed_response(request, SPACE_FEED, space_id, build)
+
+
+@require_safe
+def user_feed(request, token):
+    user_id = user_from_feed_token(token)
+    if user_id is None:
+        raise Http404
+
+    def build():
+        user = get_object_or_404(get_user_model().objects.only('id', 'username'), pk=user_id, is_active=True)
+        bookings = Booking.objects.filter(user_id=user.pk, end_time__gte=feed_window_start())
+        series = BookingSeries.objects.filter(user_id=user.pk)
+        return user.username, bookings, series, lambda booking: booking.space.name
+
+    return feed_response(request, USER_FEED, user_id, build)
+
+
+def feed_links(request, token):
+    path = reverse('user-feed', kwargs={'token': token})
+    return Response({'user': request.build_absolute_uri(path)})
+
+
+class FeedLinksView(APIView):
+    """Адреса календарных лент текущего пользователя"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return feed_links(request, user_feed_token(request.user))
+
+
+class FeedTokenRegenerateView(APIView):
+    """Новый адрес ленты пользователя; прежний адрес перестает работать"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        return feed_links(request, FeedToken.regenerate(request.user).key)
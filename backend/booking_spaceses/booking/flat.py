@@ -0,0 +1,129 @@
+"""
+Плоские сериализаторы только для чтения.
+
+ModelSerializer на каждую строку списка создает объект модели и вызывает
+to_representation каждого поля. Для больших списков броней и пространств
+это основная часть времени ответа. FlatSerializer описывает форму ответа
+один раз: имена полей, источники и преобразования. Строки читаются через
+QuerySet.values_list() без создания моделей и превращаются в словари
+одним проходом. Объекты (страницы списков, вхождения серий) сериализуются
+тем же описанием через operator.attrgetter.
+
+Формат значений совпадает с полями DRF: даты-время - ISO 8601 в текущем
+часовом поясе с "Z" вместо "+00:00", время - ISO 8601, файлы - имя файла
+или URL при UPLOADED_FILES_USE_URL (без request в контексте, как в кеше
+каталога).
+"""
+from operator import attrgetter
+
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .images import variant_urls
+
+
+def iso_datetime():
+    """Как serializers.DateTimeField.to_representation"""
+    # Текущий часовой пояс читается один раз на список, а не на каждое значение
+    tz = timezone.get_current_timezone()
+
+    def convert(value):
+        if value is None:
+            return None
+        value = value.astimezone(tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def iso_time():
+    """Как serializers.TimeField.to_representation"""
+    return lambda value: value.isoformat() if value is not None else None
+
+
+def file_name():
+    """Как serializers.FileField без request в контексте сериализатора"""
+    from rest_framework.settings import api_settings
+
+    use_url = api_settings.UPLOADED_FILES_USE_URL
+
+    def convert(value):
+        name = getattr(value, 'name', value) or None
+        return default_storage.url(name) if use_url and name else name
+    return convert
+
+
+class FlatSerializer:
+    """
+    Форма ответа: пары (имя поля в ответе, источник) или тройки
+    (имя, источник, фабрика преобразования). Источник - имя атрибута
+    объекта или поля для values_list(). Фабрика вызывается один раз
+    на сериализуемый список и возвращает функцию преобразования значения.
+    """
+
+    def __init__(self, *fields):
+        self.names = tuple(field[0] for field in fields)
+        self.sources = tuple(field[1] for field in fields)
+        self.factories = tuple(
+            (position, field[2]) for position, field in enumerate(fields) if len(field) > 2
+        )
+        self._getter = attrgetter(*self.sources)
+
+    def _converter(self):
+        """Функция "кортеж значений -> словарь ответа" для одного списка"""
+        names = self.names
+        converters = [(position, factory()) for position, factory in self.factories]
+
+        def convert(values):
+            values = list(values)
+            for position, convert_value in converters:
+                values[position] = convert_value(values[position])
+            return dict(zip(names, values))
+        return convert
+
+    def rows(self, queryset):
+        """Словари ответа по queryset без создания объектов модели"""
+        convert = self._converter()
+        return [convert(values) for values in queryset.values_list(*self.sources)]
+
+    async def arows(self, queryset):
+        """rows() через асинхронный ORM"""
+        convert = self._converter()
+        return [convert(values) async for values in queryset.values_list(*self.sources)]
+
+    def objects(self, objects):
+        getter, convert = self._getter, self._converter()
+        return [convert(getter(obj)) for obj in objects]
+
+    def bound(self):
+        """Функция "объект -> словарь ответа" для объектов вперемешку с другими"""
+        getter, convert = self._getter, self._converter()
+        return lambda obj: convert(getter(obj))
+
+
+# Формы ответов BookingSerializer, OccurrenceSerializer и SpaceSerializer
+BOOKING_FLAT = FlatSerializer(
+    ('id', 'id'),
+    ('space', 'space_id'),
+    ('start_time', 'start_time', iso_datetime),
+    ('duration', 'duration'),
+    ('description', 'description'),
+)
+OCCURRENCE_FLAT = FlatSerializer(
+    ('id', 'pk'),
+    ('series', 'series_id'),
+    ('space', 'space_id'),
+    ('start_time', 'start_time', iso_datetime),
+    ('duration', 'duration'),
+    ('description', 'description'),
+)
+SPACE_FLAT = FlatSerializer(
+    ('id', 'id'),
+    ('name', 'name'),
+    ('description', 'description'),
+    ('image', 'image', file_name),
+    ('images', 'image_variants', variant_urls),
+    ('work_start', 'work_start', iso_time),
+    ('work_end', 'work_end', iso_time),
+)
@@ -0,0 +1,151 @@
+"""
+Производные изображения пространств.
+
+Для загруженной фотографии пространства строятся уменьшенные копии
+ширины из SPACE_IMAGE_SIZES в форматах WebP и JPEG. Файлы кладутся рядом
+с оригиналом: ``spaces/variants/<имя>-<размер>.<формат>``. Имена и размеры
+копий хранятся в Space.image_variants, а сериализаторы отдают их картой
+"размер -> ширина, высота и ссылки по форматам".
+
+Копии строятся не в потоке запроса: после фиксации транзакции сохранение
+пространства ставит задачу в пул фоновых потоков процесса (настройка
+SPACE_IMAGE_VARIANTS, в тестах выключена). Для уже загруженных изображений
+и без фоновой обработки - команда ``python manage.py generate_space_images``.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'spaces/variants'
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(image_name, size, extension):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{VARIANTS_DIR}/{stem}-{size}.{extension}'
+
+
+def variant_urls():
+    """
+    Преобразование Space.image_variants в ответ API. Ссылки - как у поля
+    image: имя файла или URL при UPLOADED_FILES_USE_URL
+    """
+    from rest_framework.settings import api_settings
+
+    use_url = api_settings.UPLOADED_FILES_USE_URL
+
+    def convert(variants):
+        return {
+            size: {
+                'width': variant['width'],
+                'height': variant['height'],
+                **{
+                    extension: default_storage.url(name) if use_url else name
+                    for extension, name in variant['files'].items()
+                },
+            }
+            # От меньшей копии к большей: JSONB не сохраняет порядок ключей
+            for size, variant in sorted((variants or {}).items(), key=lambda item: item[1]['width'])
+        }
+    return convert
+
+
+def render_variants(image_name, storage=default_storage):
+    """Строит и сохраняет копии изображения; возвращает значение для Space.image_variants"""
+    from PIL import Image, ImageOps
+
+    with storage.open(image_name, 'rb') as source:
+        original = Image.open(source)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+    variants = {}
+    for size, width in sorted(settings.SPACE_IMAGE_SIZES.items(), key=lambda item: item[1]):
+        # Копии крупнее оригинала не нужны: вместо них - оригинальный размер
+        width = min(width, original.width)
+        height = max(1, round(original.height * width / original.width))
+        resized = original if width == original.width else original.resize((width, height), Image.LANCZOS)
+        files = {}
+        for extension, (image_format, options) in FORMATS.items():
+            image = resized.convert('RGB') if image_format == 'JPEG' else resized
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, **options)
+            name = variant_name(image_name, size, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            files[extension] = storage.save(name, ContentFile(buffer.getvalue()))
+        variants[size] = {'width': width, 'height': height, 'files': files}
+    return variants
+
+
+def delete_variants(variants, storage=default_storage):
+    for variant in (variants or {}).values():
+        for name in variant['files'].values():
+            storage.delete(name)
+
+
+def generate_space_variants(space_id, image_name=None):
+    """
+    Строит копии изображения пространства и сохраняет их в базе.
+    image_name - изображение, для которого ставилась задача; без него
+    читается текущее. Если изображение успели заменить, результат
+    отбрасывается: новую фотографию обработает своя задача.
+    """
+    from .catalogue import invalidate_catalogue
+    from .models import Space
+
+    if image_name is None:
+        image_name = Space.objects.filter(pk=space_id).values_list('image', flat=True).first()
+    if not image_name:
+        return None
+    variants = render_variants(image_name)
+    updated = Space.objects.filter(pk=space_id, image=image_name).update(image_variants=variants)
+    if not updated:
+        delete_variants(variants)
+        return None
+    # update() не отправляет post_save, каталог сбрасываем сами
+    invalidate_catalogue()
+    return variants
+
+
+def _run(space_id, image_name, stale=None):
+    try:
+        # Копии прежнего изображения больше не нужны
+        delete_variants(stale)
+        generate_space_variants(space_id, image_name)
+    except Exception:
+        logger.exception('Could not build image variants for space %s', space_id)
+    finally:
+        # Поток пула держит собственное соединение с базой
+        connection.close()
+
+
+def schedule_variants(space_id, image_name, stale=None):
+    """
+    Ставит построение копий image_name в фоновый пул процесса;
+    stale - прежнее значение image_variants, его файлы будут удалены
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SPACE_IMAGE_WORKERS, thread_name_prefix='space-images'
+            )
+    return _executor.submit(_run, space_id, image_name, stale)
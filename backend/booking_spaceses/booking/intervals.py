@@ -0,0 +1,66 @@
+"""
+Индекс интервалов бронирований одного пространства.
+
+Отсортированный по времени начала список броней для проверки пересечений
+в памяти внутри одной операции: пакетное создание (booking/batch.py) и
+перенос броней админкой (booking/bulk.py) загружают брони окрестности одним
+запросом под блокировкой пространства и дальше сверяются с индексом.
+
+Между запросами индекс не хранится: одиночная бронь и расписание дня
+читают базу, иначе брони, созданные или удаленные другими процессами
+(воркерами, retention), были бы не видны.
+"""
+from bisect import bisect_left
+from datetime import timedelta
+
+
+class SpaceIntervalIndex:
+    """
+    Брони одного пространства, отсортированные по (start_time, id).
+
+    Покрывает все брони, которые заканчиваются не раньше horizon.
+    Вхождения серий (pk=None) добавляются без id и не удаляются.
+    """
+
+    def __init__(self, space_id, horizon, bookings=()):
+        self.space_id = space_id
+        self.horizon = horizon
+        self._keys = []
+        self._bookings = []
+        self._positions = {}
+        self._max_length = timedelta(0)
+        for booking in bookings:
+            self.add(booking)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, booking):
+        if booking.pk is not None:
+            self.discard(booking.pk)
+        if booking.end_time < self.horizon:
+            return
+        key = (booking.start_time, booking.pk or 0)
+        position = bisect_left(self._keys, key)
+        self._keys.insert(position, key)
+        self._bookings.insert(position, booking)
+        if booking.pk is not None:
+            self._positions[booking.pk] = key
+        self._max_length = max(self._max_length, booking.end_time - booking.start_time)
+
+    def discard(self, booking_id):
+        key = self._positions.pop(booking_id, None)
+        if key is None:
+            return
+        position = bisect_left(self._keys, key)
+        del self._keys[position]
+        del self._bookings[position]
+
+    def overlapping(self, start, end, exclude_id=None):
+        """Брони, у которых start_time < end и end_time > start"""
+        low = bisect_left(self._keys, (start - self._max_length,))
+        high = bisect_left(self._keys, (end,))
+        return [
+            booking for booking in self._bookings[low:high]
+            if booking.end_time > start and (exclude_id is None or booking.pk != exclude_id)
+        ]
@@ -0,0 +1,498 @@
+"""
+Нагрузочное тестирование API на локальной базе (SQLite или PostgreSQL).
+
+generate_data() наполняет базу синтетическими данными: пространства,
+пользователи с токенами и брони, которые вставляются порциями через
+bulk_create (миллионы броней - за минуты). Все объекты помечены префиксом
+PREFIX и удаляются clear_data() без затрагивания остальных данных.
+
+run_scenario() выполняет сценарий (список пространств, одно пространство,
+день пространства, "мои брони", профиль, создание брони с конфликтами,
+удаление) заданное число раз в несколько потоков и считает пропускную
+способность и перцентили задержки. Запросы идут либо в процессе через
+django.test.Client (весь стек middleware и DRF, без сети), либо по HTTP
+к запущенному серверу. run_async_scenario() - то же через ASGI-обработчик
+(django.test.AsyncClient) в одном цикле событий.
+
+Команды: ``python manage.py loadtest_data``, ``python manage.py loadtest``
+и ``python manage.py benchmark_asgi``.
+"""
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+import types
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import utilization
+from .models import Booking, Space, BOOKING_MIN_GAP
+
+PREFIX = 'loadtest'
+BOOKING_DURATION = 30
+SCENARIOS = ('spaces', 'detail', 'day', 'my', 'me', 'create', 'delete')
+# Сценарии эндпоинтов, у которых есть асинхронные представления (API_ASYNC_VIEWS)
+READ_SCENARIOS = ('spaces', 'detail', 'day', 'my', 'me')
+
+
+def day_slots(work_start, work_end, duration=BOOKING_DURATION):
+    """Начала непересекающихся слотов рабочего дня с учетом минимального зазора"""
+    step = timedelta(minutes=duration) + BOOKING_MIN_GAP
+    start = datetime.combine(datetime.min, work_start)
+    last = datetime.combine(datetime.min, work_end) - timedelta(minutes=duration)
+    slots = []
+    while start <= last:
+        slots.append(start.time())
+        start += step
+    return slots
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    return iter(lambda: list(islice(iterator, size)), [])
+
+
+def generate_data(spaces, users, bookings, past_days=30, fill=0.8, batch_size=5000, seed=0, progress=None):
+    """
+    Создает пространства, пользователей с токенами и брони. Брони каждого
+    пространства идут подряд по дням, начиная с past_days дней назад;
+    fill - доля занятых слотов дня. Возвращает число созданных объектов.
+    """
+    User = get_user_model()
+    rng = random.Random(seed)
+    offset = Space.objects.filter(name__startswith=f'{PREFIX}-space-').count()
+
+    space_objects = Space.objects.bulk_create([
+        Space(name=f'{PREFIX}-space-{offset + number}', description='Нагрузочное тестирование')
+        for number in range(spaces)
+    ])
+    # Один хеш на всех: хеширование пароля - самая дорогая часть создания пользователя
+    password = make_password(None)
+    user_offset = User.objects.filter(username__startswith=f'{PREFIX}-').count()
+    user_ids = []
+    for batch in batched(range(users), batch_size):
+        created = User.objects.bulk_create([
+            User(username=f'{PREFIX}-user-{user_offset + number}', password=password) for number in batch
+        ])
+        Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in created])
+        user_ids.extend(user.pk for user in created)
+
+    tz = timezone.get_current_timezone()
+    first_day = timezone.localdate() - timedelta(days=past_days)
+    duration = timedelta(minutes=BOOKING_DURATION)
+
+    def rows():
+        quota, remainder = divmod(bookings, len(space_objects))
+        # Рабочие часы - из базы: у объектов после bulk_create там строки по умолчанию
+        hours = Space.objects.filter(pk__in=[space.pk for space in space_objects]).order_by('pk')
+        for position, (space_id, work_start, work_end) in enumerate(hours.values_list('pk', 'work_start', 'work_end')):
+            wanted = quota + (1 if position < remainder else 0)
+            slots = day_slots(work_start, work_end)
+            day, made = first_day, 0
+            while made < wanted:
+                for slot in slots:
+                    if made == wanted:
+                        break
+                    if rng.random() >= fill:
+                        continue
+                    start = datetime.combine(day, slot, tzinfo=tz)
+                    made += 1
+                    yield Booking(
+                        user_id=rng.choice(user_ids), space_id=space_id, start_time=start,
+                        duration=BOOKING_DURATION, end_time=start + duration, description='loadtest'
+                    )
+                day += timedelta(days=1)
+
+    inserted = 0
+    for batch in batched(rows(), batch_size):
+        with transaction.atomic():
+            Booking.objects.bulk_create(batch)
+            # Сводки использования - вместе с порцией, как при bookings_bulk_created
+            utilization.apply(utilization.deltas(utilization.booking_rows(batch)))
+        inserted += len(batch)
+        if progress:
+            progress(inserted)
+
+    reset_caches()
+    return {'spaces': len(space_objects), 'users': len(user_ids), 'bookings': inserted}
+
+
+def clear_data():
+    """Удаляет данные нагрузочного тестирования; брони - порциями id, без сигналов"""
+    User = get_user_model()
+    with transaction.atomic():
+        ids = list(Booking.objects.filter(space__name__startswith=f'{PREFIX}-').values_list('pk', flat=True))
+        deleted = sum(Booking.delete_ids(batch) for batch in batched(ids, 1000))
+        Space.objects.filter(name__startswith=f'{PREFIX}-').delete()
+        User.objects.filter(username__startswith=f'{PREFIX}-').delete()
+    reset_caches()
+    return deleted
+
+
+def reset_caches():
+    # Вставка в обход сигналов: каталог собирается заново
+    from .catalogue import invalidate_catalogue
+    invalidate_catalogue()
+
+
+@dataclass
+class Dataset:
+    space_ids: list
+    tokens: list
+    first_day: object
+    last_day: object
+
+    @classmethod
+    def load(cls):
+        space_ids = list(
+            Space.objects.filter(name__startswith=f'{PREFIX}-space-').order_by('pk').values_list('pk', flat=True)
+        )
+        tokens = list(
+            Token.objects.filter(user__username__startswith=f'{PREFIX}-')
+            .order_by('user_id').values_list('user_id', 'key')
+        )
+        if not space_ids or not tokens:
+            return None
+        bounds = Booking.objects.filter(space_id__in=space_ids[:1]).order_by('start_time')
+        first = bounds.values_list('start_time', flat=True).first()
+        last = bounds.reverse().values_list('start_time', flat=True).first()
+        today = timezone.localdate()
+        return cls(
+            space_ids=space_ids,
+            tokens=tokens,
+            first_day=timezone.localdate(first) if first else today,
+            last_day=timezone.localdate(last) if last else today,
+        )
+
+
+class Scenario:
+    """Сценарий: request(rng) возвращает (метод, путь, тело, токен) очередного запроса"""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def prepare(self, count, rng):
+        pass
+
+    def random_day(self, rng, first=None):
+        first = first or self.dataset.first_day
+        last = max(first, self.dataset.last_day)
+        return first + timedelta(days=rng.randint(0, (last - first).days))
+
+    def random_token(self, rng):
+        return rng.choice(self.dataset.tokens)[1]
+
+
+class SpaceListScenario(Scenario):
+    def request(self, rng):
+        return 'GET', '/api/spaces/', None, self.random_token(rng)
+
+
+class SpaceDetailScenario(Scenario):
+    def request(self, rng):
+        return 'GET', f'/api/spaces/{rng.choice(self.dataset.space_ids)}/', None, self.random_token(rng)
+
+
+class DayScheduleScenario(Scenario):
+    def request(self, rng):
+        space_id = rng.choice(self.dataset.space_ids)
+        return 'GET', f'/api/spaces/{space_id}/bookings/?date={self.random_day(rng)}', None, self.random_token(rng)
+
+
+class MyBookingsScenario(Scenario):
+    def request(self, rng):
+        return 'GET', '/api/bookings/my/', None, self.random_token(rng)
+
+
+class MeScenario(Scenario):
+    def request(self, rng):
+        return 'GET', '/api/auth/me/', None, self.random_token(rng)
+
+
+class CreateScenario(Scenario):
+    """Создание брони на занятые дни: большая часть попыток - конфликты (400)"""
+
+    def request(self, rng):
+        day = self.random_day(rng, first=timezone.localdate() + timedelta(days=1))
+        start = datetime.combine(day, datetime.min.time()).replace(hour=8) + timedelta(minutes=15 * rng.randint(0, 45))
+        data = {
+            'space': rng.choice(self.dataset.space_ids),
+            'start_time': timezone.make_aware(start).isoformat(),
+            'duration': BOOKING_DURATION,
+            'description': 'loadtest',
+        }
+        return 'POST', '/api/bookings/', data, self.random_token(rng)
+
+
+class DeleteScenario(Scenario):
+    """Удаление своих броней: брони для удаления создаются заранее, вне замера"""
+
+    def prepare(self, count, rng):
+        from .signals import bookings_bulk_created
+
+        # Отдельное пространство: брони для удаления не смешиваются с расписанием
+        space = Space.objects.create(
+            name=f'{PREFIX}-delete-{time.monotonic_ns()}', description='Нагрузочное тестирование'
+        )
+        start = timezone.make_aware(
+            datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time())
+        )
+        step = timedelta(minutes=BOOKING_DURATION) + BOOKING_MIN_GAP
+        with transaction.atomic():
+            bookings = Booking.objects.bulk_create([
+                Booking(
+                    user_id=rng.choice(self.dataset.tokens)[0], space=space, start_time=start + step * number,
+                    duration=BOOKING_DURATION, end_time=start + step * number + timedelta(minutes=BOOKING_DURATION),
+                    description='loadtest'
+                )
+                for number in range(count)
+            ])
+            bookings_bulk_created.send(sender=Booking, bookings=bookings)
+        keys = dict(self.dataset.tokens)
+        self.queue = [(booking.pk, keys[booking.user_id]) for booking in bookings]
+        self.lock = threading.Lock()
+
+    def request(self, rng):
+        with self.lock:
+            booking_id, key = self.queue.pop()
+        return 'DELETE', f'/api/bookings/{booking_id}/', None, key
+
+
+SCENARIO_CLASSES = {
+    'spaces': SpaceListScenario,
+    'detail': SpaceDetailScenario,
+    'day': DayScheduleScenario,
+    'my': MyBookingsScenario,
+    'me': MeScenario,
+    'create': CreateScenario,
+    'delete': DeleteScenario,
+}
+
+
+def test_host():
+    hosts = [host for host in settings.ALLOWED_HOSTS if host not in ('*',) and not host.startswith('.')]
+    return hosts[0] if hosts else 'localhost'
+
+
+class InProcessTransport:
+    """Запросы через django.test.Client: весь стек Django без сети"""
+
+    def __init__(self):
+        from django.test import Client
+
+        self.client = Client(HTTP_HOST=test_host(), raise_request_exception=False)
+
+    def send(self, method, path, data, token):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        if data is None:
+            response = self.client.generic(method, path, **headers)
+        else:
+            response = self.client.generic(
+                method, path, json.dumps(data), content_type='application/json', **headers
+            )
+        return response.status_code
+
+    def close(self):
+        connection.close()
+
+
+class AsyncInProcessTransport:
+    """
+    Запросы через django.test.AsyncClient: ASGI-обработчик Django без сети.
+    AsyncClient всегда отправляет Host: testserver (см. run_async_scenario)
+    """
+
+    def __init__(self):
+        from django.test import AsyncClient
+
+        self.client = AsyncClient(raise_request_exception=False)
+
+    async def send(self, method, path, data, token):
+        headers = {'authorization': f'Token {token}'} if token else {}
+        if data is None:
+            response = await self.client.generic(method, path, headers=headers)
+        else:
+            response = await self.client.generic(
+                method, path, json.dumps(data), content_type='application/json', headers=headers
+            )
+        return response.status_code
+
+
+class HttpTransport:
+    """Запросы по HTTP к запущенному серверу (--url)"""
+
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def send(self, method, path, data, token):
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        return self.session.request(method, self.base_url + path, json=data, headers=headers).status_code
+
+    def close(self):
+        self.session.close()
+        connection.close()
+
+
+def percentile(ordered, fraction):
+    """Перцентиль методом ближайшего ранга по отсортированному списку"""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    concurrency: int
+    elapsed: float = 0.0
+    latencies: list = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+
+    def summary(self):
+        ordered = sorted(self.latencies)
+        count = len(ordered)
+        milliseconds = lambda value: round(value * 1000, 3) if value is not None else None
+        return {
+            'requests': count,
+            'concurrency': self.concurrency,
+            'elapsed': round(self.elapsed, 3),
+            'throughput': round(count / self.elapsed, 2) if self.elapsed else None,
+            'errors': sum(number for status, number in self.statuses.items() if status == 'error' or status >= 500),
+            'statuses': {str(status): number for status, number in sorted(self.statuses.items(), key=str)},
+            'mean_ms': milliseconds(sum(ordered) / count if count else None),
+            'p50_ms': milliseconds(percentile(ordered, 0.50)),
+            'p95_ms': milliseconds(percentile(ordered, 0.95)),
+            'p99_ms': milliseconds(percentile(ordered, 0.99)),
+            'max_ms': milliseconds(ordered[-1] if ordered else None),
+        }
+
+
+def run_scenario(name, dataset, requests, concurrency=1, warmup=0, base_url=None, seed=0):
+    """Выполняет сценарий: requests запросов в concurrency потоков после warmup пробных"""
+    scenario = SCENARIO_CLASSES[name](dataset)
+    scenario.prepare(requests + warmup, random.Random(seed))
+    result = ScenarioResult(scenario=name, concurrency=concurrency)
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+    shares = [requests // concurrency + (1 if number < requests % concurrency else 0) for number in range(concurrency)]
+
+    def worker(number, share):
+        rng = random.Random(f'{seed}-{name}-{number}')
+        transport = HttpTransport(base_url) if base_url else InProcessTransport()
+        latencies, statuses = [], Counter()
+        try:
+            # Прогрев: кеши, соединения с базой, ленивые импорты
+            for _ in range(warmup if number == 0 else 0):
+                transport.send(*scenario.request(rng))
+            barrier.wait()
+            for _ in range(share):
+                request = scenario.request(rng)
+                started = time.perf_counter()
+                try:
+                    status = transport.send(*request)
+                except Exception:
+                    status = 'error'
+                latencies.append(time.perf_counter() - started)
+                statuses[status] += 1
+        finally:
+            transport.close()
+            with lock:
+                result.latencies.extend(latencies)
+                result.statuses.update(statuses)
+
+    workers = [threading.Thread(target=worker, args=item) for item in enumerate(shares)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+async def _run_async_scenario(name, dataset, requests, concurrency, warmup, seed):
+    from asgiref.sync import sync_to_async
+
+    scenario = SCENARIO_CLASSES[name](dataset)
+    await sync_to_async(scenario.prepare)(requests + warmup, random.Random(seed))
+    result = ScenarioResult(scenario=name, concurrency=concurrency)
+    rng = random.Random(f'{seed}-{name}')
+    for _ in range(warmup):
+        await AsyncInProcessTransport().send(*scenario.request(rng))
+    pending = iter([scenario.request(rng) for _ in range(requests)])
+
+    async def worker():
+        transport = AsyncInProcessTransport()
+        # Общий итератор: задача берет следующий запрос, как только освободится
+        for request in pending:
+            started = time.perf_counter()
+            try:
+                status = await transport.send(*request)
+            except Exception:
+                status = 'error'
+            result.latencies.append(time.perf_counter() - started)
+            result.statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+async def run_async_scenario(name, dataset, requests, concurrency=1, warmup=0, seed=0):
+    """
+    run_scenario() через ASGI-обработчик: concurrency задач в одном цикле
+    событий, как запросы, одновременно обслуживаемые одним процессом uvicorn
+    """
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        return await _run_async_scenario(name, dataset, requests, concurrency, warmup, seed)
+
+
+def api_urlconf(async_views):
+    """Корневой urlconf API с асинхронными или DRF-представлениями чтения"""
+    from accounts.urls import build_urlpatterns as auth_urlpatterns
+    from .urls import build_urlpatterns
+
+    module = types.ModuleType(f"{PREFIX}_urls_{'async' if async_views else 'sync'}")
+    module.urlpatterns = [
+        path('api/auth/', include(auth_urlpatterns(async_views))),
+        path('api/', include(build_urlpatterns(async_views))),
+    ]
+    return module
+
+
+def compare(baseline, current, max_regression):
+    """
+    Сравнивает результаты двух запусков: p95 выше или пропускная способность
+    ниже базовой больше чем на max_regression (доля) считается регрессией.
+    Возвращает строки отчета и список регрессий.
+    """
+    lines, regressions = [], []
+    for name, summary in current['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base or not base.get('p95_ms') or not base.get('throughput'):
+            continue
+        p95 = summary['p95_ms'] / base['p95_ms'] - 1
+        throughput = summary['throughput'] / base['throughput'] - 1
+        lines.append(f'{name}: p95 {p95:+.1%}, пропускная способность {throughput:+.1%}')
+        if p95 > max_regression or throughput < -max_regression:
+            regressions.append(name)
+    return lines, regressions
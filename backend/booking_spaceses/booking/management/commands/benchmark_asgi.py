@@ -0,0 +1,69 @@
+import asyncio
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from booking.loadtest import READ_SCENARIOS, Dataset, api_urlconf, run_async_scenario, run_scenario
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение одного процесса под WSGI (DRF-представления, --threads потоков, '
+        'как синхронный воркер gunicorn) и под ASGI (асинхронные представления, '
+        '--concurrency одновременных запросов) на эндпоинтах чтения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=READ_SCENARIOS,
+            help=f"Сценарий (можно повторять), по умолчанию все: {', '.join(READ_SCENARIOS)}"
+        )
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на сценарий (по умолчанию 500)')
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Потоков WSGI-процесса (по умолчанию 1 - синхронный воркер gunicorn)'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=50,
+            help='Одновременных запросов к ASGI-процессу (по умолчанию 50)'
+        )
+        parser.add_argument('--warmup', type=int, default=10, help='Пробных запросов перед замером (по умолчанию 10)')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных чисел')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['threads'], options['concurrency']) < 1:
+            raise CommandError('--requests, --threads и --concurrency должны быть положительными')
+        dataset = Dataset.load()
+        if dataset is None:
+            raise CommandError('Нет данных для теста: сначала выполните python manage.py loadtest_data')
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        results = {}
+        for name in options['scenario'] or READ_SCENARIOS:
+            with override_settings(ROOT_URLCONF=api_urlconf(async_views=False)):
+                wsgi = run_scenario(
+                    name, dataset, options['requests'],
+                    concurrency=options['threads'], warmup=options['warmup'], seed=options['seed'],
+                )
+            with override_settings(ROOT_URLCONF=api_urlconf(async_views=True)):
+                asgi = asyncio.run(run_async_scenario(
+                    name, dataset, options['requests'],
+                    concurrency=options['concurrency'], warmup=options['warmup'], seed=options['seed'],
+                ))
+            results[name] = {'wsgi': wsgi.summary(), 'asgi': asgi.summary()}
+            for mode, summary in results[name].items():
+                self.stdout.write(
+                    f"{name:>7} {mode}: {summary['throughput']:.1f} запр/с при {summary['concurrency']} "
+                    f"одновременных, p50 {summary['p50_ms']:.1f} мс, p95 {summary['p95_ms']:.1f} мс, "
+                    f"p99 {summary['p99_ms']:.1f} мс, ошибок {summary['errors']}, ответы {summary['statuses']}"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты сохранены в {options['output']}")
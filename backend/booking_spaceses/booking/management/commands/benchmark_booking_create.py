@@ -0,0 +1,113 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from rest_framework import serializers
+
+from booking.exceptions import BookingConflict
+from booking.models import Space, Booking, BOOKING_MIN_GAP
+from booking.serializers import BookingSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность создания броней с блокировкой пространства и без нее. '
+        'Замер идет во временной тестовой базе; --current-db - в настроенной базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Число параллельных потоков (по умолчанию 8)')
+        parser.add_argument('--requests', type=int, default=50, help='Число попыток брони на поток (по умолчанию 50)')
+        parser.add_argument(
+            '--current-db', action='store_true',
+            help='Создавать и удалять пространства, пользователей и брони в настроенной базе, а не в тестовой'
+        )
+
+    def handle(self, *args, **options):
+        if options['current_db']:
+            self.run_modes(options['threads'], options['requests'])
+            return
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run_modes(options['threads'], options['requests'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_modes(self, threads, requests):
+        for mode in ('unlocked', 'locked'):
+            result = self.run_mode(mode, threads, requests)
+            self.stdout.write(
+                f"{mode:>8}: {result['rate']:.1f} попыток/с, создано {result['created']}, "
+                f"отклонено {result['rejected']}, конфликтов 409 {result['conflicts']}, "
+                f"пересечений в базе {result['overlaps']}"
+            )
+
+    def run_mode(self, mode, threads, requests):
+        space = Space.objects.create(
+            name=f'benchmark-{mode}', description='', image='spaces/benchmark.png',
+            work_start='00:00', work_end='23:59'
+        )
+        users = [
+            User.objects.create(username=f'benchmark-{mode}-{number}-{time.monotonic_ns()}')
+            for number in range(threads)
+        ]
+        day = timezone.localdate() + timedelta(days=1)
+        first_slot = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+        counters = {'created': 0, 'rejected': 0, 'conflicts': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(user):
+            request = SimpleNamespace(user=user)
+            barrier.wait()
+            try:
+                for number in range(requests):
+                    # Слоты по 30 минут с шагом 10 минут: большинство попыток конфликтует
+                    start_time = first_slot + timedelta(minutes=10 * (number % 140))
+                    serializer = BookingSerializer(data={
+                        'space': space.pk,
+                        'start_time': start_time.isoformat(),
+                        'duration': 30,
+                        'description': 'benchmark',
+                    }, context={'request': request})
+                    outcome = 'rejected'
+                    try:
+                        if serializer.is_valid():
+                            if mode == 'locked':
+                                serializer.save()
+                            else:
+                                serializers.ModelSerializer.create(
+                                    serializer, {**serializer.validated_data, 'user': user}
+                                )
+                            outcome = 'created'
+                    except BookingConflict:
+                        outcome = 'conflicts'
+                    with lock:
+                        counters[outcome] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(user,)) for user in users]
+        for thread in workers:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        bookings = list(Booking.objects.filter(space=space).order_by('start_time'))
+        overlaps = sum(
+            1 for previous, current in zip(bookings, bookings[1:])
+            if current.start_time < previous.end_time + BOOKING_MIN_GAP
+        )
+        space.delete()
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        return {**counters, 'overlaps': overlaps, 'rate': threads * requests / elapsed}
@@ -0,0 +1,88 @@
+import gzip
+import json
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from booking.flat import BOOKING_FLAT, SPACE_FLAT
+from booking.models import Space, Booking
+from booking.renderers import FastJSONRenderer, orjson
+from booking.serializers import BookingSerializer, SpaceSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает сериализацию списков через ModelSerializer и плоский сериализатор'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Число броней в списке (по умолчанию 10000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Число повторов замера (по умолчанию 5)')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        self.stdout.write(f"Строк: {rows}, повторов: {repeat}, orjson: {'да' if orjson else 'нет'}")
+
+        # Данные создаются в транзакции и откатываются после замера
+        with transaction.atomic():
+            space = Space.objects.create(
+                name='benchmark', description='', image='spaces/benchmark.png',
+                work_start='00:00', work_end='23:59'
+            )
+            user = User.objects.create(username=f'benchmark-serialization-{time.monotonic_ns()}')
+            start = timezone.now() + timedelta(days=1)
+            Booking.objects.bulk_create([
+                Booking(
+                    user=user, space=space, start_time=start + timedelta(minutes=45 * number),
+                    duration=30, end_time=start + timedelta(minutes=45 * number + 30),
+                    description=f'Бронь {number}'
+                )
+                for number in range(rows)
+            ], batch_size=1000)
+            Space.objects.bulk_create([
+                Space(name=f'Пространство {number}', description='benchmark', image='spaces/benchmark.png')
+                for number in range(min(rows, 1000))
+            ])
+
+            bookings = Booking.objects.filter(space=space).order_by('start_time', 'id')
+            spaces = Space.objects.order_by('id')
+            self.compare(
+                'Брони', repeat,
+                lambda: JSONRenderer().render(BookingSerializer(bookings, many=True).data),
+                lambda: FastJSONRenderer().render(BOOKING_FLAT.rows(bookings)),
+            )
+            self.compare(
+                'Пространства', repeat,
+                lambda: JSONRenderer().render(SpaceSerializer(spaces, many=True).data),
+                lambda: FastJSONRenderer().render(SPACE_FLAT.rows(spaces)),
+            )
+            transaction.set_rollback(True)
+
+    def compare(self, title, repeat, slow, fast):
+        slow_body, slow_time = self.measure(slow, repeat)
+        fast_body, fast_time = self.measure(fast, repeat)
+        same = json.loads(slow_body) == json.loads(fast_body)
+        self.stdout.write(
+            f"{title}: ModelSerializer + JSONRenderer {slow_time * 1000:.1f} мс, "
+            f"плоский + FastJSONRenderer {fast_time * 1000:.1f} мс, "
+            f"ускорение {slow_time / fast_time:.1f}x, ответы совпадают: {'да' if same else 'НЕТ'}"
+        )
+        self.stdout.write(
+            f"{title}: размер {len(fast_body) / 1024:.0f} КБ, gzip {len(gzip.compress(fast_body)) / 1024:.0f} КБ"
+        )
+
+    @staticmethod
+    def measure(render, repeat):
+        best = None
+        body = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return body, best
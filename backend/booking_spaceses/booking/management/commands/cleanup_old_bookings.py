@@ -1,62 +1,127 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from booking.models import Booking
-from datetime import timedelta
+from booking.retention import BatchDeleter, retention_lock
+
+
+def add_deletion_arguments(parser):
+    """Общие параметры удаления порциями для команды и скрипта cleanup_bookings.py"""
+    parser.add_argument(
+        '--days',
+        type=int,
+        default=1,
+        help='Удалять бронирования старше указанного количества дней (по умолчанию 1)'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Показать, какие бронирования будут удалены, но не удалять их'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=settings.BOOKING_RETENTION_BATCH_SIZE,
+        help='Количество бронирований в одной порции удаления'
+    )
+    parser.add_argument(
+        '--sleep',
+        type=float,
+        default=settings.BOOKING_RETENTION_BATCH_SLEEP,
+        help='Пауза между порциями в секундах'
+    )
+    parser.add_argument(
+        '--time-budget',
+        type=float,
+        default=None,
+        help='Остановиться после указанного количества секунд (продолжить можно повторным запуском)'
+    )
+    parser.add_argument(
+        '--archive',
+        action='store_true',
+        help='Перед удалением сохранять бронирования в архив (BOOKING_ARCHIVE_DIR)'
+    )
+    parser.add_argument(
+        '--resume-from',
+        type=int,
+        default=0,
+        help='Продолжить с брони, ID которой больше указанного (last_pk прошлого запуска)'
+    )
+
+
+def run_deletion(options, write):
+    """
+    Запускает BatchDeleter по параметрам командной строки и печатает прогресс.
+    Удаление выполняется под retention_lock(); если очистку уже выполняет
+    другой процесс (воркер run_retention), возвращает None
+    """
+    days = options['days']
+    dry_run = options['dry_run']
+
+    def report(state):
+        action = 'Найдено' if dry_run else 'Удалено'
+        count = state.matched if dry_run else state.deleted
+        write(f'  порция {state.batches}: {action} {count}, last_pk={state.last_pk}, {state.elapsed:.1f} с')
+
+    deleter = BatchDeleter.older_than(
+        days,
+        batch_size=options['batch_size'],
+        sleep=0 if dry_run else options['sleep'],
+        time_budget=options['time_budget'],
+        dry_run=dry_run,
+        start_after=options['resume_from'],
+        progress=report,
+        archive=options['archive'],
+    )
+
+    if dry_run:
+        # Примеры читаем одним ограниченным запросом, без загрузки моделей
+        examples = deleter.queryset().order_by('pk').values('id', 'space__name', 'start_time')[:10]
+        for example in examples:
+            write(f"  - ID {example['id']}: {example['space__name']} на {example['start_time']}")
+
+        return deleter.run()
+
+    with retention_lock() as acquired:
+        if not acquired:
+            return None
+        return deleter.run()
 
 
 class Command(BaseCommand):
     help = 'Удаляет все бронирования, которые уже завершились'
 
     def add_arguments(self, parser):
-        parser.add_argument(
-            '--days',
-            type=int,
-            default=1,
-            help='Удалять бронирования старше указанного количества дней (по умолчанию 1)'
-        )
-        parser.add_argument(
-            '--dry-run',
-            action='store_true',
-            help='Показать, какие бронирования будут удалены, но не удалять их'
-        )
+        add_deletion_arguments(parser)
 
     def handle(self, *args, **options):
         days = options['days']
-        dry_run = options['dry_run']
-        
-        # Вычисляем время, после которого бронирования считаются старыми
-        cutoff_time = timezone.now() - timedelta(days=days)
-        
-        # Находим все бронирования, которые уже завершились
-        old_bookings = Booking.objects.filter(
-            start_time__lt=cutoff_time
-        )
-        
-        count = old_bookings.count()
-        
-        if count == 0:
+        state = run_deletion(options, self.stdout.write)
+
+        if state is None:
             self.stdout.write(
-                self.style.SUCCESS('Нет старых бронирований для удаления')
+                self.style.WARNING('Очистку уже выполняет другой процесс, повторите позже')
             )
             return
-        
-        if dry_run:
+        if state.matched == 0:
+            self.stdout.write(
+                self.style.SUCCESS('Нет старых бронирований для удаления')
+            )
+        elif options['dry_run']:
             self.stdout.write(
                 self.style.WARNING(
-                    f'Будет удалено {count} бронирований старше {days} дней:'
+                    f'Будет удалено {state.matched} бронирований старше {days} дней'
                 )
             )
-            for booking in old_bookings[:10]:  # Показываем первые 10
-                self.stdout.write(
-                    f'  - ID {booking.id}: {booking.space.name} на {booking.start_time}'
-                )
-            if count > 10:
-                self.stdout.write(f'  ... и еще {count - 10} бронирований')
         else:
-            # Удаляем старые бронирования
-            deleted_count = old_bookings.delete()[0]
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'Удалено {deleted_count} старых бронирований'
+                    f'Удалено {state.deleted} старых бронирований'
                 )
-            ) 
\ No newline at end of file
+            )
+            if options['archive']:
+                self.stdout.write(f'Сохранено в архив: {state.archived}')
+        if not state.finished:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'Исчерпан лимит времени, продолжить: --resume-from {state.last_pk}'
+                )
+            )
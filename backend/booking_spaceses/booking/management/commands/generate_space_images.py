@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from booking.images import generate_space_variants
+from booking.models import Space
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии изображений пространств (WebP и JPEG) для уже загруженных фотографий'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--space',
+            type=int,
+            action='append',
+            help='Обработать только указанное пространство (можно повторять)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить копии и для пространств, у которых они уже есть'
+        )
+
+    def handle(self, *args, **options):
+        spaces = Space.objects.exclude(image='').order_by('pk')
+        if options['space']:
+            spaces = spaces.filter(pk__in=options['space'])
+        if not options['force']:
+            spaces = spaces.filter(image_variants={})
+
+        built = failed = 0
+        for space_id, image in spaces.values_list('pk', 'image').iterator():
+            try:
+                variants = generate_space_variants(space_id)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{space_id} ({image}): {error}')
+                continue
+            if variants:
+                built += 1
+                sizes = ', '.join(f"{size} {variant['width']}x{variant['height']}" for size, variant in variants.items())
+                self.stdout.write(f'{space_id} ({image}): {sizes}')
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано пространств: {built}, ошибок: {failed}'))
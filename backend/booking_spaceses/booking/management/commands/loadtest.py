@@ -0,0 +1,100 @@
+import json
+import logging
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from booking.loadtest import SCENARIOS, Dataset, compare, run_scenario
+from booking.models import Booking
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест API на данных loadtest_data: пропускная способность и '
+        'перцентили задержки по сценариям, результаты в JSON для сравнения запусков'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=SCENARIOS,
+            help=f"Сценарий (можно повторять), по умолчанию все: {', '.join(SCENARIOS)}"
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий (по умолчанию 200)')
+        parser.add_argument('--concurrency', type=int, default=1, help='Число параллельных клиентов (по умолчанию 1)')
+        parser.add_argument('--warmup', type=int, default=10, help='Пробных запросов перед замером (по умолчанию 10)')
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера (http://127.0.0.1:8000); без него запросы выполняются в процессе'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных чисел')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--baseline', help='JSON-файл прежнего запуска для сравнения')
+        parser.add_argument(
+            '--max-regression', type=float, default=20,
+            help='Допустимое ухудшение p95 и пропускной способности относительно --baseline, %% (по умолчанию 20)'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests и --concurrency должны быть положительными')
+        dataset = Dataset.load()
+        if dataset is None:
+            raise CommandError('Нет данных для теста: сначала выполните python manage.py loadtest_data')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+
+        if not options['url']:
+            # Предупреждения об ответах 4xx (конфликты при создании) засоряют вывод и замер
+            logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        results = {
+            'meta': {
+                'started_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'target': options['url'] or 'in-process',
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'warmup': options['warmup'],
+                'seed': options['seed'],
+                'spaces': len(dataset.space_ids),
+                'users': len(dataset.tokens),
+                'bookings': Booking.objects.count(),
+            },
+            'scenarios': {},
+        }
+        for name in options['scenario'] or SCENARIOS:
+            result = run_scenario(
+                name, dataset, options['requests'],
+                concurrency=options['concurrency'],
+                warmup=options['warmup'],
+                base_url=options['url'],
+                seed=options['seed'],
+            )
+            summary = results['scenarios'][name] = result.summary()
+            self.stdout.write(
+                f"{name:>7}: {summary['throughput']:.1f} запр/с, p50 {summary['p50_ms']:.1f} мс, "
+                f"p95 {summary['p95_ms']:.1f} мс, p99 {summary['p99_ms']:.1f} мс, "
+                f"ошибок {summary['errors']}, ответы {summary['statuses']}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты сохранены в {options['output']}")
+
+        if baseline is not None:
+            lines, regressions = compare(baseline, results, options['max_regression'] / 100)
+            for line in lines:
+                self.stdout.write(line)
+            if regressions:
+                raise CommandError(f"Регрессия производительности: {', '.join(regressions)}")
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
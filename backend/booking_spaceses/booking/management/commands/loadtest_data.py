@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.loadtest import PREFIX, clear_data, generate_data
+
+
+class Command(BaseCommand):
+    help = 'Наполняет базу синтетическими данными для нагрузочного тестирования (python manage.py loadtest)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spaces', type=int, default=20, help='Число пространств (по умолчанию 20)')
+        parser.add_argument('--users', type=int, default=200, help='Число пользователей (по умолчанию 200)')
+        parser.add_argument('--bookings', type=int, default=100000, help='Число броней (по умолчанию 100000)')
+        parser.add_argument(
+            '--past-days', type=int, default=30,
+            help='Брони начинаются за столько дней до сегодняшнего (по умолчанию 30)'
+        )
+        parser.add_argument('--fill', type=float, default=0.8, help='Доля занятых слотов дня (по умолчанию 0.8)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер порции bulk_create (по умолчанию 5000)')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных чисел')
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help=f'Сначала удалить данные прежних запусков (объекты с префиксом "{PREFIX}-")'
+        )
+
+    def handle(self, *args, **options):
+        if options['spaces'] < 1 or options['users'] < 1:
+            raise CommandError('Нужно хотя бы одно пространство и один пользователь')
+        if not 0 < options['fill'] <= 1:
+            raise CommandError('--fill должен быть в диапазоне (0, 1]')
+
+        if options['clear']:
+            deleted = clear_data()
+            self.stdout.write(f'Удалены данные прежних запусков, броней: {deleted}')
+
+        started = time.monotonic()
+
+        def progress(inserted):
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'Броней: {inserted} ({inserted / elapsed:.0f}/с)')
+
+        created = generate_data(
+            spaces=options['spaces'],
+            users=options['users'],
+            bookings=options['bookings'],
+            past_days=options['past_days'],
+            fill=options['fill'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано пространств: {created['spaces']}, пользователей: {created['users']}, "
+            f"броней: {created['bookings']} за {time.monotonic() - started:.1f} с"
+        ))
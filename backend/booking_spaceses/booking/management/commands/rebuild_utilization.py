@@ -0,0 +1,65 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from booking.models import Booking
+from booking.utilization import first_complete_day, local_bounds, rebuild
+
+
+def parse_day(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Неверная дата {value}, нужен формат YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сводки использования пространств из таблицы броней за диапазон дат. '
+        'Сводки дней вне диапазона не меняются. Дни, брони которых уже удаляет очистка '
+        '(BOOKING_RETENTION_DAYS), пересчитать нельзя: их история есть только в сводках'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='Первый день (YYYY-MM-DD), по умолчанию - самый ранний день, брони которого не затронуты очисткой')
+        parser.add_argument('--to', dest='date_to', help='Последний день (YYYY-MM-DD), по умолчанию - день самой поздней брони')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Броней в одной порции чтения (по умолчанию 2000)')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size должен быть положительным')
+        complete = first_complete_day()
+        bookings = Booking.objects.filter(end_time__gt=local_bounds(complete, complete)[0])
+        bookings = bookings.order_by('start_time').values_list('start_time', flat=True)
+        first, last = bookings.first(), bookings.reverse().first()
+        if first is None and not (options['date_from'] and options['date_to']):
+            self.stdout.write(self.style.SUCCESS('Нет броней для пересчета'))
+            return
+        if options['date_from']:
+            date_from = parse_day(options['date_from'])
+            if date_from < complete:
+                raise CommandError(
+                    f'Брони до {complete} частично удалены очисткой (BOOKING_RETENTION_DAYS), '
+                    f'пересчет стер бы их сводки: укажите --from не раньше {complete}'
+                )
+        else:
+            date_from = max(timezone.localdate(first), complete)
+        date_to = parse_day(options['date_to']) if options['date_to'] else timezone.localdate(last)
+        if date_to < date_from:
+            raise CommandError('--to не может быть раньше --from')
+
+        started = time.monotonic()
+
+        def progress(processed):
+            self.stdout.write(f'Броней: {processed} ({processed / (time.monotonic() - started):.0f}/с)')
+
+        processed = rebuild(
+            date_from, date_to, chunk_size=options['chunk_size'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Сводки за {date_from} - {date_to} пересчитаны по {processed} броням '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from booking.archive import list_partitions, partition_path, restore_partition
+
+
+class Command(BaseCommand):
+    help = 'Возвращает в базу бронирования из архива за указанный месяц'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'month',
+            nargs='?',
+            help='Месяц архива в формате YYYY-MM'
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Показать доступные месяцы архива'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество бронирований в одной вставке (по умолчанию 1000)'
+        )
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for month in list_partitions():
+                self.stdout.write(month)
+            return
+
+        month = options['month']
+        if not month:
+            raise CommandError('Укажите месяц архива (YYYY-MM) или --list')
+        if not partition_path(month).exists():
+            raise CommandError(f'Архив за {month} не найден: {partition_path(month)}')
+
+        restored, skipped = restore_partition(month, batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Восстановлено {restored} бронирований, пропущено {skipped}')
+        )
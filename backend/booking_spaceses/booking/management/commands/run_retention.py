@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from booking.retention import run_retention
+
+
+class Command(BaseCommand):
+    help = 'Периодически удаляет старые бронирования (воркер очистки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Удалять бронирования старше указанного количества дней (по умолчанию BOOKING_RETENTION_DAYS)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=None,
+            help='Пауза между проходами в секундах (по умолчанию BOOKING_RETENTION_INTERVAL)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить один проход и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or settings.BOOKING_RETENTION_INTERVAL
+
+        while True:
+            deleted_count = run_retention(options['days'])
+            if deleted_count is None:
+                self.stdout.write(self.style.WARNING('Очистку выполняет другой процесс, пропускаем проход'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'Удалено {deleted_count} старых бронирований'))
+            # Не держим соединение открытым во время паузы
+            connection.close()
+
+            if options['once']:
+                return
+            time.sleep(interval)
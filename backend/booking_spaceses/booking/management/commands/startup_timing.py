@@ -0,0 +1,87 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+STEPS = [
+    ('settings', 'Импорт настроек'),
+    ('setup', 'django.setup()'),
+    ('application', 'ASGI-приложение'),
+    ('urls', 'URL-маршруты'),
+    ('total', 'Всего'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет запуск процесса Django в отдельных процессах (booking/startup.py): импорт настроек, '
+        'django.setup(), импорт и ready() каждого приложения, ASGI-приложение и URL-маршруты. '
+        'Ошибка, если при запуске открывается подключение к базе или время превышает --max-ms'
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Число запусков, выводятся медианы (по умолчанию 5)')
+        parser.add_argument('--max-ms', type=float, help='Допустимое время запуска без интерпретатора (мс)')
+        parser.add_argument('--json', action='store_true', help='Вывести медианы в JSON')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs должен быть положительным')
+        runs = [self.run_once() for _ in range(options['runs'])]
+        report = self.medians(runs)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            self.print_report(report, len(runs))
+
+        connections = max(run['connections'] for run in runs)
+        if connections:
+            raise CommandError(f'При запуске открыто подключений к базе: {connections}')
+        if options['max_ms'] is not None and report['total'] > options['max_ms']:
+            raise CommandError(f"Запуск занял {report['total']:.1f} мс, допустимо {options['max_ms']:.1f} мс")
+
+    def run_once(self):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, '-m', 'booking.startup'],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True
+        )
+        if completed.returncode:
+            raise CommandError(f'Процесс замера завершился с ошибкой:\n{completed.stderr}')
+        result = json.loads(completed.stdout)
+        result['process'] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    @staticmethod
+    def medians(runs):
+        report = {
+            key: statistics.median(run[key] for run in runs)
+            for key in ('settings', 'setup', 'application', 'urls', 'total', 'process')
+        }
+        report['apps'] = {
+            label: {
+                step: statistics.median(run['apps'][label][step] for run in runs)
+                for step in ('import', 'models', 'ready')
+            }
+            for label in runs[0]['apps']
+        }
+        return report
+
+    def print_report(self, report, runs):
+        self.stdout.write(f'Медианы {runs} запусков, мс')
+        self.stdout.write(f"  {'Процесс целиком (с интерпретатором)':<38}{report['process']:>10.1f}")
+        for key, title in STEPS:
+            self.stdout.write(f'  {title:<38}{report[key]:>10.1f}')
+        self.stdout.write('')
+        self.stdout.write(f"  {'Приложение':<38}{'импорт':>10}{'модели':>10}{'ready()':>10}")
+        for label, timings in report['apps'].items():
+            self.stdout.write(
+                f"  {label:<38}{timings['import']:>10.1f}{timings['models']:>10.1f}{timings['ready']:>10.1f}"
+            )
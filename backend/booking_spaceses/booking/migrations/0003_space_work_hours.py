@@ -0,0 +1,43 @@
+# Поля work_start/work_end есть в модели, но не попали в 0002.
+# В рабочих базах эти колонки уже созданы, поэтому добавляем их только там,
+# где их нет (например, в тестовой базе).
+
+from django.db import migrations, models
+
+
+def add_missing_work_hours(apps, schema_editor):
+    Space = apps.get_model('booking', 'Space')
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        columns = {
+            column.name
+            for column in connection.introspection.get_table_description(cursor, Space._meta.db_table)
+        }
+    for field_name in ('work_start', 'work_end'):
+        if field_name not in columns:
+            schema_editor.add_field(Space, Space._meta.get_field(field_name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0002_alter_booking_options_space_work_end_and_more'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='space',
+                    name='work_start',
+                    field=models.TimeField(default='08:00'),
+                ),
+                migrations.AddField(
+                    model_name='space',
+                    name='work_end',
+                    field=models.TimeField(default='20:00'),
+                ),
+            ],
+        ),
+        migrations.RunPython(add_missing_work_hours, migrations.RunPython.noop),
+    ]
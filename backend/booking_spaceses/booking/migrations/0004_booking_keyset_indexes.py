@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0003_space_work_hours'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['start_time', 'id'], name='booking_start_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'start_time', 'id'], name='booking_user_start_id_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_booking_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('duration', models.PositiveIntegerField()),
+                ('description', models.TextField()),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly')], default='weekly', max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1)),
+                ('weekdays', models.CharField(blank=True, max_length=13)),
+                ('until', models.DateField()),
+                ('space', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='booking.space')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['start_time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SeriesException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='booking.bookingseries')),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bookingseries',
+            index=models.Index(fields=['space', 'until'], name='series_space_until_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='seriesexception',
+            unique_together={('series', 'date')},
+        ),
+    ]
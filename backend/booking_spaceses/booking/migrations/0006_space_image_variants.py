@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0005_booking_series'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='space',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0007_booking_validation_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpaceUtilization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('booked_minutes', models.IntegerField(default=0)),
+                ('bookings', models.IntegerField(default=0)),
+                ('space', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='booking.space')),
+            ],
+            options={
+                'ordering': ['space', 'date', 'hour'],
+                'indexes': [models.Index(fields=['hour', 'date'], name='utilization_hour_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('space', 'date', 'hour'), name='utilization_space_date_hour_uniq')],
+            },
+        ),
+    ]
@@ -1,10 +1,26 @@
-from django.db import models
+from django.db import connections, models, router
+from django.db.models import Count, Exists, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
+import secrets
 
 User = get_user_model()
 
+# Минимальный промежуток между бронями одного пространства
+BOOKING_MIN_GAP = timedelta(minutes=15)
+# Максимальная длительность брони для обычных пользователей (минуты)
+BOOKING_MAX_DURATION = 120
+# Максимум активных броней одного пользователя в одном пространстве:
+# будущие брони и действующие серии (серия - одна бронь)
+BOOKING_MAX_ACTIVE = 2
+
+
+def count_subquery(queryset):
+    """Число строк queryset одного пространства как подзапрос"""
+    return Coalesce(Subquery(queryset.order_by().values('space').annotate(total=Count('id')).values('total')), 0)
+
 
 class Space(models.Model):
     name = models.CharField(max_length=255)
@@ -12,10 +28,21 @@ class Space(models.Model):
     image = models.ImageField(upload_to='spaces/')
     work_start = models.TimeField(default="08:00")
     work_end = models.TimeField(default="20:00")
+    # Уменьшенные копии изображения (booking/images.py): размер -> ширина, высота, файлы по форматам
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Загруженное имя изображения: при сохранении сигнал reset_image_variants
+        # узнает о замене фотографии без запроса к базе
+        if 'image' in field_names:
+            instance._loaded_image = instance.image.name
+        return instance
+
 
 class Booking(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -27,30 +54,213 @@ class Booking(models.Model):
 
     class Meta:
         ordering = ['start_time']  # Сортировка по умолчанию от ранних к поздним
+        indexes = [
+            # Keyset-пагинация списков броней (booking/pagination.py)
+            models.Index(fields=['start_time', 'id'], name='booking_start_id_idx'),
+            models.Index(fields=['user', 'start_time', 'id'], name='booking_user_start_id_idx'),
+            # Проверки при создании брони (Booking.slot_state): пересечения и лимит активных
+            models.Index(fields=['space', 'start_time', 'end_time'], name='booking_space_start_end_idx'),
+            models.Index(fields=['user', 'space', 'start_time'], name='booking_user_space_start_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         from datetime import timedelta
         self.end_time = self.start_time + timedelta(minutes=self.duration)
-        
-        # Автоматически очищаем старые бронирования при создании новой брони
-        if not self.pk:  # Только при создании новой записи
-            self.cleanup_old_bookings()
-            
+        # Старые брони удаляет воркер очистки (booking/retention.py)
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def _conflict_filter(space, start_time, end_time, exclude_id=None):
+        condition = Q(
+            space=space,
+            start_time__lt=end_time + BOOKING_MIN_GAP,
+            end_time__gt=start_time - BOOKING_MIN_GAP
+        )
+        if exclude_id is not None:
+            condition &= ~Q(id=exclude_id)
+        return condition
+
+    @classmethod
+    def conflicting(cls, space, start_time, end_time, exclude_id=None):
+        """
+        Брони пространства, которые пересекаются с интервалом
+        или стоят к нему ближе минимального промежутка
+        """
+        return cls.objects.filter(cls._conflict_filter(space, start_time, end_time, exclude_id))
+
+    @classmethod
+    def _active_counts(cls, user, space):
+        return {
+            'active_bookings': count_subquery(cls.objects.filter(user=user, space=space, start_time__gt=timezone.now())),
+            'active_series': count_subquery(
+                BookingSeries.objects.filter(user=user, space=space, until__gte=timezone.localdate())
+            ),
+        }
+
+    @classmethod
+    def slot_state(cls, space, start_time, end_time, user=None, exclude_id=None):
+        """
+        Одним запросом: есть ли конфликтующие брони (conflicting()), есть ли
+        рядом серии пространства и сколько у пользователя активных броней и
+        серий в этом пространстве. Вхождения серий разворачиваются отдельными
+        запросами, только если серии рядом нашлись. Без user - только
+        конфликт, число активных броней 0
+        """
+        from .recurrence import occurrence_conflicts, series_window
+
+        checks = {
+            'conflict': Exists(cls.conflicting(space, start_time, end_time, exclude_id)),
+            'series_nearby': Exists(
+                series_window([space.pk], start_time - BOOKING_MIN_GAP, end_time + BOOKING_MIN_GAP)
+            ),
+        }
+        if user is not None:
+            checks.update(cls._active_counts(user, space))
+        state = Space.objects.filter(pk=space.pk).annotate(**checks).values(*checks).get()
+        conflict = state['conflict'] or (
+            state['series_nearby'] and bool(occurrence_conflicts(space.pk, start_time, end_time))
+        )
+        return conflict, state.get('active_bookings', 0) + state.get('active_series', 0)
+
+    @classmethod
+    def active_for(cls, user, space):
+        """Число активных броней пользователя в пространстве: будущие брони и действующие серии"""
+        counts = cls._active_counts(user, space)
+        state = Space.objects.filter(pk=space.pk).annotate(**counts).values(*counts).get()
+        return state['active_bookings'] + state['active_series']
+
     @classmethod
     def cleanup_old_bookings(cls, days_old=1):
         """
-        Автоматически удаляет бронирования, которые уже прошли
+        Удаляет бронирования, которые уже прошли, порциями (см. booking/retention.py).
+        Если очистку уже выполняет другой процесс, ничего не удаляет
+        """
+        from .retention import BatchDeleter, retention_lock
+
+        with retention_lock() as acquired:
+            if not acquired:
+                return 0
+            return BatchDeleter.older_than(days_old).run().deleted
+
+    @classmethod
+    def delete_ids(cls, ids, using=None):
+        """
+        Удаляет брони по id одним DELETE ... WHERE id IN (...), без загрузки
+        объектов и сигналов post_delete: для порций очистки и массовых операций.
+        На брони не ссылаются другие таблицы, поэтому сбор связанных объектов
+        (Collector) не нужен. Версии расписания и лент, события и сводки
+        вызывающий код обновляет сам. Возвращает число удаленных строк
         """
-        cutoff_time = timezone.now() - timedelta(days=days_old)
-        old_bookings = cls.objects.filter(start_time__lt=cutoff_time)
-        deleted_count = old_bookings.delete()[0]
-        
-        if deleted_count > 0:
-            print(f"Автоматически удалено {deleted_count} старых бронирований")
-        
-        return deleted_count
+        if not ids:
+            return 0
+        connection = connections[using or router.db_for_write(cls)]
+        quote = connection.ops.quote_name
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(cls._meta.db_table)} WHERE {quote(cls._meta.pk.column)} IN ({placeholders})',
+                list(ids)
+            )
+            return cursor.rowcount
 
     def __str__(self):
         return f"{self.user.username} - {self.space.name}"
+
+
+class BookingSeries(models.Model):
+    """
+    Повторяющаяся бронь: первое вхождение, правило повторения и последний день.
+    Вхождения не хранятся в таблице броней, их разворачивает booking/recurrence.py
+    """
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    FREQUENCY_CHOICES = [
+        (DAILY, 'Daily'),
+        (WEEKLY, 'Weekly'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    space = models.ForeignKey(Space, on_delete=models.CASCADE)
+    start_time = models.DateTimeField()  # первое вхождение
+    duration = models.PositiveIntegerField()  # in minutes
+    description = models.TextField()
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default=WEEKLY)
+    interval = models.PositiveSmallIntegerField(default=1)  # каждые N дней/недель
+    weekdays = models.CharField(max_length=13, blank=True)  # дни недели через запятую, 0 - понедельник
+    until = models.DateField()  # последний день серии, включительно
+
+    class Meta:
+        ordering = ['start_time']
+        indexes = [
+            models.Index(fields=['space', 'until'], name='series_space_until_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.space.name} ({self.get_frequency_display()})"
+
+
+class SeriesException(models.Model):
+    """День, в который вхождение серии отменено"""
+    series = models.ForeignKey(BookingSeries, on_delete=models.CASCADE, related_name='exceptions')
+    date = models.DateField()
+
+    class Meta:
+        ordering = ['date']
+        unique_together = [('series', 'date')]
+
+    def __str__(self):
+        return f"{self.series} - {self.date}"
+
+
+class SpaceUtilization(models.Model):
+    """
+    Сводка использования пространства за час местного времени: занятые
+    минуты и число броней, начавшихся в этот час (booking/utilization.py)
+    """
+    space = models.ForeignKey(Space, on_delete=models.CASCADE)
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()  # 0-23, 24 - итог дня
+    # Не Positive: изменения применяются прибавлением, в том числе отрицательных значений
+    booked_minutes = models.IntegerField(default=0)
+    bookings = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['space', 'date', 'hour']
+        constraints = [
+            models.UniqueConstraint(fields=['space', 'date', 'hour'], name='utilization_space_date_hour_uniq'),
+        ]
+        indexes = [
+            # Отчет по всем пространствам: итоги дней (hour=24) за диапазон дат
+            models.Index(fields=['hour', 'date'], name='utilization_hour_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.space_id} {self.date} {self.hour}:00"
+
+
+class FeedToken(models.Model):
+    """
+    Секрет адреса календарной ленты пользователя (booking/feeds.py).
+    Случайный и хранится в базе: новый секрет (regenerate) сразу отзывает
+    прежний адрес, а смена SECRET_KEY адреса не меняет
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='feed_token')
+    key = models.CharField(max_length=40, unique=True)
+    created = models.DateTimeField(auto_now=True)
+
+    @staticmethod
+    def generate_key():
+        return secrets.token_hex(20)
+
+    @classmethod
+    def for_user(cls, user):
+        token, _ = cls.objects.get_or_create(user=user, defaults={'key': cls.generate_key()})
+        return token
+
+    @classmethod
+    def regenerate(cls, user):
+        token, _ = cls.objects.update_or_create(user=user, defaults={'key': cls.generate_key()})
+        return token
+
+    def __str__(self):
+        return f"{self.user_id} feed token"
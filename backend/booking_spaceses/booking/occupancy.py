@@ -0,0 +1,108 @@
+"""
+Занятость пространств за диапазон дат в виде битовых карт.
+
+Рабочий день пространства (work_start - work_end) делится на ячейки по
+granularity минут. Ячейка занята, если ее пересекает хотя бы одна бронь.
+Битовая карта дня - hex-строка: старший бит первого символа - первая
+ячейка дня, хвост строки дополнен нулями до целого символа.
+
+Брони всех пространств читаются одним запросом, отсортированными по
+(space_id, start_time), к ним подмешиваются вхождения серий за диапазон
+(booking/recurrence.py), и каждое пространство обрабатывается за один проход.
+"""
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .availability import days_between
+from .models import Booking
+from .recurrence import occurrences_between, merge_by_start
+
+
+def range_bounds(date_from, date_to):
+    start = timezone.make_aware(datetime.combine(date_from, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    return start, end
+
+
+def cells_per_day(space, granularity):
+    minutes = (
+        datetime.combine(datetime.min, space.work_end) - datetime.combine(datetime.min, space.work_start)
+    ).total_seconds() // 60
+    return max(0, -(-int(minutes) // granularity))
+
+
+def space_bitmaps(space, bookings, date_from, date_to, granularity):
+    """
+    Битовые карты одного пространства по дням.
+
+    bookings - брони пространства, отсортированные по start_time.
+    """
+    step = timedelta(minutes=granularity)
+    cells = cells_per_day(space, granularity)
+    total_bits = -(-cells // 4) * 4
+    windows = []
+    for day in days_between(date_from, date_to):
+        windows.append((
+            day,
+            timezone.make_aware(datetime.combine(day, space.work_start)),
+            timezone.make_aware(datetime.combine(day, space.work_end)),
+        ))
+
+    bitmaps = [0] * len(windows)
+    first = 0
+    for booking in bookings:
+        # Дни, закончившиеся до начала брони, больше не понадобятся
+        while first < len(windows) and windows[first][2] <= booking.start_time:
+            first += 1
+        position = first
+        while position < len(windows) and windows[position][1] < booking.end_time:
+            _, window_start, window_end = windows[position]
+            start = max(booking.start_time, window_start)
+            end = min(booking.end_time, window_end)
+            if start < end:
+                low = int((start - window_start) // step)
+                high = min(cells, -(-(end - window_start) // step))
+                bitmaps[position] |= ((1 << (high - low)) - 1) << (total_bits - high)
+            position += 1
+
+    width = total_bits // 4
+    return [
+        {'date': day.isoformat(), 'bitmap': format(bitmap, f'0{width}x') if width else ''}
+        for (day, _, _), bitmap in zip(windows, bitmaps)
+    ]
+
+
+def bookings_in_range(space_ids, date_from, date_to):
+    """
+    Брони и вхождения серий, пересекающие диапазон дат,
+    сгруппированные по space_id и отсортированные по началу
+    """
+    start, end = range_bounds(date_from, date_to)
+    grouped = {space_id: [] for space_id in space_ids}
+    bookings = Booking.objects.filter(
+        space_id__in=space_ids,
+        start_time__lt=end,
+        end_time__gt=start
+    ).order_by('space_id', 'start_time', 'id')
+    for booking in bookings:
+        grouped[booking.space_id].append(booking)
+    for space_id, occurrences in occurrences_between(space_ids, start, end).items():
+        if occurrences:
+            grouped[space_id] = merge_by_start(grouped[space_id], occurrences)
+    return grouped
+
+
+def occupancy(spaces, date_from, date_to, granularity):
+    """Битовые карты занятости всех переданных пространств"""
+    grouped = bookings_in_range([space.pk for space in spaces], date_from, date_to)
+    return [
+        {
+            'space': space.pk,
+            'work_start': space.work_start.isoformat(),
+            'work_end': space.work_end.isoformat(),
+            'cells': cells_per_day(space, granularity),
+            'days': space_bitmaps(space, grouped[space.pk], date_from, date_to, granularity),
+        }
+        for space in spaces
+    ]
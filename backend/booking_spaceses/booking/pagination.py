@@ -0,0 +1,114 @@
+"""
+Keyset-пагинация списков броней по (start_time, id).
+
+Курсор - непрозрачная строка с ключом последней отданной брони. Следующая
+страница выбирается условием "(start_time, id) больше ключа курсора",
+поэтому стоимость запроса не зависит от глубины листания, а новые брони,
+вставленные между запросами, не сдвигают страницы.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def cursor_key(item):
+    """Ключ сортировки и курсора; у вхождений серий нет id, они идут перед бронями с тем же началом"""
+    return item.start_time, item.pk or 0
+
+
+def encode_cursor(item):
+    start_time, item_id = cursor_key(item)
+    payload = json.dumps([start_time.isoformat(), item_id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        start_time, booking_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        start_time = parse_datetime(start_time)
+        if start_time is None:
+            raise ValueError(cursor)
+        return start_time, int(booking_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise NotFound("Invalid cursor.")
+
+
+class BookingCursorPagination(BasePagination):
+    """
+    Пагинация включается параметром ?cursor= или ?page_size=, без них
+    эндпоинт отдает весь список, как раньше (optional = False - всегда).
+    """
+    page_size = 100
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    optional = True
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.optional and self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = params.get(self.cursor_query_param)
+        key = decode_cursor(cursor) if cursor else None
+
+        if isinstance(queryset, list):
+            # Расписание дня с вхождениями серий уже отсортировано по cursor_key
+            if key is not None:
+                queryset = [item for item in queryset if cursor_key(item) > key]
+            page = queryset[:page_size + 1]
+        else:
+            queryset = queryset.order_by('start_time', 'id')
+            if key is not None:
+                start_time, booking_id = key
+                queryset = queryset.filter(start_time__gte=start_time).exclude(
+                    start_time=start_time, id__lte=booking_id
+                )
+            page = list(queryset[:page_size + 1])
+
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_cursor = encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class AdminBookingCursorPagination(BookingCursorPagination):
+    optional = False
@@ -0,0 +1,278 @@
+"""
+Повторяющиеся брони (серии).
+
+Серия - одна строка BookingSeries: первое вхождение, правило повторения
+(каждые interval дней или недель, для недельных - дни недели weekdays),
+последний день until и отмененные дни SeriesException. Вхождения не
+сохраняются в таблицу броней: для запрошенного окна они разворачиваются
+на лету в объекты Occurrence, у которых те же поля времени, что и у брони.
+
+Вхождение начинается в то же местное время, что и первое, поэтому при
+переходе на летнее время серия остается "в 10:00 по часам".
+
+Проверка конфликтов:
+- бронь против серий - один запрос серий пространства, пересекающих окно
+  брони, и разворот каждой серии только на дни окна;
+- серия против броней - один запрос броней за весь период серии и слияние
+  двух отсортированных списков за один проход;
+- серия против серий - серии-кандидаты отсекаются без разворота по дням
+  недели и времени суток, остальные разворачиваются только на общий период.
+"""
+import heapq
+from datetime import datetime, timedelta
+
+from django.db.models import Count, prefetch_related_objects
+from django.utils import timezone
+
+from .models import Booking, BookingSeries, BOOKING_MIN_GAP
+
+DAY = timedelta(days=1)
+
+
+class Occurrence:
+    """Вхождение серии в конкретный день"""
+    pk = None
+
+    def __init__(self, series, start_time):
+        self.series = series
+        self.series_id = series.pk
+        self.user_id = series.user_id
+        self.space_id = series.space_id
+        self.start_time = start_time
+        self.duration = series.duration
+        self.end_time = start_time + timedelta(minutes=series.duration)
+        self.description = series.description
+
+    def __repr__(self):
+        return f'<Occurrence series={self.series_id} start={self.start_time.isoformat()}>'
+
+    @property
+    def space(self):
+        return self.series.space
+
+    @property
+    def user(self):
+        return self.series.user
+
+
+def parse_weekdays(value):
+    """'0,2,4' -> {0, 2, 4}; 0 - понедельник"""
+    return {int(day) for day in value.split(',') if day.strip()} if value else set()
+
+
+def start_date(series):
+    return timezone.localtime(series.start_time).date()
+
+
+def weekdays(series):
+    """Дни недели серии; у недельной серии без weekdays - день первого вхождения"""
+    days = parse_weekdays(series.weekdays)
+    return days or {start_date(series).weekday()}
+
+
+def skipped_days(series):
+    # Исключения берутся из prefetch_related, если он был
+    return {exception.date for exception in series.exceptions.all()} if series.pk else set()
+
+
+def series_days(series, date_from, date_to, skipped=None):
+    """Дни вхождений серии в диапазоне [date_from, date_to]"""
+    first_day = start_date(series)
+    day = max(date_from, first_day)
+    last = min(date_to, series.until)
+    skipped = skipped_days(series) if skipped is None else skipped
+    interval = max(series.interval, 1)
+
+    if series.frequency == BookingSeries.DAILY:
+        offset = (day - first_day).days % interval
+        if offset:
+            day += timedelta(days=interval - offset)
+        while day <= last:
+            if day not in skipped:
+                yield day
+            day += timedelta(days=interval)
+        return
+
+    allowed = weekdays(series)
+    anchor = first_day - timedelta(days=first_day.weekday())  # понедельник первой недели
+    while day <= last:
+        if day.weekday() in allowed and ((day - anchor).days // 7) % interval == 0 and day not in skipped:
+            yield day
+        day += DAY
+
+
+def occurrence_at(series, day):
+    local_start = timezone.localtime(series.start_time).time()
+    return Occurrence(series, timezone.make_aware(datetime.combine(day, local_start)))
+
+
+def expand(series, start, end):
+    """Вхождения серии, пересекающие интервал [start, end)"""
+    # Вхождение длится меньше суток, поэтому достаточно захватить предыдущий день
+    date_from = timezone.localtime(start).date() - DAY
+    date_to = timezone.localtime(end).date()
+    occurrences = []
+    for day in series_days(series, date_from, date_to):
+        occurrence = occurrence_at(series, day)
+        if occurrence.start_time < end and occurrence.end_time > start:
+            occurrences.append(occurrence)
+    return occurrences
+
+
+def series_window(space_ids, start, end):
+    """Запрос серий пространств, у которых могут быть вхождения в [start, end)"""
+    return BookingSeries.objects.filter(
+        space_id__in=space_ids,
+        start_time__lt=end,
+        until__gte=timezone.localtime(start).date() - DAY
+    )
+
+
+def series_between(space_ids, start, end, exclude_id=None):
+    """
+    Серии пространств, у которых могут быть вхождения в [start, end).
+    Исключения подгружаются вторым запросом, только если серии нашлись.
+    """
+    queryset = series_window(space_ids, start, end)
+    if exclude_id is not None:
+        queryset = queryset.exclude(pk=exclude_id)
+    series_list = list(queryset)
+    if series_list:
+        prefetch_related_objects(series_list, 'exceptions')
+    return series_list
+
+
+def series_occurrences(series_list, start=None, end=None):
+    """
+    Вхождения серий в [start, end), отсортированные по началу. Без границ -
+    от первого вхождения до последнего дня серии
+    """
+    occurrences = []
+    for series in series_list:
+        last = timezone.make_aware(datetime.combine(series.until + DAY, datetime.min.time()))
+        occurrences.extend(expand(series, start or series.start_time, end or last))
+    occurrences.sort(key=lambda occurrence: occurrence.start_time)
+    return occurrences
+
+
+def occurrences_between(space_ids, start, end):
+    """Вхождения серий, пересекающие [start, end), по space_id, отсортированные по началу"""
+    grouped = {space_id: [] for space_id in space_ids}
+    for series in series_between(space_ids, start, end):
+        grouped[series.space_id].extend(expand(series, start, end))
+    for occurrences in grouped.values():
+        occurrences.sort(key=lambda occurrence: occurrence.start_time)
+    return grouped
+
+
+def active_series(user, space_ids):
+    """
+    Число действующих серий пользователя по пространствам. Для лимита
+    BOOKING_MAX_ACTIVE серия считается одной активной бронью
+    """
+    return dict(
+        BookingSeries.objects.filter(user=user, space_id__in=space_ids, until__gte=timezone.localdate())
+        .order_by().values('space_id').annotate(total=Count('id')).values_list('space_id', 'total')
+    )
+
+
+def merge_by_start(*sorted_lists):
+    """Слияние списков, отсортированных по start_time"""
+    return list(heapq.merge(*sorted_lists, key=lambda item: item.start_time))
+
+
+def occurrence_conflicts(space_id, start_time, end_time, exclude_series_id=None):
+    """Вхождения серий, которые пересекаются с интервалом с учетом минимального промежутка"""
+    start, end = start_time - BOOKING_MIN_GAP, end_time + BOOKING_MIN_GAP
+    conflicts = []
+    for series in series_between([space_id], start, end, exclude_id=exclude_series_id):
+        conflicts.extend(expand(series, start, end))
+    return conflicts
+
+
+def first_overlap(left, right, gap=BOOKING_MIN_GAP):
+    """
+    Первая пара пересекающихся интервалов из двух списков, отсортированных
+    по start_time, в которых интервалы не пересекаются между собой.
+    Один проход слиянием: сдвигается тот список, чей интервал кончается раньше.
+    """
+    i = j = 0
+    while i < len(left) and j < len(right):
+        a, b = left[i], right[j]
+        if a.start_time < b.end_time + gap and b.start_time < a.end_time + gap:
+            return a, b
+        if a.end_time <= b.end_time:
+            i += 1
+        else:
+            j += 1
+    return None
+
+
+def _time_window(series):
+    """
+    Местное время вхождения в секундах от полуночи или None, если вхождение
+    вместе с минимальным промежутком выходит за пределы своих суток
+    """
+    local_start = timezone.localtime(series.start_time)
+    gap = BOOKING_MIN_GAP.total_seconds()
+    start = local_start.hour * 3600 + local_start.minute * 60 + local_start.second
+    end = start + series.duration * 60
+    if start - gap < 0 or end + gap > DAY.total_seconds():
+        return None
+    return start, end
+
+
+def _cannot_meet(series, other):
+    """Быстрая проверка без разворота: серии не сходятся по времени суток или дням недели"""
+    window, other_window = _time_window(series), _time_window(other)
+    if window is None or other_window is None:
+        return False
+    gap = BOOKING_MIN_GAP.total_seconds()
+    if window[1] + gap <= other_window[0] or other_window[1] + gap <= window[0]:
+        return True
+    if series.frequency == BookingSeries.WEEKLY and other.frequency == BookingSeries.WEEKLY:
+        return not weekdays(series) & weekdays(other)
+    return False
+
+
+def series_conflict(series):
+    """
+    Первое вхождение серии, которое конфликтует с бронью или с другой серией
+    пространства, или None. Серия может быть еще не сохранена.
+    """
+    occurrences = [occurrence_at(series, day) for day in series_days(series, start_date(series), series.until)]
+    if not occurrences:
+        return None
+    period_start = occurrences[0].start_time - BOOKING_MIN_GAP
+    period_end = occurrences[-1].end_time + BOOKING_MIN_GAP
+
+    bookings = list(
+        Booking.objects.filter(
+            space_id=series.space_id,
+            start_time__lt=period_end,
+            end_time__gt=period_start
+        ).order_by('start_time').only('id', 'start_time', 'end_time')
+    )
+    overlap = first_overlap(occurrences, bookings)
+    if overlap:
+        return overlap[0]
+
+    for other in series_between([series.space_id], period_start, period_end, exclude_id=series.pk):
+        if _cannot_meet(series, other):
+            continue
+        # Разворачиваем только общий период двух серий
+        common_start = max(period_start, other.start_time - BOOKING_MIN_GAP)
+        other_occurrences = expand(other, common_start, period_end)
+        own = [
+            occurrence for occurrence in occurrences
+            if occurrence.end_time + BOOKING_MIN_GAP > common_start
+        ]
+        overlap = first_overlap(own, other_occurrences)
+        if overlap:
+            return overlap[0]
+    return None
+
+
+def series_schedule_days(series):
+    """Пары (space_id, день) всех вхождений серии - для смены версий расписания"""
+    return {(series.space_id, day) for day in series_days(series, start_date(series), series.until, skipped=set())}
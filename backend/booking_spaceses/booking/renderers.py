@@ -0,0 +1,28 @@
+"""
+Быстрый JSON-рендерер.
+
+Если установлен orjson, ответы кодируются им (в несколько раз быстрее
+стандартного json); значения, которые orjson не знает (ленивые строки
+переводов, Decimal и т.п.), передаются кодировщику DRF. Без orjson
+рендерер работает как обычный JSONRenderer.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+else:
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Отступы (?indent / Accept: ...; indent=4) поддерживает только обычный рендерер
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Даты и время кодирует DRF, чтобы формат не отличался от JSONRenderer
+        return orjson.dumps(data, default=JSONEncoder().default, option=ORJSON_OPTIONS)
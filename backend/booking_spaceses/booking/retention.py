@@ -0,0 +1,272 @@
+"""
+Фоновая очистка старых бронирований.
+
+Удаление устаревших броней не выполняется ни при создании брони, ни при
+запуске приложения. Вместо этого его выполняет отдельный воркер: команда
+``python manage.py run_retention`` или поток внутри процесса
+(BOOKING_RETENTION_IN_PROCESS). Одновременно очистку выполняет только один
+процесс - это гарантирует блокировка retention_lock(), которую берут воркер,
+команда cleanup_old_bookings, скрипт cleanup_bookings.py и
+Booking.cleanup_old_bookings().
+
+Сами брони удаляет BatchDeleter: порциями по первичному ключу, с паузой между
+порциями и ограничением по времени. После каждой порции клиенты push-канала
+получают booking.deleted, в конце прохода меняются версии расписания и лент.
+Сводки использования (booking/utilization.py) не меняются: аналитика
+переживает удаление броней.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка через кеш
+    fcntl = None
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from booking_spaceses.metrics import RETENTION_DELETED
+
+from .archive import ArchiveWriter
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки PostgreSQL и кеша для очистки
+RETENTION_LOCK_ID = 0x626f6f6b
+RETENTION_LOCK_KEY = 'booking:retention-lock'
+
+
+@contextmanager
+def retention_lock():
+    """
+    Неблокирующая блокировка очистки между процессами.
+
+    Возвращает True, если блокировка получена. В PostgreSQL используется
+    advisory-блокировка сессии. В остальных базах - атомарный cache.add(),
+    если кеш общий для процессов, иначе flock файла BOOKING_RETENTION_LOCK_FILE:
+    cache.add() в LocMemCache исключает только потоки своего процесса, а
+    SQLite доступна только процессам одного сервера.
+    """
+    from accounts.authentication import shared_cache_configured
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [RETENTION_LOCK_ID])
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', [RETENTION_LOCK_ID])
+        return
+
+    if fcntl is not None and not shared_cache_configured():
+        with open(settings.BOOKING_RETENTION_LOCK_FILE, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return
+
+    acquired = cache.add(RETENTION_LOCK_KEY, True, settings.BOOKING_RETENTION_INTERVAL)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(RETENTION_LOCK_KEY)
+
+
+@dataclass
+class DeletionProgress:
+    """Состояние удаления; last_pk позволяет продолжить прерванный запуск"""
+    matched: int = 0
+    deleted: int = 0
+    archived: int = 0
+    batches: int = 0
+    last_pk: int = 0
+    elapsed: float = 0.0
+    finished: bool = False
+
+
+class BatchDeleter:
+    """
+    Удаляет брони со start_time < cutoff порциями по первичному ключу.
+
+    Каждая порция - отдельная короткая транзакция, поэтому блокировки не
+    держатся долго, а прерванный запуск можно продолжить с last_pk (или
+    просто запустить заново: уже удаленные строки не найдутся).
+    В режиме dry_run порции только считаются. В режиме archive каждая
+    порция перед удалением выгружается в архив (booking/archive.py).
+    """
+
+    def __init__(self, cutoff, batch_size=None, sleep=None, time_budget=None,
+                 dry_run=False, start_after=0, progress=None, archive=False):
+        self.cutoff = cutoff
+        self.batch_size = batch_size or settings.BOOKING_RETENTION_BATCH_SIZE
+        self.sleep = settings.BOOKING_RETENTION_BATCH_SLEEP if sleep is None else sleep
+        self.time_budget = time_budget
+        self.dry_run = dry_run
+        self.start_after = start_after
+        self.progress = progress
+        self.archive = archive
+
+    @classmethod
+    def older_than(cls, days_old, **kwargs):
+        return cls(timezone.now() - timedelta(days=days_old), **kwargs)
+
+    def queryset(self):
+        from .models import Booking
+
+        return Booking.objects.filter(start_time__lt=self.cutoff)
+
+    def next_batch(self, last_pk):
+        return list(
+            self.queryset()
+            .filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', 'space_id', 'user_id', 'start_time')[:self.batch_size]
+        )
+
+    def delete_batch(self, pks):
+        """
+        Удаляет порцию одним DELETE (Booking.delete_ids) без сигналов
+        post_delete: события и версии расписания и лент - в run()
+        """
+        from .models import Booking
+
+        with transaction.atomic():
+            return Booking.delete_ids(pks, using=self.queryset().db)
+
+    @staticmethod
+    def announce(batch):
+        """События booking.deleted удаленной порции для push-канала"""
+        from . import events, schedule
+
+        for pk, space_id, _, start_time in batch:
+            events.publish('booking.deleted', space_id, {schedule.booking_day(start_time)}, booking={'id': pk})
+
+    def run(self):
+        from . import schedule
+        from .export import SPACE_FEED, USER_FEED, bump_feeds
+
+        state = DeletionProgress(last_pk=self.start_after)
+        touched_days = set()
+        touched_feeds = set()
+        started = time.monotonic()
+        writer = ArchiveWriter() if self.archive and not self.dry_run else None
+        try:
+            while True:
+                batch = self.next_batch(state.last_pk)
+                if not batch:
+                    state.finished = True
+                    break
+                pks = [pk for pk, _, _, _ in batch]
+                state.matched += len(pks)
+                if writer is not None:
+                    # Порция удаляется только после записи архива на диск
+                    writer.write_queryset(self.queryset().filter(pk__in=pks))
+                    writer.flush()
+                    state.archived = writer.written
+                if not self.dry_run:
+                    deleted = self.delete_batch(pks)
+                    state.deleted += deleted
+                    RETENTION_DELETED.inc(deleted)
+                    self.announce(batch)
+                    for _, space_id, user_id, start_time in batch:
+                        touched_days.add((space_id, schedule.booking_day(start_time)))
+                        touched_feeds.update({(SPACE_FEED, space_id), (USER_FEED, user_id)})
+                state.batches += 1
+                state.last_pk = pks[-1]
+                state.elapsed = time.monotonic() - started
+                if self.progress:
+                    self.progress(state)
+                if len(batch) < self.batch_size:
+                    state.finished = True
+                    break
+                if self.time_budget is not None and state.elapsed >= self.time_budget:
+                    break
+                if self.sleep:
+                    time.sleep(self.sleep)
+        finally:
+            if writer is not None:
+                writer.close()
+            state.elapsed = time.monotonic() - started
+            schedule.bump(touched_days)
+            bump_feeds(touched_feeds)
+        return state
+
+
+def run_retention(days_old=None):
+    """
+    Один проход очистки. Возвращает число удаленных броней
+    или None, если очистку сейчас выполняет другой процесс.
+    """
+    if days_old is None:
+        days_old = settings.BOOKING_RETENTION_DAYS
+    with retention_lock() as acquired:
+        if not acquired:
+            logger.info("Очистка броней уже выполняется другим процессом")
+            return None
+        state = BatchDeleter.older_than(
+            days_old,
+            time_budget=settings.BOOKING_RETENTION_TIME_BUDGET,
+            archive=settings.BOOKING_RETENTION_ARCHIVE
+        ).run()
+        logger.info(
+            "Удалено %s старых бронирований за %.1f с (порций: %s, завершено: %s)",
+            state.deleted, state.elapsed, state.batches, state.finished
+        )
+        return state.deleted
+
+
+class RetentionWorker(threading.Thread):
+    """Поток, который выполняет очистку раз в interval секунд"""
+
+    def __init__(self, interval=None, days_old=None):
+        super().__init__(name='booking-retention', daemon=True)
+        self.interval = interval or settings.BOOKING_RETENTION_INTERVAL
+        self.days_old = days_old
+        self._stopped = threading.Event()
+
+    def run(self):
+        # Первый проход - через interval, чтобы не нагружать базу при старте
+        while not self._stopped.wait(self.interval):
+            try:
+                run_retention(self.days_old)
+            except Exception:
+                logger.exception("Ошибка фоновой очистки броней")
+            finally:
+                connection.close()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_retention_worker(**kwargs):
+    """
+    Запускает поток очистки в текущем процессе (один раз).
+    Подключается к сигналу request_started, чтобы не работать при импорте.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = RetentionWorker()
+            _worker.start()
+    return _worker
@@ -0,0 +1,103 @@
+"""
+Версии расписания пространства по дням.
+
+Для каждой пары (пространство, день) в кеше Django хранится версия -
+случайная строка, которая меняется при создании, изменении или удалении
+брони, начинающейся в этот день. Версия служит ETag расписания дня
+(SpaceBookingsView) и ключом кеша сериализованного ответа, поэтому
+неизменившийся день отдается без запроса броней.
+
+Версии хранятся в кеше, только если он общий для процессов (versioned()).
+С LocMemCache сигналы меняют версию только в своем процессе, и другие
+воркеры отдавали бы 304 и старый ответ до истечения версии. Тогда версия -
+хеш содержимого дня (content_version): расписание каждый раз читается из
+базы, а 304 экономит только передачу ответа.
+"""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from accounts.authentication import shared_cache_configured
+from booking_spaceses.metrics import cache_lookup
+
+VERSION_KEY = 'booking:schedule:version:{space_id}:{day}'
+PAYLOAD_KEY = 'booking:schedule:payload:{space_id}:{day}:{version}'
+
+
+def booking_day(start_time):
+    """День расписания, в котором показывается бронь"""
+    return timezone.localtime(start_time).date()
+
+
+def versioned():
+    return shared_cache_configured()
+
+
+def content_version(data):
+    """Версия по содержимому расписания дня"""
+    payload = json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+    return hashlib.md5(payload).hexdigest()
+
+
+def get_version(space_id, day):
+    return cache.get_or_set(
+        VERSION_KEY.format(space_id=space_id, day=day.isoformat()),
+        uuid.uuid4().hex,
+        settings.BOOKING_SCHEDULE_CACHE_TTL
+    )
+
+
+async def aget_version(space_id, day):
+    return await cache.aget_or_set(
+        VERSION_KEY.format(space_id=space_id, day=day.isoformat()),
+        uuid.uuid4().hex,
+        settings.BOOKING_SCHEDULE_CACHE_TTL
+    )
+
+
+def bump(pairs):
+    """Меняет версии для набора пар (space_id, день)"""
+    cache.set_many(
+        {
+            VERSION_KEY.format(space_id=space_id, day=day.isoformat()): uuid.uuid4().hex
+            for space_id, day in pairs
+        },
+        settings.BOOKING_SCHEDULE_CACHE_TTL
+    )
+
+
+def etag(space_id, day, version):
+    return f'"{space_id}-{day.isoformat()}-{version}"'
+
+
+def get_payload(space_id, day, version):
+    return cache_lookup(
+        'schedule', cache.get(PAYLOAD_KEY.format(space_id=space_id, day=day.isoformat(), version=version))
+    )
+
+
+async def aget_payload(space_id, day, version):
+    return cache_lookup(
+        'schedule', await cache.aget(PAYLOAD_KEY.format(space_id=space_id, day=day.isoformat(), version=version))
+    )
+
+
+def set_payload(space_id, day, version, data):
+    cache.set(
+        PAYLOAD_KEY.format(space_id=space_id, day=day.isoformat(), version=version),
+        data,
+        settings.BOOKING_SCHEDULE_CACHE_TTL
+    )
+
+
+async def aset_payload(space_id, day, version, data):
+    await cache.aset(
+        PAYLOAD_KEY.format(space_id=space_id, day=day.isoformat(), version=version),
+        data,
+        settings.BOOKING_SCHEDULE_CACHE_TTL
+    )
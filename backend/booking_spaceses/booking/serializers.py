@@ -1,15 +1,37 @@
 from rest_framework import serializers
-from .models import Space, Booking
+from django.conf import settings
+from django.db import transaction, OperationalError
+from .models import (
+    Space, Booking, BookingSeries, SeriesException, BOOKING_MIN_GAP, BOOKING_MAX_DURATION, BOOKING_MAX_ACTIVE
+)
+from .flat import BOOKING_FLAT, OCCURRENCE_FLAT
+from .images import variant_urls
+from .recurrence import Occurrence, series_conflict, series_days, parse_weekdays, start_date
+from .exceptions import BookingConflict
 import base64
+import time
+from datetime import timedelta
 from django.core.files.base import ContentFile
 
 
+PAST_ERROR = "Booking cannot be in the past."
+OVERLAP_ERROR = "Time slot is already booked or too close to another booking (min 15 min gap required)."
+WORKING_HOURS_ERROR = "Booking must be within working hours: {work_start} - {work_end}."
+ACTIVE_LIMIT_ERROR = "You cannot have more than 2 active bookings for this space."
+SERIES_LIMIT_ERROR = "You cannot have more than 2 active bookings and series for this space."
+DURATION_ERROR = "Booking duration cannot exceed 2 hours (120 minutes)."
+
+
 class SpaceSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(read_only=True)  # Теперь возвращает URL
+    images = serializers.SerializerMethodField()  # Уменьшенные копии по размерам
 
     class Meta:
         model = Space
-        fields = ['id', 'name', 'description', 'image', 'work_start', 'work_end']
+        fields = ['id', 'name', 'description', 'image', 'images', 'work_start', 'work_end']
+
+    def get_images(self, obj):
+        return variant_urls()(obj.image_variants)
 
 
 class BookingSerializer(serializers.ModelSerializer):
@@ -27,7 +49,7 @@ class BookingSerializer(serializers.ModelSerializer):
 
         # Базовые проверки для всех пользователей
         if data['start_time'] < timezone.now():
-            raise serializers.ValidationError("Booking cannot be in the past.")
+            raise serializers.ValidationError(PAST_ERROR, code='past')
 
         space = data['space']
         start_time = data['start_time']
@@ -35,16 +57,14 @@ class BookingSerializer(serializers.ModelSerializer):
         end_time = start_time + timedelta(minutes=duration)
 
         # Проверка пересечений слотов (обязательна для всех)
-        min_gap = timedelta(minutes=15)
-        overlapping = Booking.objects.filter(
-            space=space,
-            start_time__lt=end_time + min_gap,
-            end_time__gt=start_time - min_gap
+        exclude_id = self.instance.id if self.instance else None
+        # Одним запросом: пересечения с бронями и сериями и число активных
+        # броней и серий для проверки лимита
+        conflict, active_bookings = Booking.slot_state(
+            space, start_time, end_time, user=None if is_superuser else user, exclude_id=exclude_id
         )
-        if self.instance:
-            overlapping = overlapping.exclude(id=self.instance.id)
-        if overlapping.exists():
-            raise serializers.ValidationError("Time slot is already booked or too close to another booking (min 15 min gap required).")
+        if conflict:
+            raise serializers.ValidationError(OVERLAP_ERROR, code='overlap')
 
         # Для НЕ-суперпользователей применяем дополнительные ограничения
         if not is_superuser:
@@ -52,23 +72,192 @@ class BookingSerializer(serializers.ModelSerializer):
             work_start = space.work_start
             work_end = space.work_end
             if not (work_start <= start_time.time() < work_end and work_start < end_time.time() <= work_end):
-                raise serializers.ValidationError(f"Booking must be within working hours: {work_start} - {work_end}.")
+                raise serializers.ValidationError(
+                    WORKING_HOURS_ERROR.format(work_start=work_start, work_end=work_end), code='working_hours'
+                )
 
             # Проверка лимита бронирований
-            active_bookings = Booking.objects.filter(
-                user=user,
-                space=space,
-                start_time__gt=timezone.now()
-            ).count()
-            if not self.instance and active_bookings >= 2:
-                raise serializers.ValidationError("You cannot have more than 2 active bookings for this space.")
+            if not self.instance and active_bookings >= BOOKING_MAX_ACTIVE:
+                raise serializers.ValidationError(ACTIVE_LIMIT_ERROR, code='active_limit')
 
             # Проверка длительности
-            if duration > 120:
-                raise serializers.ValidationError("Booking duration cannot exceed 2 hours (120 minutes).")
+            if duration > BOOKING_MAX_DURATION:
+                raise serializers.ValidationError(DURATION_ERROR, code='duration')
 
         return data
 
     def create(self, validated_data):
-        validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
+        user = validated_data['user'] = self.context['request'].user
+        space = validated_data['space']
+        start_time = validated_data['start_time']
+        end_time = start_time + timedelta(minutes=validated_data['duration'])
+        attempts = settings.BOOKING_CREATE_ATTEMPTS
+
+        for attempt in range(1, attempts + 1):
+            try:
+                with transaction.atomic():
+                    # Блокировка строки пространства выстраивает создание броней
+                    # одного пространства в очередь, поэтому повторная проверка
+                    # пересечений и лимита активных броней и вставка выполняются без гонки
+                    Space.objects.select_for_update().only('id').get(pk=space.pk)
+                    conflict, active_bookings = Booking.slot_state(
+                        space, start_time, end_time, user=None if user.is_superuser else user
+                    )
+                    if conflict:
+                        raise BookingConflict()
+                    if active_bookings >= BOOKING_MAX_ACTIVE:
+                        raise serializers.ValidationError(ACTIVE_LIMIT_ERROR, code='active_limit')
+                    return super().create(validated_data)
+            except OperationalError:
+                # Взаимная блокировка или таймаут ожидания блокировки
+                if attempt == attempts:
+                    raise BookingConflict("Space is busy, please retry the booking.")
+                time.sleep(0.05 * attempt)
+
+
+class AdminBookingSerializer(BookingSerializer):
+    class Meta(BookingSerializer.Meta):
+        fields = BookingSerializer.Meta.fields + ['user', 'end_time']
+        read_only_fields = ['user', 'end_time']
+
+
+class OccurrenceSerializer(serializers.Serializer):
+    """Вхождение серии в расписании: поля брони без id и с номером серии"""
+    id = serializers.ReadOnlyField(source='pk')
+    series = serializers.ReadOnlyField(source='series_id')
+    space = serializers.ReadOnlyField(source='space_id')
+    start_time = serializers.DateTimeField(read_only=True)
+    duration = serializers.ReadOnlyField()
+    description = serializers.ReadOnlyField()
+
+
+def schedule_data(items):
+    """
+    Брони и вхождения серий в формате расписания, в порядке items.
+    Формы ответов BookingSerializer и OccurrenceSerializer без их накладных расходов
+    """
+    booking, occurrence = BOOKING_FLAT.bound(), OCCURRENCE_FLAT.bound()
+    return [occurrence(item) if isinstance(item, Occurrence) else booking(item) for item in items]
+
+
+class BookingSeriesSerializer(serializers.ModelSerializer):
+    exceptions = serializers.SlugRelatedField(many=True, read_only=True, slug_field='date')
+
+    class Meta:
+        model = BookingSeries
+        fields = [
+            'id', 'space', 'start_time', 'duration', 'description',
+            'frequency', 'interval', 'weekdays', 'until', 'exceptions'
+        ]
+        read_only_fields = ['user']
+
+    def validate_weekdays(self, value):
+        try:
+            days = parse_weekdays(value)
+        except ValueError:
+            raise serializers.ValidationError("Weekdays must be comma-separated numbers 0-6 (0 is Monday).")
+        if any(not 0 <= day <= 6 for day in days):
+            raise serializers.ValidationError("Weekdays must be comma-separated numbers 0-6 (0 is Monday).")
+        return ','.join(str(day) for day in sorted(days))
+
+    def validate_interval(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Interval must be at least 1.")
+        return value
+
+    def validate(self, data):
+        from django.utils import timezone
+
+        user = self.context['request'].user
+        series = BookingSeries(user=user, **data)
+        space = data['space']
+        start_time = data['start_time']
+        end_time = start_time + timedelta(minutes=data['duration'])
+
+        if start_time < timezone.now():
+            raise serializers.ValidationError(PAST_ERROR)
+        if data['until'] < start_date(series):
+            raise serializers.ValidationError("Series cannot end before its first occurrence.")
+        max_days = settings.BOOKING_SERIES_MAX_DAYS
+        if (data['until'] - start_date(series)).days >= max_days:
+            raise serializers.ValidationError(f"Series cannot be longer than {max_days} days.")
+        # Вхождения одной серии не должны пересекаться между собой
+        if timedelta(minutes=data['duration']) + BOOKING_MIN_GAP > timedelta(days=1):
+            raise serializers.ValidationError("Series occurrence must be shorter than a day.")
+
+        if not user.is_superuser:
+            work_start = space.work_start
+            work_end = space.work_end
+            if not (work_start <= start_time.time() < work_end and work_start < end_time.time() <= work_end):
+                raise serializers.ValidationError(WORKING_HOURS_ERROR.format(work_start=work_start, work_end=work_end))
+
+            # Серия считается одной активной бронью: общий лимит с обычными бронями
+            if Booking.active_for(user, space) >= BOOKING_MAX_ACTIVE:
+                raise serializers.ValidationError(SERIES_LIMIT_ERROR)
+
+            if data['duration'] > BOOKING_MAX_DURATION:
+                raise serializers.ValidationError(DURATION_ERROR)
+
+        if series_conflict(series) is not None:
+            raise serializers.ValidationError(OVERLAP_ERROR)
+        return data
+
+    def create(self, validated_data):
+        user = validated_data['user'] = self.context['request'].user
+        space = validated_data['space']
+        attempts = settings.BOOKING_CREATE_ATTEMPTS
+
+        for attempt in range(1, attempts + 1):
+            try:
+                with transaction.atomic():
+                    # Та же блокировка пространства, что и при создании брони
+                    Space.objects.select_for_update().only('id').get(pk=space.pk)
+                    if series_conflict(BookingSeries(**validated_data)) is not None:
+                        raise BookingConflict()
+                    if not user.is_superuser and Booking.active_for(user, space) >= BOOKING_MAX_ACTIVE:
+                        raise serializers.ValidationError(SERIES_LIMIT_ERROR)
+                    return super().create(validated_data)
+            except OperationalError:
+                if attempt == attempts:
+                    raise BookingConflict("Space is busy, please retry the booking.")
+                time.sleep(0.05 * attempt)
+
+
+class SeriesExceptionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SeriesException
+        fields = ['date']
+
+    def validate_date(self, value):
+        series = self.context['series']
+        if not start_date(series) <= value <= series.until:
+            raise serializers.ValidationError("Date is outside of the series.")
+        # Уже отмененный день допустим: повторная отмена ничего не меняет
+        if not any(series_days(series, value, value, skipped=set())):
+            raise serializers.ValidationError("Series has no occurrence on this date.")
+        return value
+
+
+class BookingBatchItemSerializer(serializers.ModelSerializer):
+    """
+    Проверка полей одной брони из пакета. Пространство - просто id:
+    пространства пакета загружаются одним запросом (booking/batch.py)
+    """
+    space = serializers.IntegerField()
+
+    class Meta:
+        model = Booking
+        fields = ['space', 'start_time', 'duration', 'description']
+
+
+class BookingBatchSerializer(serializers.Serializer):
+    MODES = ['atomic', 'partial']
+
+    mode = serializers.ChoiceField(choices=MODES, default='atomic')
+    bookings = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def validate_bookings(self, value):
+        max_size = settings.BOOKING_BATCH_MAX_SIZE
+        if len(value) > max_size:
+            raise serializers.ValidationError(f"Batch cannot contain more than {max_size} bookings.")
+        return value
@@ -1,34 +1,332 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.utils import timezone
-from datetime import timedelta
-from .models import Booking
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import Signal, receiver
+from . import events, schedule, utilization
+from .export import SPACE_FEED, booking_feeds, bump_feeds, series_feeds
+from .catalogue import invalidate_catalogue
+from .images import schedule_variants, delete_variants
+from .models import Booking, BookingSeries, SeriesException, Space
+from .recurrence import series_schedule_days
+from .flat import BOOKING_FLAT
+from .retention import run_retention
+
+# bulk_create не отправляет post_save: пакетное создание броней
+# (booking/batch.py) сообщает о новых бронях этим сигналом.
+# restored=True - брони возвращены из архива (booking/archive.py)
+bookings_bulk_created = Signal()
+# Массовые операции админки (booking/bulk.py) удаляют и переносят брони
+# запросами над набором, без post_delete и post_save на каждую бронь.
+# bookings_bulk_deleted: bookings - порция удаленных броней (bulk.DeletedBooking);
+# bookings_bulk_moved: bookings - брони в новом пространстве,
+# previous - {id брони: id прежнего пространства}
+bookings_bulk_deleted = Signal()
+bookings_bulk_moved = Signal()
+
+
+@receiver(pre_save, sender=Booking)
+def remember_schedule_day(sender, instance, **kwargs):
+    """
+    Запоминает день расписания изменяемой брони: после переноса
+    нужно сменить версию и старого дня
+    """
+    instance._schedule_previous = None
+    if instance.pk:
+        instance._schedule_previous = Booking.objects.filter(pk=instance.pk).values_list(
+            'space_id', 'start_time', 'end_time'
+        ).first()
+
+
+@receiver(post_save, sender=Booking)
+def bump_schedule_version_on_save(sender, instance, **kwargs):
+    """
+    Меняет версию расписания дня брони после фиксации транзакции
+    """
+    pairs = {(instance.space_id, schedule.booking_day(instance.start_time))}
+    previous = getattr(instance, '_schedule_previous', None)
+    if previous is not None:
+        pairs.add((previous[0], schedule.booking_day(previous[1])))
+    transaction.on_commit(lambda: schedule.bump(pairs))
+
+
+@receiver(post_delete, sender=Booking)
+def bump_schedule_version_on_delete(sender, instance, **kwargs):
+    pairs = {(instance.space_id, schedule.booking_day(instance.start_time))}
+    transaction.on_commit(lambda: schedule.bump(pairs))
+
+
+@receiver(bookings_bulk_created, sender=Booking)
+def bump_schedule_version_on_bulk_create(sender, bookings, **kwargs):
+    pairs = {(booking.space_id, schedule.booking_day(booking.start_time)) for booking in bookings}
+    transaction.on_commit(lambda: schedule.bump(pairs))
+
+
+@receiver(bookings_bulk_deleted, sender=Booking)
+def bump_schedule_version_on_bulk_delete(sender, bookings, **kwargs):
+    pairs = {(booking.space_id, schedule.booking_day(booking.start_time)) for booking in bookings}
+    transaction.on_commit(lambda: schedule.bump(pairs))
+
+
+@receiver(bookings_bulk_moved, sender=Booking)
+def bump_schedule_version_on_bulk_move(sender, bookings, previous, **kwargs):
+    pairs = set()
+    for booking in bookings:
+        day = schedule.booking_day(booking.start_time)
+        pairs.add((booking.space_id, day))
+        pairs.add((previous[booking.pk], day))
+    transaction.on_commit(lambda: schedule.bump(pairs))
+
+
+@receiver(post_save, sender=Booking)
+def update_utilization_on_save(sender, instance, **kwargs):
+    """
+    Прибавляет бронь к сводкам использования (booking/utilization.py) в той
+    же транзакции; при переносе брони вычитает ее прежний интервал
+    """
+    changes = utilization.deltas(utilization.booking_rows([instance]))
+    previous = getattr(instance, '_schedule_previous', None)
+    if previous is not None:
+        utilization.deltas([previous], sign=-1, into=changes)
+    utilization.apply(changes)
+
+
+def deleted_with_space(origin):
+    """Бронь удаляется каскадом вместе с пространством (объектом или QuerySet)"""
+    return isinstance(origin, Space) or getattr(origin, 'model', None) is Space
+
+
+@receiver(post_delete, sender=Booking)
+def update_utilization_on_delete(sender, instance, origin=None, **kwargs):
+    # Сводки пространства удаляются тем же каскадом раньше броней: вычитание
+    # создало бы строки, ссылающиеся на удаляемое пространство
+    if deleted_with_space(origin):
+        return
+    utilization.apply(utilization.deltas(utilization.booking_rows([instance]), sign=-1))
+
+
+@receiver(bookings_bulk_created, sender=Booking)
+def update_utilization_on_bulk_create(sender, bookings, restored=False, **kwargs):
+    # Очистка удаляет брони в обход сводок: восстановленные брони с отметкой
+    # архива в них уже учтены, прибавляются только брони старых сегментов
+    if restored:
+        bookings = [booking for booking in bookings if not getattr(booking, '_in_rollups', False)]
+    utilization.apply(utilization.deltas(utilization.booking_rows(bookings)))
+
+
+@receiver(bookings_bulk_deleted, sender=Booking)
+def update_utilization_on_bulk_delete(sender, bookings, **kwargs):
+    utilization.apply(utilization.deltas(utilization.booking_rows(bookings), sign=-1))
+
+
+@receiver(bookings_bulk_moved, sender=Booking)
+def update_utilization_on_bulk_move(sender, bookings, previous, **kwargs):
+    changes = utilization.deltas(utilization.booking_rows(bookings))
+    old_rows = [(previous[booking.pk], booking.start_time, booking.end_time) for booking in bookings]
+    utilization.apply(utilization.deltas(old_rows, sign=-1, into=changes))
+
+
+@receiver(post_save, sender=Booking)
+def bump_feed_versions_on_save(sender, instance, **kwargs):
+    """
+    Меняет версии календарных лент (booking/feeds.py) пространства и
+    пользователя брони после фиксации транзакции
+    """
+    pairs = booking_feeds([instance])
+    previous = getattr(instance, '_schedule_previous', None)
+    if previous is not None:
+        pairs.add((SPACE_FEED, previous[0]))
+    transaction.on_commit(lambda: bump_feeds(pairs))
+
+
+@receiver(post_delete, sender=Booking)
+def bump_feed_versions_on_delete(sender, instance, **kwargs):
+    pairs = booking_feeds([instance])
+    transaction.on_commit(lambda: bump_feeds(pairs))
+
+
+@receiver(bookings_bulk_created, sender=Booking)
+@receiver(bookings_bulk_deleted, sender=Booking)
+def bump_feed_versions_on_bulk_change(sender, bookings, **kwargs):
+    pairs = booking_feeds(bookings)
+    transaction.on_commit(lambda: bump_feeds(pairs))
+
+
+@receiver(bookings_bulk_moved, sender=Booking)
+def bump_feed_versions_on_bulk_move(sender, bookings, previous, **kwargs):
+    pairs = booking_feeds(bookings) | {(SPACE_FEED, space_id) for space_id in previous.values()}
+    transaction.on_commit(lambda: bump_feeds(pairs))
 
 
 @receiver(post_save, sender=Booking)
-def cleanup_old_bookings_on_save(sender, instance, created, **kwargs):
+def publish_booking_saved(sender, instance, created, **kwargs):
+    """
+    Событие для push-канала (booking/events.py) после фиксации транзакции
+    """
+    booking = BOOKING_FLAT.bound()(instance)
+    space_id = instance.space_id
+    days = {schedule.booking_day(instance.start_time)}
+    previous = getattr(instance, '_schedule_previous', None)
+    if created:
+        transaction.on_commit(lambda: events.publish('booking.created', space_id, days, booking=booking))
+        return
+    if previous is not None and previous[0] != space_id:
+        # Бронь перенесли в другое пространство: для прежнего это удаление
+        old_space, old_days = previous[0], {schedule.booking_day(previous[1])}
+        transaction.on_commit(
+            lambda: events.publish('booking.deleted', old_space, old_days, booking={'id': booking['id']})
+        )
+    elif previous is not None:
+        days.add(schedule.booking_day(previous[1]))
+    transaction.on_commit(lambda: events.publish('booking.updated', space_id, days, booking=booking))
+
+
+@receiver(post_delete, sender=Booking)
+def publish_booking_deleted(sender, instance, **kwargs):
+    space_id, booking_id = instance.space_id, instance.pk
+    days = {schedule.booking_day(instance.start_time)}
+    transaction.on_commit(lambda: events.publish('booking.deleted', space_id, days, booking={'id': booking_id}))
+
+
+@receiver(bookings_bulk_created, sender=Booking)
+def publish_bookings_bulk_created(sender, bookings, **kwargs):
+    serialize = BOOKING_FLAT.bound()
+    created = [
+        (booking.space_id, schedule.booking_day(booking.start_time), serialize(booking)) for booking in bookings
+    ]
+
+    def publish():
+        for space_id, day, booking in created:
+            events.publish('booking.created', space_id, {day}, booking=booking)
+
+    transaction.on_commit(publish)
+
+
+@receiver(bookings_bulk_deleted, sender=Booking)
+def publish_bookings_bulk_deleted(sender, bookings, **kwargs):
+    deleted = [(booking.space_id, schedule.booking_day(booking.start_time), booking.pk) for booking in bookings]
+
+    def publish():
+        for space_id, day, booking_id in deleted:
+            events.publish('booking.deleted', space_id, {day}, booking={'id': booking_id})
+
+    transaction.on_commit(publish)
+
+
+@receiver(bookings_bulk_moved, sender=Booking)
+def publish_bookings_bulk_moved(sender, bookings, previous, **kwargs):
+    """Для прежнего пространства перенос - удаление брони, как в publish_booking_saved"""
+    serialize = BOOKING_FLAT.bound()
+    moved = [
+        (previous[booking.pk], booking.space_id, schedule.booking_day(booking.start_time), serialize(booking))
+        for booking in bookings
+    ]
+
+    def publish():
+        for old_space, space_id, day, booking in moved:
+            events.publish('booking.deleted', old_space, {day}, booking={'id': booking['id']})
+            events.publish('booking.updated', space_id, {day}, booking=booking)
+
+    transaction.on_commit(publish)
+
+
+@receiver(post_save, sender=BookingSeries)
+@receiver(post_delete, sender=BookingSeries)
+def publish_series_change(sender, instance, **kwargs):
+    event_type = 'series.deleted' if kwargs['signal'] is post_delete else 'series.saved'
+    space_id, series_id = instance.space_id, instance.pk
+    days = {day for _, day in series_schedule_days(instance)}
+    transaction.on_commit(lambda: events.publish(event_type, space_id, days, series={'id': series_id}))
+
+
+@receiver(post_save, sender=BookingSeries)
+@receiver(post_delete, sender=BookingSeries)
+def bump_schedule_version_on_series_change(sender, instance, **kwargs):
+    """
+    Меняет версии расписания всех дней серии: вхождения не хранятся
+    в таблице броней, но показываются в расписании дня
+    """
+    pairs = series_schedule_days(instance)
+    transaction.on_commit(lambda: schedule.bump(pairs))
+
+
+@receiver(post_save, sender=BookingSeries)
+@receiver(post_delete, sender=BookingSeries)
+def bump_feed_versions_on_series_change(sender, instance, **kwargs):
+    # Вхождения серий входят в ленты пространства и пользователя
+    pairs = series_feeds(instance)
+    transaction.on_commit(lambda: bump_feeds(pairs))
+
+
+@receiver(post_save, sender=SeriesException)
+@receiver(post_delete, sender=SeriesException)
+def bump_feed_versions_on_series_exception(sender, instance, **kwargs):
+    pairs = series_feeds(instance.series)
+    transaction.on_commit(lambda: bump_feeds(pairs))
+
+
+@receiver(post_save, sender=SeriesException)
+@receiver(post_delete, sender=SeriesException)
+def bump_schedule_version_on_series_exception(sender, instance, **kwargs):
+    pairs = {(instance.series.space_id, instance.date)}
+    transaction.on_commit(lambda: schedule.bump(pairs))
+    space_id, series_id, days = instance.series.space_id, instance.series_id, {instance.date}
+    transaction.on_commit(lambda: events.publish('series.saved', space_id, days, series={'id': series_id}))
+
+
+@receiver(pre_save, sender=Space)
+def reset_image_variants(sender, instance, **kwargs):
+    """
+    При замене изображения копии прежнего сбрасываются:
+    до построения новых API отдает только оригинал
+    """
+    instance._image_changed = False
+    instance._stale_variants = None
+    previous = None
+    if hasattr(instance, '_loaded_image'):
+        # Пространство загружено из базы (Space.from_db): копии - в самом объекте
+        previous = (instance._loaded_image, instance.image_variants)
+    elif instance.pk and not instance._state.adding:
+        previous = Space.objects.filter(pk=instance.pk).values_list('image', 'image_variants').first()
+    if previous is None or previous[0] != instance.image.name:
+        instance._image_changed = bool(instance.image)
+        instance._stale_variants = previous[1] if previous else None
+        instance.image_variants = {}
+
+
+@receiver(post_save, sender=Space)
+def build_image_variants(sender, instance, **kwargs):
+    """
+    Строит копии нового изображения в фоне после фиксации транзакции
+    (SPACE_IMAGE_VARIANTS); без фона только удаляет копии прежнего
+    """
+    instance._loaded_image = instance.image.name
+    stale = getattr(instance, '_stale_variants', None)
+    if not settings.SPACE_IMAGE_VARIANTS:
+        if stale:
+            transaction.on_commit(lambda: delete_variants(stale))
+        return
+    if getattr(instance, '_image_changed', False) or stale:
+        space_id, image_name = instance.pk, instance.image.name
+        transaction.on_commit(lambda: schedule_variants(space_id, image_name, stale))
+
+
+@receiver(post_delete, sender=Space)
+def delete_image_variants(sender, instance, **kwargs):
+    variants = instance.image_variants
+    transaction.on_commit(lambda: delete_variants(variants))
+
+
+@receiver(post_save, sender=Space)
+@receiver(post_delete, sender=Space)
+def invalidate_space_catalogue(sender, instance, **kwargs):
     """
-    Автоматически очищает старые бронирования после сохранения новой брони
+    Сбрасывает кеш каталога пространств после фиксации транзакции
     """
-    if created:  # Только при создании новой записи
-        # Очищаем бронирования старше 1 дня
-        cutoff_time = timezone.now() - timedelta(days=1)
-        old_bookings = Booking.objects.filter(start_time__lt=cutoff_time)
-        deleted_count = old_bookings.delete()[0]
-        
-        if deleted_count > 0:
-            print(f"После создания новой брони удалено {deleted_count} старых бронирований")
+    transaction.on_commit(invalidate_catalogue)
 
 
 def periodic_cleanup():
     """
     Функция для периодической очистки (можно вызывать из внешнего планировщика)
     """
-    cutoff_time = timezone.now() - timedelta(days=1)
-    old_bookings = Booking.objects.filter(start_time__lt=cutoff_time)
-    deleted_count = old_bookings.delete()[0]
-    
-    if deleted_count > 0:
-        print(f"Периодическая очистка: удалено {deleted_count} старых бронирований")
-    
-    return deleted_count 
\ No newline at end of file
+    return run_retention() 
\ No newline at end of file
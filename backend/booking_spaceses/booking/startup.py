@@ -0,0 +1,90 @@
+"""
+Замер запуска процесса Django: python manage.py startup_timing.
+
+Замер идет в отдельном процессе, который еще не импортировал Django
+(python -m booking.startup): measure() выполняет те же шаги, что воркер
+gunicorn при старте - импорт настроек, django.setup(), создание
+ASGI-приложения и загрузку URL-маршрутов - и засекает каждый шаг, а для
+каждого приложения - импорт пакета, импорт моделей и ready().
+
+Время импорта модуля достается приложению, которое импортировало его
+первым: общие зависимости (django.db.models, rest_framework) учитываются
+у первого приложения из INSTALLED_APPS, которому они понадобились.
+
+Запуск не должен обращаться к базе: подключения к базе во время замера
+считаются (сигнал connection_created), и команда сообщает о них как об ошибке.
+"""
+import json
+import sys
+import time
+
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def measure():
+    started = time.perf_counter()
+    from django.apps import AppConfig
+    from django.db.backends.signals import connection_created
+
+    result = {'apps': {}, 'connections': 0}
+    apps = result['apps']
+
+    def count_connection(sender, **kwargs):
+        result['connections'] += 1
+
+    connection_created.connect(count_connection, weak=False)
+
+    create = AppConfig.create.__func__
+    import_models = AppConfig.import_models
+
+    def timed_create(cls, entry):
+        step = time.perf_counter()
+        app_config = create(cls, entry)
+        timings = apps.setdefault(app_config.label, {'import': 0.0, 'models': 0.0, 'ready': 0.0})
+        timings['import'] = elapsed_ms(step)
+        ready = app_config.ready
+
+        def timed_ready():
+            step = time.perf_counter()
+            ready()
+            timings['ready'] = elapsed_ms(step)
+
+        app_config.ready = timed_ready
+        return app_config
+
+    def timed_import_models(app_config):
+        step = time.perf_counter()
+        import_models(app_config)
+        apps[app_config.label]['models'] = elapsed_ms(step)
+
+    AppConfig.create = classmethod(timed_create)
+    AppConfig.import_models = timed_import_models
+
+    step = time.perf_counter()
+    import django
+    from django.conf import settings
+    settings.INSTALLED_APPS
+    result['settings'] = elapsed_ms(step)
+
+    step = time.perf_counter()
+    django.setup()
+    result['setup'] = elapsed_ms(step)
+
+    step = time.perf_counter()
+    from django.core.asgi import get_asgi_application
+    get_asgi_application()
+    result['application'] = elapsed_ms(step)
+
+    step = time.perf_counter()
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+    result['urls'] = elapsed_ms(step)
+
+    result['total'] = elapsed_ms(started)
+    return result
+
+
+if __name__ == '__main__':
+    json.dump(measure(), sys.stdout)
@@ -0,0 +1,76 @@
+"""
+Push-канал расписания: Server-Sent Events поверх ASGI.
+
+GET /api/events/?space=1[&date=YYYY-MM-DD] держит соединение открытым
+и отправляет события броней пространства (или одного его дня) по мере их
+появления (booking/events.py). Вместо периодического опроса расписания
+клиент один раз загружает день и дальше применяет события:
+
+    event: booking.created
+    data: {"type": "booking.created", "space": 1, "dates": ["2024-01-15"], "booking": {...}}
+
+Раз в BOOKING_EVENTS_HEARTBEAT секунд отправляется комментарий-пинг, чтобы
+прокси не закрывали соединение. Через BOOKING_EVENTS_MAX_AGE секунд сервер
+закрывает поток, и EventSource переподключается сам. Событие "reset"
+означает, что часть событий потеряна или событие не поместилось в
+уведомление брокера, и расписание нужно перечитать.
+
+Поток работает только под ASGI-сервером: под WSGI ответ с бесконечным
+асинхронным итератором занял бы поток воркера навсегда.
+"""
+import json
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .events import OVERFLOW, RESET, get_broker
+
+
+def sse_message(event_type, data):
+    return f'event: {event_type}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def event_stream(space_id, day):
+    subscription = get_broker().subscribe(space_id, day)
+    deadline = time.monotonic() + settings.BOOKING_EVENTS_MAX_AGE
+    try:
+        # Пауза перед переподключением EventSource (мс)
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            event = await subscription.get(settings.BOOKING_EVENTS_HEARTBEAT)
+            if event is None:
+                yield ': ping\n\n'
+            elif event is OVERFLOW:
+                yield sse_message(RESET, {'space': space_id})
+                return
+            else:
+                yield sse_message(event['type'], event)
+    finally:
+        subscription.close()
+
+
+@require_GET
+async def booking_events(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'Event stream requires an ASGI server.'}, status=501)
+    try:
+        space_id = int(request.GET['space'])
+    except (KeyError, ValueError):
+        return JsonResponse({'detail': 'space must be a space id.'}, status=400)
+    day = None
+    if request.GET.get('date'):
+        try:
+            day = datetime.strptime(request.GET['date'], '%Y-%m-%d').date()
+        except ValueError:
+            return JsonResponse({'detail': 'Invalid date format. Use YYYY-MM-DD.'}, status=400)
+
+    response = StreamingHttpResponse(event_stream(space_id, day), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен буферизовать поток
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,3 +1,1591 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import tempfile
+import threading
+import time as time_module
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+from uuid import UUID
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from accounts.authentication import session_user
+from booking_spaceses.metrics import RETIRED_FILE, Counter, Histogram, Registry
+
+from .archive import (
+    ARCHIVE_FIELDS, ROLLUP_FIELD, ArchiveWriter, list_partitions, partition_path, partition_segments, read_partition,
+    restore_partition,
+)
+from .bulk import cancel_bookings
+from .events import RESET, InProcessBroker, PostgresBroker
+from .export import SPACE_FEED, USER_FEED, feed_version, user_feed_token
+from .flat import BOOKING_FLAT, SPACE_FLAT
+from .images import generate_space_variants
+from .intervals import SpaceIntervalIndex
+from .loadtest import api_urlconf
+from .models import Space, Booking, BookingSeries, SpaceUtilization, BOOKING_MAX_ACTIVE, BOOKING_MIN_GAP
+from .retention import BatchDeleter, RetentionWorker, retention_lock
+from .recurrence import Occurrence, expand
+from .renderers import FastJSONRenderer
+from .serializers import ACTIVE_LIMIT_ERROR, BookingSerializer, OVERLAP_ERROR, SERIES_LIMIT_ERROR, SpaceSerializer
+from .signals import bookings_bulk_created, bookings_bulk_deleted
+from .utilization import rebuild
+
+User = get_user_model()
+
+
+def shared_cache(directory):
+    """Общий для процессов кеш Django: файлы во временном каталоге"""
+    return {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+
+
+def find_overlaps(bookings):
+    """Пары броней одного пространства ближе минимального промежутка"""
+    overlaps = []
+    bookings = sorted(bookings, key=lambda booking: (booking.space_id, booking.start_time))
+    for previous, current in zip(bookings, bookings[1:]):
+        if previous.space_id == current.space_id and current.start_time < previous.end_time + BOOKING_MIN_GAP:
+            overlaps.append((previous.pk, current.pk))
+    return overlaps
+
+
+def encode_payload(payload):
+    """Курсор с произвольным содержимым в формате encode_cursor"""
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentBookingCreateTests(TransactionTestCase):
+    threads = 8
+    attempts_per_thread = 5
+
+    def setUp(self):
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png',
+            work_start=time(0, 0), work_end=time(23, 59)
+        )
+        self.users = [
+            User.objects.create(username=f'user{number}')
+            for number in range(self.threads)
+        ]
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.start = timezone.make_aware(datetime.combine(tomorrow, time(10, 0)))
+
+    def hammer(self, slots):
+        """Каждый поток пытается забронировать все слоты; возвращает коды ответов"""
+        statuses = []
+        barrier = threading.Barrier(self.threads)
+
+        def worker(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                for start_time in slots:
+                    response = client.post('/api/bookings/', {
+                        'space': self.space.pk,
+                        'start_time': start_time.isoformat(),
+                        'duration': 60,
+                        'description': user.username,
+                    }, format='json')
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(user,)) for user in self.users]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return statuses
+
+    def test_same_slot_is_booked_once(self):
+        statuses = self.hammer([self.start] * self.attempts_per_thread)
+
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(statuses.count(201), 1)
+        self.assertTrue(set(statuses) <= {201, 400, 409}, statuses)
+
+    def test_overlapping_slots_never_overlap(self):
+        # Соседние слоты через 30 минут: каждый пересекается со следующим
+        slots = [self.start + timedelta(minutes=30 * number) for number in range(self.attempts_per_thread)]
+        statuses = self.hammer(slots)
+
+        bookings = list(Booking.objects.all())
+        self.assertEqual(find_overlaps(bookings), [])
+        self.assertEqual(statuses.count(201), len(bookings))
+        self.assertTrue(set(statuses) <= {201, 400, 409}, statuses)
+
+    def test_active_limit_holds_under_concurrency(self):
+        # Один пользователь из всех потоков, каждый поток - в свой слот
+        user = self.users[0]
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def worker(number):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                response = client.post('/api/bookings/', {
+                    'space': self.space.pk,
+                    'start_time': (self.start + timedelta(hours=2 * number)).isoformat(),
+                    'duration': 60,
+                    'description': 'limit',
+                }, format='json')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(number,)) for number in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(Booking.objects.filter(user=user).count(), BOOKING_MAX_ACTIVE)
+        self.assertEqual(statuses.count(201), BOOKING_MAX_ACTIVE)
+        self.assertTrue(set(statuses) <= {201, 400, 409}, statuses)
+
+
+class BookingCreateQueryCountTests(TransactionTestCase):
+    def setUp(self):
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png',
+            work_start=time(0, 0), work_end=time(23, 59)
+        )
+        self.user = User.objects.create(username='user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(10, 0)))
+
+    def create(self, start_time):
+        return self.client.post('/api/bookings/', {
+            'space': self.space.pk,
+            'start_time': start_time.isoformat(),
+            'duration': 60,
+            'description': 'query count',
+        }, format='json')
+
+    def validate(self, start_time, user=None):
+        serializer = BookingSerializer(context={'request': SimpleNamespace(user=user or self.user)})
+        return serializer.validate({'space': self.space, 'start_time': start_time, 'duration': 60, 'description': ''})
+
+    def test_validation_is_single_query(self):
+        self.assertEqual(self.create(self.start).status_code, 201)
+        BookingSeries.objects.create(
+            user=User.objects.create(username='bob'), space=self.space, start_time=self.start + timedelta(days=3), duration=60,
+            description='', frequency=BookingSeries.WEEKLY, until=timezone.localdate() + timedelta(days=30),
+        )
+
+        # Пересечения с бронями, серии рядом и активные брони и серии - один запрос
+        with self.assertNumQueries(1):
+            self.validate(self.start + timedelta(hours=2))
+        superuser = User(username='root', is_superuser=True)
+        with self.assertNumQueries(1):
+            self.validate(self.start + timedelta(hours=2), superuser)
+
+    def test_validation_expands_only_nearby_series(self):
+        # Ежедневная серия с 14:00, начатая вчера
+        BookingSeries.objects.create(
+            user=self.user, space=self.space, start_time=self.start - timedelta(hours=20), duration=60,
+            description='', frequency=BookingSeries.DAILY, until=timezone.localdate() + timedelta(days=30),
+        )
+        # Серия рядом: проверка, серии окна и их исключения
+        with self.assertNumQueries(3):
+            self.validate(self.start)
+        with self.assertRaises(serializers.ValidationError):
+            self.validate(self.start + timedelta(hours=3))
+
+    def test_create_query_count(self):
+        self.assertEqual(self.create(self.start).status_code, 201)
+
+        # Пространство из запроса и проверка; затем в транзакции (BEGIN/COMMIT)
+        # блокировка пространства, повторная проверка, вставка и обновление сводки
+        with self.assertNumQueries(8):
+            response = self.create(self.start + timedelta(hours=2))
+        self.assertEqual(response.status_code, 201)
+
+    def test_active_limit_uses_validation_query(self):
+        for hours in (0, 2):
+            self.assertEqual(self.create(self.start + timedelta(hours=hours)).status_code, 201)
+
+        # Лимит активных броней: отказ после пространства и проверки
+        with self.assertNumQueries(2):
+            response = self.create(self.start + timedelta(hours=4))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_slot_freed_in_other_process_is_accepted(self):
+        booking_id = self.create(self.start).data['id']
+        # Удаление в другом процессе: сигналы этого процесса о нем не знают
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM booking_booking WHERE id = %s', [booking_id])
+        self.assertEqual(self.create(self.start).status_code, 201)
+
+    def test_overlap_uses_validation_query(self):
+        self.assertEqual(self.create(self.start).status_code, 201)
+
+        # Пространство из запроса и проверка пересечений
+        with self.assertNumQueries(2):
+            response = self.create(self.start + timedelta(minutes=30))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class UtilizationRollupTests(TransactionTestCase):
+    def setUp(self):
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png',
+            work_start=time(0, 0), work_end=time(23, 59)
+        )
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def rollups(self):
+        return list(SpaceUtilization.objects.order_by('date', 'hour').values_list(
+            'date', 'hour', 'booked_minutes', 'bookings'
+        ))
+
+    def test_incremental_rollups_match_rebuild(self):
+        ids = []
+        for hour, minute, duration in ((9, 30, 60), (12, 0, 120), (15, 0, 30)):
+            response = self.client.post('/api/bookings/', {
+                'space': self.space.pk,
+                'start_time': timezone.make_aware(datetime.combine(self.day, time(hour, minute))).isoformat(),
+                'duration': duration,
+                'description': 'rollup',
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+            ids.append(response.data['id'])
+        self.assertEqual(self.client.delete(f'/api/bookings/{ids[-1]}/').status_code, 200)
+
+        incremental = [row for row in self.rollups() if row[2] or row[3]]
+        self.assertEqual(incremental, [
+            (self.day, 9, 30, 1), (self.day, 10, 30, 0), (self.day, 12, 60, 1), (self.day, 13, 60, 0),
+            (self.day, 24, 180, 2),
+        ])
+        rebuild(self.day, self.day)
+        self.assertEqual(self.rollups(), incremental)
+
+        response = self.client.get(
+            '/api/analytics/utilization/', {'from': self.day.isoformat(), 'to': self.day.isoformat()}
+        )
+        self.assertEqual(response.status_code, 200)
+        space = response.data['spaces'][0]
+        self.assertEqual((space['booked_minutes'], space['bookings']), (180, 2))
+        self.assertEqual(space['periods'], [{'date': self.day.isoformat(), 'booked_minutes': 180, 'bookings': 2}])
+
+    def test_rebuild_keeps_days_pruned_by_retention(self):
+        for day in (timezone.localdate() - timedelta(days=3), self.day):
+            start = timezone.make_aware(datetime.combine(day, time(9, 0)))
+            Booking.objects.create(
+                space=self.space, user=self.admin, start_time=start, end_time=start + timedelta(minutes=60), duration=60
+            )
+        BatchDeleter.older_than(1, sleep=0).run()
+        before = self.rollups()
+        self.assertEqual(Booking.objects.count(), 1)
+
+        out = StringIO()
+        call_command('rebuild_utilization', stdout=out)
+        self.assertIn(f'{self.day} - {self.day}', out.getvalue())
+        self.assertEqual(self.rollups(), before)
+
+        old = (timezone.localdate() - timedelta(days=3)).isoformat()
+        with self.assertRaisesMessage(CommandError, 'частично удалены очисткой'):
+            call_command('rebuild_utilization', '--from', old, stdout=out)
+        with self.assertRaises(ValueError):
+            rebuild(timezone.localdate() - timedelta(days=3), self.day)
+        self.assertEqual(self.rollups(), before)
+
+    def test_space_with_bookings_can_be_deleted(self):
+        for hour in (9, 12):
+            start = timezone.make_aware(datetime.combine(self.day, time(hour, 0)))
+            Booking.objects.create(
+                space=self.space, user=self.admin, start_time=start, end_time=start + timedelta(minutes=60), duration=60
+            )
+        self.assertTrue(SpaceUtilization.objects.filter(space=self.space).exists())
+        self.space.delete()
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(SpaceUtilization.objects.exists())
+
+
+class BookingExportTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png',
+            work_start=time(0, 0), work_end=time(23, 59)
+        )
+        self.user = User.objects.create(username='alice')
+        self.other = User.objects.create(username='bob')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def book(self, user, hour, description=''):
+        start = timezone.make_aware(datetime.combine(self.day, time(hour, 0)))
+        return Booking.objects.create(
+            space=self.space, user=user, start_time=start, end_time=start + timedelta(minutes=60),
+            duration=60, description=description,
+        )
+
+    def test_csv_export_streams_own_bookings(self):
+        own = self.book(self.user, 9, '=HYPERLINK("x")')
+        self.book(self.other, 11)
+        response = self.client.get('/api/export/bookings.csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f'{own.pk},{self.space.pk},'))
+        self.assertIn("\'=HYPERLINK", lines[1])
+
+    def test_space_feed_not_modified_until_bookings_change(self):
+        self.book(self.user, 9)
+        url = f'/api/feeds/spaces/{self.space.pk}.ics'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertNotIn('alice', body)
+
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.book(self.other, 11)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content).decode().count('BEGIN:VEVENT'), 2)
+
+    def test_user_feed_requires_secret_token(self):
+        self.book(self.user, 9)
+        self.book(self.other, 11)
+        self.assertEqual(self.client.get(f'/api/feeds/users/{self.user.pk}.ics').status_code, 404)
+        response = self.client.get(f'/api/feeds/users/{user_feed_token(self.user)}.ics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content).decode().count('BEGIN:VEVENT'), 1)
+
+    def daily_series(self, user, hour, days=3):
+        return BookingSeries.objects.create(
+            user=user, space=self.space, start_time=timezone.make_aware(datetime.combine(self.day, time(hour, 0))),
+            duration=60, description='стендап', frequency=BookingSeries.DAILY, until=self.day + timedelta(days=days - 1),
+        )
+
+    def test_exports_include_series_occurrences(self):
+        booking = self.book(self.user, 9)
+        series = self.daily_series(self.user, 12)
+        self.daily_series(self.other, 15)
+
+        lines = b''.join(self.client.get('/api/export/bookings.csv').streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[-1], 'series_id')
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[1].startswith(f'{booking.pk},'))
+        self.assertTrue(all(line.startswith(',') and line.endswith(f',{series.pk}') for line in lines[2:]))
+
+        # Диапазон дат: вхождения, начинающиеся в эти дни
+        day = (self.day + timedelta(days=1)).isoformat()
+        response = self.client.get('/api/export/bookings.ics', {'from': day, 'to': day})
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn(f'UID:series-{series.pk}-{self.day + timedelta(days=1):%Y%m%d}@', body)
+
+    def test_feeds_follow_series_changes(self):
+        series = self.daily_series(self.user, 12)
+        url = f'/api/feeds/users/{user_feed_token(self.user)}.ics'
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content).decode().count('BEGIN:VEVENT'), 3)
+        space_url = f'/api/feeds/spaces/{self.space.pk}.ics'
+        space_etag = self.client.get(space_url)['ETag']
+
+        # Отмена вхождения меняет версии лент пользователя и пространства
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(f'/api/series/{series.pk}/exceptions/', {'date': self.day.isoformat()}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content).decode().count('BEGIN:VEVENT'), 2)
+        self.assertEqual(self.client.get(space_url, HTTP_IF_NONE_MATCH=space_etag).status_code, 200)
+
+        etag = response['ETag']
+        series.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('BEGIN:VEVENT', b''.join(response.streaming_content).decode())
+
+    def test_regenerated_feed_token_revokes_previous_url(self):
+        old_url = self.client.get('/api/feeds/').data['user']
+        self.assertEqual(self.client.get('/api/feeds/').data['user'], old_url)
+        self.assertEqual(self.client.get(old_url).status_code, 200)
+
+        new_url = self.client.post('/api/feeds/regenerate/').data['user']
+        self.assertNotEqual(new_url, old_url)
+        self.assertEqual(self.client.get(old_url).status_code, 404)
+        self.assertEqual(self.client.get(new_url).status_code, 200)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(new_url).status_code, 404)
+
+
+class BookingAdminBulkActionTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.spaces = [
+            Space.objects.create(
+                name=name, description='', image='spaces/room.png', work_start=time(0, 0), work_end=time(23, 59)
+            )
+            for name in ('Переговорная', 'Лекторий')
+        ]
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def book(self, space, hour):
+        start = timezone.make_aware(datetime.combine(self.day, time(hour, 0)))
+        return Booking.objects.create(
+            space=space, user=self.admin, start_time=start, end_time=start + timedelta(minutes=60), duration=60
+        )
+
+    def action(self, name, bookings, **data):
+        return self.client.post('/admin/booking/booking/', {
+            'action': name, '_selected_action': [booking.pk for booking in bookings], **data
+        })
+
+    def day_totals(self):
+        return dict(SpaceUtilization.objects.filter(hour=24).values_list('space_id', 'booked_minutes'))
+
+    def test_cancel_deletes_selected_and_updates_rollups(self):
+        first, second, kept = self.book(self.spaces[0], 9), self.book(self.spaces[0], 11), self.book(self.spaces[0], 13)
+        self.assertEqual(self.action('cancel_bookings', [first, second]).status_code, 302)
+        self.assertEqual(list(Booking.objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertEqual(self.day_totals(), {self.spaces[0].pk: 60})
+        response = self.client.get('/admin/booking/booking/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_cancel_deletes_in_id_batches_without_loading_bookings(self):
+        bookings = [self.book(self.spaces[number % 2], 8 + 2 * number) for number in range(5)]
+        batches = []
+
+        def receiver(sender, bookings, **kwargs):
+            batches.append([booking.pk for booking in bookings])
+        bookings_bulk_deleted.connect(receiver, sender=Booking)
+        self.addCleanup(bookings_bulk_deleted.disconnect, receiver, sender=Booking)
+
+        with mock.patch('booking.bulk.BULK_BATCH_SIZE', 2), mock.patch('booking.events.publish') as publish, \
+                CaptureQueriesContext(connection) as queries:
+            self.assertEqual(cancel_bookings(Booking.objects.filter(space__name__in=['Переговорная', 'Лекторий'])), 5)
+        ids = [booking.pk for booking in bookings]
+        self.assertEqual(batches, [ids[:2], ids[2:4], ids[4:]])
+        self.assertEqual(sorted(call.kwargs['booking']['id'] for call in publish.call_args_list), ids)
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(len([sql for sql in statements if sql.startswith('DELETE')]), 3)
+        self.assertFalse([sql for sql in statements if '"description"' in sql])
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(self.day_totals(), {self.spaces[0].pk: 0, self.spaces[1].pk: 0})
+
+    def test_move_rejects_conflicts_and_moves_whole_set(self):
+        source, target = self.spaces
+        moving = [self.book(source, 9), self.book(source, 11)]
+        blocker = self.book(target, 11)
+        self.action('move_bookings', moving, space=target.pk)
+        self.assertEqual(Booking.objects.filter(space=target).count(), 1)
+
+        blocker.delete()
+        self.action('move_bookings', moving, space=target.pk)
+        self.assertEqual(Booking.objects.filter(space=target).count(), 2)
+        self.assertEqual(self.day_totals(), {source.pk: 0, target.pk: 120})
+
+
+class ArchiveRoundTripTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(BOOKING_ARCHIVE_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png', work_start=time(0, 0), work_end=time(23, 59)
+        )
+        self.user = User.objects.create(username='archived')
+        self.bookings = [
+            self.book(datetime(2024, 1, 10, 9)), self.book(datetime(2024, 1, 10, 12)),
+            self.book(datetime(2024, 1, 20, 9)), self.book(datetime(2024, 2, 5, 9)),
+            self.book(datetime(2024, 2, 5, 12)),
+        ]
+        self.rows = sorted(Booking.objects.values_list(*ARCHIVE_FIELDS))
+
+    def book(self, start):
+        start = timezone.make_aware(start)
+        return Booking.objects.create(
+            space=self.space, user=self.user, start_time=start, end_time=start + timedelta(minutes=60),
+            duration=60, description=f'archived {start:%d.%m %H}'
+        )
+
+    def archive(self):
+        return BatchDeleter(timezone.make_aware(datetime(2024, 3, 1)), batch_size=2, sleep=0, archive=True).run()
+
+    def rollups(self):
+        return list(SpaceUtilization.objects.order_by('date', 'hour').values_list('date', 'hour', 'booked_minutes'))
+
+    def test_archive_and_restore_round_trip(self):
+        rollups = self.rollups()
+        state = self.archive()
+        self.assertEqual((state.deleted, state.archived, state.batches), (5, 5, 3))
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(list_partitions(), ['2024-01', '2024-02'])
+        # Порция 3-4 делится между месяцами: по сегменту на месяц и порцию
+        self.assertEqual(len(partition_segments('2024-01')), 2)
+        self.assertEqual(len(partition_segments('2024-02')), 2)
+
+        received = []
+        receiver = lambda sender, bookings, **kwargs: received.append((len(bookings), kwargs.get('restored')))
+        bookings_bulk_created.connect(receiver, sender=Booking)
+        self.addCleanup(bookings_bulk_created.disconnect, receiver, sender=Booking)
+        self.assertEqual(restore_partition('2024-01', batch_size=2), (3, 0))
+        self.assertEqual(restore_partition('2024-02'), (2, 0))
+
+        self.assertEqual(sorted(Booking.objects.values_list(*ARCHIVE_FIELDS)), self.rows)
+        self.assertEqual(received, [(2, True), (1, True), (2, True)])
+        self.assertEqual(self.rollups(), rollups)
+        self.assertEqual(restore_partition('2024-01'), (0, 3))
+
+    def test_restore_skips_repeated_records_and_adds_uncounted_to_rollups(self):
+        january = list(Booking.objects.filter(start_time__month=1).order_by('pk').values(*ARCHIVE_FIELDS))
+        rollups = self.rollups()
+        self.archive()
+        # Повтор порции после прерванной очистки и сегмент без отметки ROLLUP_FIELD
+        with ArchiveWriter() as writer:
+            for row in january:
+                writer.write({**row, ROLLUP_FIELD: True})
+            writer.flush()
+        start = timezone.make_aware(datetime(2024, 1, 25, 9))
+        legacy = {
+            'id': max(booking.pk for booking in self.bookings) + 1, 'user_id': self.user.pk, 'space_id': self.space.pk,
+            'start_time': start, 'duration': 30, 'end_time': start + timedelta(minutes=30), 'description': 'legacy',
+        }
+        with ArchiveWriter() as writer:
+            writer.write(legacy)
+            writer.flush()
+
+        rows = list(read_partition('2024-01'))
+        self.assertEqual([row['id'] for row in rows], [row['id'] for row in january * 2] + [legacy['id']])
+        self.assertEqual([row[ROLLUP_FIELD] for row in rows], [True] * 6 + [False])
+        self.assertEqual(restore_partition('2024-01', batch_size=4), (4, 3))
+        day = start.date()
+        self.assertEqual(self.rollups(), sorted(rollups + [(day, 9, 30), (day, 24, 30)]))
+
+    def test_failed_segment_write_keeps_bookings(self):
+        with mock.patch('booking.archive.os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.archive()
+        self.assertEqual(Booking.objects.count(), 5)
+        self.assertEqual(list_partitions(), [])
+        # Временный файл, оставленный прерванным процессом, не читается
+        stale = partition_path('2024-01')
+        stale.mkdir(parents=True, exist_ok=True)
+        (stale / '1-stale.jsonl.gz.tmp').write_bytes(b'\x1f\x8b\x08')
+        self.assertEqual(list(read_partition('2024-01')), [])
+
+        state = self.archive()
+        self.assertEqual(state.deleted, 5)
+        self.assertEqual(len(list(read_partition('2024-01'))), 3)
+
+
+class AsyncReadViewTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        urls = override_settings(ROOT_URLCONF=api_urlconf(async_views=True))
+        urls.enable()
+        self.addCleanup(urls.disable)
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png', work_start=time(0, 0), work_end=time(23, 59)
+        )
+        self.user = User.objects.create_user(username='reader', password='secret-password')
+        self.token = Token.objects.create(user=self.user)
+        self.client = AsyncClient()
+
+    def auth(self, key=None):
+        return {'authorization': f'Token {key or self.token.key}'}
+
+    async def test_me_requires_authentication(self):
+        response = await self.client.get('/api/auth/me/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        response = await self.client.get('/api/auth/me/', headers=self.auth('0' * 40))
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('detail', json.loads(response.content))
+
+    async def test_me_by_token_and_session(self):
+        response = await self.client.get('/api/auth/me/', headers=self.auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['username'], 'reader')
+
+        await sync_to_async(self.client.force_login)(self.user)
+        response = await self.client.get('/api/auth/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['username'], 'reader')
+
+    async def test_session_user_without_auser(self):
+        # Django < 5.0: у запроса нет auser(), только ленивый request.user
+        self.assertIs(await session_user(SimpleNamespace(user=self.user)), self.user)
+
+    async def test_user_bookings_requires_authentication(self):
+        self.assertEqual((await self.client.get('/api/bookings/my/')).status_code, 401)
+        response = await self.client.get('/api/bookings/my/', headers=self.auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [])
+
+    async def test_schedule_and_catalogue_not_modified(self):
+        day = (timezone.localdate() + timedelta(days=1)).isoformat()
+        for url in (f'/api/spaces/{self.space.pk}/bookings/?date={day}', '/api/spaces/', f'/api/spaces/{self.space.pk}/'):
+            response = await self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            response = await self.client.get(url, headers={'if-none-match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+
+class SpaceCatalogueTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.spaces = [
+            Space.objects.create(
+                name=name, description='', image='spaces/room.png', work_start=time(9, 0), work_end=time(18, 0)
+            )
+            for name in ('Переговорная', 'Лекторий')
+        ]
+        self.client = APIClient()
+
+    def get(self, url, status=200, **headers):
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_list_and_detail_not_modified(self):
+        for url in ('/api/spaces/', f'/api/spaces/{self.spaces[0].pk}/'):
+            response = self.get(url)
+            self.assertIn('no-cache', response['Cache-Control'])
+            self.assertEqual(self.get(url, 304, if_none_match=response['ETag']).content, b'')
+            self.assertEqual(self.get(url, 304, if_modified_since=response['Last-Modified']).content, b'')
+            self.get(url, if_none_match='"stale"')
+        self.get('/api/spaces/0/', 404)
+        self.assertNotEqual(
+            self.get(f'/api/spaces/{self.spaces[0].pk}/')['ETag'], self.get(f'/api/spaces/{self.spaces[1].pk}/')['ETag']
+        )
+
+    def test_cached_catalogue_skips_database(self):
+        self.get('/api/spaces/')
+        with self.assertNumQueries(0):
+            self.get('/api/spaces/')
+            self.get(f'/api/spaces/{self.spaces[1].pk}/')
+
+    def test_space_save_and_delete_invalidate_catalogue(self):
+        first, second = self.spaces
+        etag = self.get('/api/spaces/')['ETag']
+        untouched = self.get(f'/api/spaces/{second.pk}/')['ETag']
+        first.name = 'Большая переговорная'
+        first.save()
+
+        response = self.get('/api/spaces/', if_none_match=etag)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([space['name'] for space in response.data], ['Большая переговорная', 'Лекторий'])
+        self.assertEqual(self.get(f'/api/spaces/{first.pk}/').data['name'], 'Большая переговорная')
+        self.get(f'/api/spaces/{second.pk}/', 304, if_none_match=untouched)
+
+        etag, deleted = response['ETag'], first.pk
+        first.delete()
+        response = self.get('/api/spaces/', if_none_match=etag)
+        self.assertEqual([space['id'] for space in response.data], [second.pk])
+        self.get(f'/api/spaces/{deleted}/', 404)
+
+
+class SpaceImageVariantTests(TransactionTestCase):
+    def setUp(self):
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png', work_start=time(0, 0), work_end=time(23, 59)
+        )
+
+    def test_pipeline_is_off_in_tests(self):
+        with mock.patch('booking.signals.schedule_variants') as schedule_variants:
+            self.space.image = 'spaces/other.png'
+            self.space.save()
+        schedule_variants.assert_not_called()
+
+    @override_settings(SPACE_IMAGE_VARIANTS=True)
+    def test_image_change_schedules_variants_without_select(self):
+        space = Space.objects.get(pk=self.space.pk)
+        with mock.patch('booking.signals.schedule_variants') as schedule_variants:
+            # Только UPDATE: прежнее изображение известно из загруженного объекта
+            with self.assertNumQueries(1):
+                space.name = 'Лекторий'
+                space.save()
+            schedule_variants.assert_not_called()
+
+            with self.assertNumQueries(1):
+                space.image = 'spaces/hall.png'
+                space.save()
+        schedule_variants.assert_called_once_with(space.pk, 'spaces/hall.png', {})
+
+    def test_variants_of_replaced_image_are_discarded(self):
+        variants = {'small': {'width': 320, 'height': 240, 'files': {'webp': 'spaces/variants/room-small.webp'}}}
+        with mock.patch('booking.images.render_variants', return_value=variants), \
+                mock.patch('booking.images.delete_variants') as delete_variants:
+            self.assertIsNone(generate_space_variants(self.space.pk, 'spaces/old.png'))
+            delete_variants.assert_called_once_with(variants)
+            self.assertEqual(generate_space_variants(self.space.pk, 'spaces/room.png'), variants)
+        self.assertEqual(Space.objects.get(pk=self.space.pk).image_variants, variants)
+
+
+class FlatSerializerParityTests(TransactionTestCase):
+    def setUp(self):
+        self.space = Space.objects.create(
+            name='Переговорная', description='С проектором', image='spaces/room.png',
+            work_start=time(9, 0), work_end=time(18, 30)
+        )
+        Space.objects.filter(pk=self.space.pk).update(image_variants={
+            'large': {'width': 800, 'height': 600, 'files': {'webp': 'spaces/variants/room-800.webp'}},
+            'small': {'width': 200, 'height': 150, 'files': {'webp': 'spaces/variants/room-200.webp'}},
+        })
+        self.space.refresh_from_db()
+        start = timezone.make_aware(datetime(2024, 3, 1, 9, 30, 15, 123456))
+        self.booking = Booking.objects.create(
+            space=self.space, user=User.objects.create(username='alice'), start_time=start,
+            end_time=start + timedelta(minutes=45), duration=45, description='Планерка'
+        )
+
+    def assertSameData(self, flat_data, serializer_data):
+        self.assertEqual(flat_data, serializer_data)
+        self.assertEqual(list(flat_data), list(serializer_data))
+
+    def test_booking_flat_matches_serializer(self):
+        for zone in ('Asia/Vladivostok', 'UTC'):
+            with timezone.override(zone):
+                expected = BookingSerializer(self.booking).data
+                [row] = BOOKING_FLAT.rows(Booking.objects.filter(pk=self.booking.pk))
+                self.assertSameData(row, expected)
+                self.assertSameData(BOOKING_FLAT.objects([self.booking])[0], expected)
+        with timezone.override('UTC'):
+            self.assertTrue(row['start_time'].endswith('Z'))
+
+    def test_space_flat_matches_serializer(self):
+        for use_url in (False, True):
+            rest_framework = {**settings.REST_FRAMEWORK, 'UPLOADED_FILES_USE_URL': use_url}
+            with override_settings(REST_FRAMEWORK=rest_framework):
+                expected = SpaceSerializer(self.space).data
+                [row] = SPACE_FLAT.rows(Space.objects.filter(pk=self.space.pk))
+                self.assertSameData(row, expected)
+                self.assertEqual(row['image'].startswith(settings.MEDIA_URL), use_url)
+
+    def test_fast_renderer_matches_drf_encoder(self):
+        data = {
+            'name': 'Переговорная «А»',
+            'start_time': timezone.make_aware(datetime(2024, 3, 1, 9, 30, 15, 123456)),
+            'utc': timezone.make_aware(datetime(2024, 3, 1), timezone.get_fixed_timezone(0)),
+            'date': datetime(2024, 3, 1).date(),
+            'time': time(9, 30),
+            'duration': timedelta(minutes=45),
+            'price': Decimal('1.50'),
+            'uuid': UUID('12345678-1234-5678-1234-567812345678'),
+            'detail': gettext_lazy('Not found.'),
+            'items': [1, 0.5, None, True, {'nested': []}],
+            7: 'int key',
+        }
+        for value in (data, [data], None, 'text'):
+            self.assertEqual(FastJSONRenderer().render(value), JSONRenderer().render(value))
+        indented = 'application/json; indent=2'
+        self.assertEqual(
+            FastJSONRenderer().render(data, indented, {}), JSONRenderer().render(data, indented, {})
+        )
+
+
+class QueryInstrumentationTests(TransactionTestCase):
+    MIDDLEWARE = ['booking_spaceses.middleware.QueryInstrumentationMiddleware', *settings.MIDDLEWARE]
+
+    def setUp(self):
+        cache.clear()
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png', work_start=time(9, 0), work_end=time(18, 0)
+        )
+
+    def get(self, url, **overrides):
+        options = {'SQL_INSTRUMENTATION': True, 'MIDDLEWARE': self.MIDDLEWARE, **overrides}
+        with override_settings(**options), CaptureQueriesContext(connection) as queries:
+            # Цепочка middleware собирается при первом запросе клиента
+            response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_server_timing_counts_queries(self):
+        with self.assertLogs('booking_spaceses.sql', 'INFO') as logs:
+            response, queries = self.get('/api/spaces/')
+        self.assertGreater(queries, 0)
+        self.assertRegex(
+            response['Server-Timing'],
+            rf'^db;dur=\d+\.\d;desc="{queries} queries", app;dur=\d+\.\d, total;dur=\d+\.\d$'
+        )
+        [record] = logs.records
+        self.assertEqual(record.levelname, 'INFO')
+        self.assertEqual(
+            (record.sql['path'], record.sql['status'], record.sql['queries'], record.sql['slow']),
+            ('/api/spaces/', 200, queries, False)
+        )
+        self.assertEqual(json.loads(record.getMessage())['queries'], queries)
+
+    def test_slow_request_is_warning_with_statements(self):
+        day = (timezone.localdate() + timedelta(days=1)).isoformat()
+        with self.assertLogs('booking_spaceses.sql', 'INFO') as logs:
+            self.get(f'/api/spaces/{self.space.pk}/bookings/?date={day}', SQL_SLOW_REQUEST_MS=0, SQL_INSTRUMENTATION_TOP=1)
+        [record] = logs.records
+        self.assertEqual(record.levelname, 'WARNING')
+        self.assertTrue(record.sql['slow'])
+        self.assertEqual(len(record.sql['slowest']), 1)
+        self.assertEqual(record.sql['view'], 'space-bookings')
+
+    def test_sampling_and_disabled_instrumentation(self):
+        sampled = {'SQL_INSTRUMENTATION_SAMPLE_RATE': 0.5}
+        for draw, recorded in ((0.9, False), (0.1, True)):
+            with mock.patch('booking_spaceses.middleware.random.random', return_value=draw), \
+                    mock.patch('booking_spaceses.middleware.logger') as sql_logger:
+                response, _ = self.get('/api/spaces/', **sampled)
+            self.assertEqual(response.has_header('Server-Timing'), recorded)
+            self.assertEqual(sql_logger.log.called, recorded)
+
+        with mock.patch('booking_spaceses.middleware.logger') as sql_logger:
+            response, _ = self.get('/api/spaces/', SQL_INSTRUMENTATION=False)
+        self.assertFalse(response.has_header('Server-Timing'))
+        sql_logger.log.assert_not_called()
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.requests = Counter('test_requests_total', 'Запросы', ('cache', 'result'), registry=self.registry)
+        self.duration = Histogram('test_duration_seconds', 'Время', buckets=(0.1, 1.0), registry=self.registry)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_exposition_of_own_process(self):
+        self.requests.inc(cache='catalogue', result='hit')
+        self.requests.inc(3, cache='catalogue', result='miss')
+        self.duration.observe(0.05)
+        self.duration.observe(5)
+        with override_settings(METRICS_DIR=''):
+            lines = self.registry.exposition().splitlines()
+        self.assertIn('# TYPE test_requests_total counter', lines)
+        self.assertIn('test_requests_total{cache="catalogue",result="miss"} 3', lines)
+        self.assertIn('test_duration_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_duration_seconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn('test_duration_seconds_count 2', lines)
+
+    def test_restarted_process_does_not_overwrite_previous_file(self):
+        with override_settings(METRICS_DIR=self.directory):
+            self.requests.inc(2, cache='catalogue', result='hit')
+            self.registry.flush()
+            # Тот же pid после перезапуска: новый id запуска, счетчики с нуля
+            self.registry._after_fork()
+            self.requests.inc(cache='catalogue', result='hit')
+            totals = self.registry.collect()
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+        self.assertEqual(totals[('test_requests_total', (('cache', 'catalogue'), ('result', 'hit')))], 3)
+
+    def test_stale_files_are_merged(self):
+        key = ('test_requests_total', (('cache', 'catalogue'), ('result', 'hit')))
+        for number in range(3):
+            path = os.path.join(self.directory, f'old-host-{number}-dead.json')
+            with open(path, 'w') as file:
+                json.dump([['test_requests_total', {'cache': 'catalogue', 'result': 'hit'}, 10]], file)
+            os.utime(path, (0, 0))
+        self.requests.inc(cache='catalogue', result='hit')
+        with override_settings(METRICS_DIR=self.directory, METRICS_RETIRE_AFTER=60):
+            self.assertEqual(self.registry.collect()[key], 31)
+            self.assertEqual(self.registry.collect()[key], 31)
+        files = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+        self.assertEqual(files, sorted([os.path.basename(self.registry.path(self.directory)), RETIRED_FILE]))
+
+
+class SpaceIntervalIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.start = timezone.make_aware(datetime(2030, 1, 7, 10, 0))
+        self.series = BookingSeries(pk=1, user_id=1, space_id=1, duration=60, description='')
+
+    def booking(self, pk, hours):
+        start = self.start + timedelta(hours=hours)
+        return Booking(id=pk, space_id=1, start_time=start, end_time=start + timedelta(hours=1))
+
+    def test_occurrences_without_id_are_all_kept(self):
+        index = SpaceIntervalIndex(1, self.start, [
+            Occurrence(self.series, self.start), Occurrence(self.series, self.start + timedelta(days=1)),
+            self.booking(5, 0),
+        ])
+        self.assertEqual(len(index), 3)
+        self.assertEqual(len(index.overlapping(self.start + timedelta(days=1), self.start + timedelta(days=1, hours=1))), 1)
+
+    def test_add_replaces_booking_with_same_id(self):
+        index = SpaceIntervalIndex(1, self.start, [self.booking(5, 0)])
+        index.add(self.booking(5, 3))
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.overlapping(self.start, self.start + timedelta(hours=1)), [])
+        self.assertEqual(index.overlapping(self.start, self.start + timedelta(hours=4), exclude_id=5), [])
+
+
+class EventBrokerTests(SimpleTestCase):
+    def event(self, description='', days=1):
+        first = datetime(2024, 1, 1).date()
+        return {
+            'type': 'booking.created', 'space': 1,
+            'dates': [(first + timedelta(days=number)).isoformat() for number in range(days)],
+            'booking': {'id': 7, 'space': 1, 'description': description},
+        }
+
+    def test_notify_payload_fits_postgres_limit(self):
+        broker = PostgresBroker()
+        small = self.event('Планерка')
+        self.assertEqual(json.loads(broker.encode(small)), small)
+
+        payload = broker.encode(self.event('x' * 10000))
+        self.assertLessEqual(len(payload.encode()), broker.max_payload)
+        self.assertEqual(json.loads(payload)['booking'], {'id': 7})
+
+        with self.assertLogs('booking.events', 'WARNING'):
+            payload = broker.encode(self.event(days=1000))
+        self.assertEqual(json.loads(payload), {'type': RESET, 'space': 1, 'dates': []})
+
+    async def test_reset_reaches_day_subscribers(self):
+        broker = InProcessBroker()
+        day = broker.subscribe(1, datetime(2024, 1, 5).date())
+        other_space = broker.subscribe(2)
+        broker.dispatch({'type': RESET, 'space': 1, 'dates': []})
+        self.assertEqual((await day.get(1))['type'], RESET)
+        self.assertIsNone(await other_space.get(0.01))
+
+
+class BatchDeleterTests(TransactionTestCase):
+    def setUp(self):
+        space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png', work_start=time(0, 0), work_end=time(23, 59)
+        )
+        user = User.objects.create(username='old')
+        first = timezone.make_aware(datetime(2024, 1, 10, 9))
+        self.old = [
+            Booking.objects.create(
+                space=space, user=user, start_time=first + timedelta(hours=2 * number),
+                end_time=first + timedelta(hours=2 * number, minutes=60), duration=60, description='old'
+            )
+            for number in range(5)
+        ]
+        start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(9, 0)))
+        self.kept = Booking.objects.create(
+            space=space, user=user, start_time=start, end_time=start + timedelta(minutes=60), duration=60
+        )
+
+    def test_each_batch_is_one_delete_of_its_rows(self):
+        deleted = []
+        with CaptureQueriesContext(connection) as queries:
+            state = BatchDeleter(
+                timezone.now(), batch_size=2, sleep=0, progress=lambda state: deleted.append(state.deleted)
+            ).run()
+        self.assertEqual(deleted, [2, 4, 5])
+        self.assertEqual((state.deleted, state.batches, state.finished), (5, 3, True))
+        deletes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 3)
+        self.assertEqual(list(Booking.objects.values_list('pk', flat=True)), [self.kept.pk])
+
+    def test_delete_ids_counts_existing_rows(self):
+        ids = [booking.pk for booking in self.old[:2]]
+        self.assertEqual(Booking.delete_ids(ids + [0]), 2)
+        self.assertEqual(Booking.delete_ids(ids), 0)
+        self.assertEqual(Booking.delete_ids([]), 0)
+        self.assertEqual(Booking.objects.count(), 4)
+
+    def test_deleted_batches_reach_events_and_feeds(self):
+        space, user = self.kept.space, self.kept.user
+        versions = [feed_version(SPACE_FEED, space.pk), feed_version(USER_FEED, user.pk)]
+        with mock.patch('booking.events.publish') as publish:
+            BatchDeleter(timezone.now(), batch_size=2, sleep=0).run()
+        self.assertEqual(
+            sorted(call.kwargs['booking']['id'] for call in publish.call_args_list),
+            [booking.pk for booking in self.old]
+        )
+        self.assertTrue(all(call.args[0] == 'booking.deleted' for call in publish.call_args_list))
+        self.assertNotEqual(feed_version(SPACE_FEED, space.pk), versions[0])
+        self.assertNotEqual(feed_version(USER_FEED, user.pk), versions[1])
+
+
+class RetentionLockTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.lock_file = os.path.join(directory.name, 'retention.lock')
+        settings_override = override_settings(BOOKING_RETENTION_LOCK_FILE=self.lock_file)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png', work_start=time(0, 0), work_end=time(23, 59)
+        )
+        start = timezone.make_aware(datetime(2024, 1, 10, 9))
+        self.old = Booking.objects.create(
+            space=space, user=User.objects.create(username='old'), start_time=start,
+            end_time=start + timedelta(minutes=60), duration=60
+        )
+
+    def hold_lock(self):
+        """Держит блокировку в другом потоке (и соединении с базой) до вызова release()"""
+        acquired, release = threading.Event(), threading.Event()
+
+        def hold():
+            try:
+                with retention_lock() as held:
+                    self.assertTrue(held)
+                    acquired.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        acquired.wait(10)
+
+        def stop():
+            release.set()
+            thread.join()
+        return stop
+
+    def test_second_holder_is_refused_until_release(self):
+        stop = self.hold_lock()
+        try:
+            with retention_lock() as acquired:
+                self.assertFalse(acquired)
+        finally:
+            stop()
+        with retention_lock() as acquired:
+            self.assertTrue(acquired)
+
+    def test_without_shared_cache_lock_file_excludes_processes(self):
+        # LocMemCache виден только своему процессу: блокировку держит flock файла
+        import fcntl
+
+        if connection.vendor == 'postgresql':
+            self.skipTest('в PostgreSQL используется advisory-блокировка')
+        with retention_lock() as acquired, open(self.lock_file) as other:
+            self.assertTrue(acquired)
+            with self.assertRaises(BlockingIOError):
+                fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_cleanup_entry_points_skip_while_locked(self):
+        stop = self.hold_lock()
+        try:
+            out = StringIO()
+            call_command('cleanup_old_bookings', stdout=out)
+            self.assertIn('другой процесс', out.getvalue())
+            self.assertEqual(Booking.cleanup_old_bookings(), 0)
+        finally:
+            stop()
+        self.assertTrue(Booking.objects.filter(pk=self.old.pk).exists())
+        self.assertEqual(Booking.cleanup_old_bookings(), 1)
+
+    def test_worker_repeats_passes_until_stopped(self):
+        worker = RetentionWorker(interval=0.01, days_old=1)
+        passes = []
+
+        def run_retention(days_old):
+            passes.append(days_old)
+            if len(passes) == 2:
+                worker.stop()
+
+        with mock.patch('booking.retention.run_retention', side_effect=run_retention):
+            worker.start()
+            worker.join(5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(passes, [1, 1])
+
+    def test_worker_pass_deletes_old_bookings(self):
+        worker = RetentionWorker(interval=0.01, days_old=1)
+        worker.start()
+        try:
+            for _ in range(500):
+                if not Booking.objects.filter(pk=self.old.pk).exists():
+                    break
+                time_module.sleep(0.01)
+        finally:
+            worker.stop()
+            worker.join(5)
+        self.assertFalse(Booking.objects.filter(pk=self.old.pk).exists())
+
+
+class BookingPaginationTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='alice')
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(9, 0)))
+        self.bookings = []
+        # Три брони с одинаковым началом в разных пространствах и две позже
+        for number, offset in enumerate((0, 0, 0, 60, 60)):
+            space = Space.objects.create(
+                name=f'Переговорная {number}', description='', image='spaces/room.png',
+                work_start=time(0, 0), work_end=time(23, 59)
+            )
+            begin = start + timedelta(minutes=offset)
+            self.bookings.append(Booking.objects.create(
+                space=space, user=self.user, start_time=begin, end_time=begin + timedelta(minutes=30), duration=30
+            ))
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(booking['id'] for booking in response.data['results'])
+            url, pages = response.data['next'], pages + 1
+        return ids, pages
+
+    def test_pages_are_stable_across_equal_start_times(self):
+        expected = [booking.pk for booking in sorted(self.bookings, key=lambda booking: (booking.start_time, booking.pk))]
+        self.assertEqual(self.walk('/api/bookings/my/?page_size=2'), (expected, 3))
+        self.assertEqual(self.walk('/api/bookings/my/?page_size=1'), (expected, 5))
+
+    def test_tampered_cursor_is_not_found(self):
+        cursor = self.client.get('/api/bookings/my/?page_size=2').data['next'].split('cursor=')[1]
+        for tampered in ('x' + cursor, cursor[:-3], 'bm90LWpzb24', encode_payload(['2024-01-01', 'id'])):
+            response = self.client.get('/api/bookings/my/', {'cursor': tampered})
+            self.assertEqual(response.status_code, 404, tampered)
+
+    def test_user_list_paginates_on_request_and_admin_list_always(self):
+        response = self.client.get('/api/bookings/my/')
+        self.assertEqual([booking['id'] for booking in response.data], [booking.pk for booking in self.bookings])
+        self.assertIsNone(self.client.get('/api/bookings/my/', {'page_size': 10}).data['next'])
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/bookings/all/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(len(self.client.get('/api/bookings/all/', {'page_size': 4}).data['results']), 4)
+
+
+class AvailabilityViewTests(TransactionTestCase):
+    def setUp(self):
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png', work_start=time(9, 0), work_end=time(18, 0)
+        )
+        self.user = User.objects.create(username='alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def book(self, start, end):
+        Booking.objects.create(
+            space=self.space, user=self.user, start_time=start, end_time=end,
+            duration=int((end - start).total_seconds() // 60)
+        )
+
+    def slots(self, **params):
+        response = self.client.get('/api/availability/', {
+            'from': self.day.isoformat(), 'to': self.day.isoformat(), **params
+        })
+        self.assertEqual(response.status_code, 200)
+        [space] = response.data
+        self.assertEqual(space['space'], self.space.pk)
+        return [
+            (slot['start'], slot['end'], slot['duration'], slot['max_booking_duration'])
+            for slot in space['days'][0]['slots']
+        ]
+
+    def slot(self, start, end, duration, max_duration):
+        return (timezone.localtime(start).isoformat(), timezone.localtime(end).isoformat(), duration, max_duration)
+
+    def test_free_day_is_one_slot_of_working_hours(self):
+        self.assertEqual(self.slots(), [self.slot(self.at(9), self.at(18), 540, 120)])
+
+    def test_gaps_respect_minimum_gap_and_working_hours(self):
+        self.book(self.at(10), self.at(11))
+        self.book(self.at(12), self.at(13))
+        # Промежуток короче двух минимальных отступов свободным не считается
+        self.book(self.at(13, 20), self.at(14))
+        # Бронь до конца рабочего дня
+        self.book(self.at(16, 45), self.at(18))
+        self.assertEqual(self.slots(), [
+            self.slot(self.at(9), self.at(9, 45), 45, 45),
+            self.slot(self.at(11, 15), self.at(11, 45), 30, 30),
+            self.slot(self.at(14, 15), self.at(16, 30), 135, 120),
+        ])
+        self.assertEqual(self.slots(min_duration=45), [
+            self.slot(self.at(9), self.at(9, 45), 45, 45),
+            self.slot(self.at(14, 15), self.at(16, 30), 135, 120),
+        ])
+
+    def test_booking_at_opening_and_previous_evening(self):
+        self.book(self.at(9), self.at(10))
+        # Бронь накануне, заканчивающаяся до открытия, на день не влияет
+        previous = timezone.make_aware(datetime.combine(self.day - timedelta(days=1), time(22, 0)))
+        self.book(previous, previous + timedelta(minutes=90))
+        self.assertEqual(self.slots(), [self.slot(self.at(10, 15), self.at(18), 465, 120)])
+
+    def test_invalid_parameters(self):
+        day = self.day.isoformat()
+        previous = (self.day - timedelta(days=1)).isoformat()
+        for params in (
+            {'from': day, 'to': previous},
+            {'from': day, 'to': day, 'min_duration': 'long'},
+            {'from': day, 'to': day, 'min_duration': 0},
+            {'from': day, 'to': day, 'min_duration': 121},
+            {'from': day},
+        ):
+            self.assertEqual(self.client.get('/api/availability/', params).status_code, 400, params)
+
+
+class CalendarViewTests(TransactionTestCase):
+    def setUp(self):
+        # Рабочий день 9:00-10:45: 7 ячеек по 15 минут, карта дополнена до 8 бит
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png', work_start=time(9, 0), work_end=time(10, 45)
+        )
+        self.user = User.objects.create(username='alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def at(self, hour, minute=0, days=0):
+        return timezone.make_aware(datetime.combine(self.day + timedelta(days=days), time(hour, minute)))
+
+    def book(self, start, end):
+        return Booking.objects.create(
+            space=self.space, user=self.user, start_time=start, end_time=end,
+            duration=int((end - start).total_seconds() // 60)
+        )
+
+    def calendar(self, days=1, **params):
+        response = self.client.get('/api/calendar/', {
+            'from': self.day.isoformat(), 'to': (self.day + timedelta(days=days - 1)).isoformat(), **params
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def bitmaps(self, days=1, granularity=15):
+        [space] = self.calendar(days, mode='bitmap', granularity=granularity)['spaces']
+        return space['cells'], [day['bitmap'] for day in space['days']]
+
+    def test_bitmap_bits_follow_bookings_and_working_hours(self):
+        self.book(self.at(9), self.at(9, 15))
+        # Неполные ячейки занимаются целиком
+        self.book(self.at(9, 20), self.at(9, 40))
+        # Бронь через конец рабочего дня занимает только последнюю ячейку
+        self.book(self.at(10, 30), self.at(11, 30))
+        # Бронь накануне, закончившаяся к открытию, день не занимает
+        self.book(self.at(8), self.at(9))
+        # Ночная бронь занимает утро следующего дня
+        self.book(self.at(22), self.at(9, 30, days=1))
+        self.assertEqual(self.bitmaps(days=3), (7, ['e2', 'c0', '00']))
+        self.assertEqual(self.bitmaps(granularity=60), (2, ['c']))
+
+    def test_bookings_mode_groups_by_start_day(self):
+        booking = self.book(self.at(9), self.at(10))
+        [space] = self.calendar(days=2)['spaces']
+        self.assertEqual(space['space'], self.space.pk)
+        self.assertEqual([[item['id'] for item in day['bookings']] for day in space['days']], [[booking.pk], []])
+
+    def test_range_limit_and_invalid_parameters(self):
+        limit = settings.BOOKING_CALENDAR_MAX_DAYS
+        self.calendar(days=limit, mode='bitmap')
+        day = self.day.isoformat()
+        for params in (
+            {'from': day, 'to': (self.day + timedelta(days=limit)).isoformat()},
+            {'from': day, 'to': day, 'mode': 'grid'},
+            {'from': day, 'to': day, 'mode': 'bitmap', 'granularity': 4},
+            {'from': day, 'to': day, 'mode': 'bitmap', 'granularity': 'hour'},
+            {'from': day, 'to': day, 'spaces': '1,x'},
+        ):
+            self.assertEqual(self.client.get('/api/calendar/', params).status_code, 400, params)
+
+
+class BookingBatchCreateTests(TransactionTestCase):
+    def setUp(self):
+        self.spaces = [
+            Space.objects.create(
+                name=name, description='', image='spaces/room.png', work_start=time(9, 0), work_end=time(18, 0)
+            )
+            for name in ('Переговорная', 'Лекторий')
+        ]
+        self.user = User.objects.create(username='alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def item(self, space, hour, minute=0, duration=60):
+        start = timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+        return {'space': space.pk, 'start_time': start.isoformat(), 'duration': duration, 'description': 'batch'}
+
+    def post(self, items, mode='atomic'):
+        return self.client.post('/api/bookings/batch/', {'mode': mode, 'bookings': items}, format='json')
+
+    def test_atomic_batch_creates_all(self):
+        response = self.post([self.item(self.spaces[0], 9), self.item(self.spaces[1], 9), self.item(self.spaces[0], 11)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 3)
+        self.assertEqual(response.data['errors'], [])
+        self.assertEqual(Booking.objects.count(), 3)
+        # Пакет сообщает о бронях сигналом bookings_bulk_created
+        totals = dict(SpaceUtilization.objects.filter(hour=24).values_list('space_id', 'booked_minutes'))
+        self.assertEqual(totals, {self.spaces[0].pk: 120, self.spaces[1].pk: 60})
+
+    def test_atomic_batch_is_all_or_nothing(self):
+        response = self.post([
+            self.item(self.spaces[0], 9),
+            # Ближе минимального промежутка к первой броне пакета
+            self.item(self.spaces[0], 10, 5),
+            self.item(self.spaces[1], 9, duration=180),
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertFalse(Booking.objects.exists())
+
+    def test_partial_batch_creates_valid_items(self):
+        Booking.objects.create(
+            space=self.spaces[1], user=self.user, duration=60,
+            start_time=timezone.make_aware(datetime.combine(self.day, time(9, 0))),
+            end_time=timezone.make_aware(datetime.combine(self.day, time(10, 0))),
+        )
+        response = self.post([
+            self.item(self.spaces[0], 9), self.item(self.spaces[1], 9, 30), self.item(self.spaces[0], 7),
+        ], mode='partial')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_active_limit_counts_batch_items(self):
+        response = self.post([self.item(self.spaces[0], hour) for hour in (9, 11, 13)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [{'index': 2, 'errors': {'non_field_errors': [ACTIVE_LIMIT_ERROR]}}])
+        self.assertFalse(Booking.objects.exists())
+
+        response = self.post([self.item(self.spaces[0], hour) for hour in (9, 11, 13)], mode='partial')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Booking.objects.filter(space=self.spaces[0]).count(), BOOKING_MAX_ACTIVE)
+
+
+class BookingSeriesTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png', work_start=time(9, 0), work_end=time(18, 0)
+        )
+        self.user = User.objects.create(username='alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Понедельник следующей недели: серия целиком в будущем
+        today = timezone.localdate()
+        self.monday = today + timedelta(days=7 - today.weekday())
+
+    def at(self, day, hour):
+        return timezone.make_aware(datetime.combine(day, time(hour, 0)))
+
+    def create_series(self, hour=10, weekdays='0,2', weeks=2, **extra):
+        data = {
+            'space': self.space.pk, 'start_time': self.at(self.monday, hour).isoformat(), 'duration': 60,
+            'description': 'стендап', 'frequency': 'weekly', 'weekdays': weekdays,
+            'until': (self.monday + timedelta(weeks=weeks, days=-1)).isoformat(), **extra,
+        }
+        return self.client.post('/api/series/', data, format='json')
+
+    def create_booking(self, day, hour):
+        data = {'space': self.space.pk, 'start_time': self.at(day, hour).isoformat(), 'duration': 60, 'description': 'разовая'}
+        return self.client.post('/api/bookings/', data, format='json')
+
+    def schedule(self, day):
+        return self.client.get(f'/api/spaces/{self.space.pk}/bookings/', {'date': day.isoformat()}).data
+
+    def test_weekly_series_expands_to_weekdays(self):
+        response = self.create_series()
+        self.assertEqual(response.status_code, 201)
+        series = BookingSeries.objects.get(pk=response.data['id'])
+
+        occurrences = expand(series, self.at(self.monday, 0), self.at(self.monday + timedelta(weeks=3), 0))
+        self.assertEqual(
+            [occurrence.start_time for occurrence in occurrences],
+            [self.at(self.monday + timedelta(days=days), 10) for days in (0, 2, 7, 9)],
+        )
+        # Вхождение видно в расписании дня, в остальные дни его нет
+        self.assertEqual([item['series'] for item in self.schedule(self.monday + timedelta(days=2))], [series.pk])
+        self.assertEqual(self.schedule(self.monday + timedelta(days=1)), [])
+
+    def test_exception_removes_occurrence_and_frees_slot(self):
+        series_id = self.create_series().data['id']
+        wednesday = self.monday + timedelta(days=2)
+        self.assertEqual(self.create_booking(wednesday, 10).status_code, 400)
+        self.assertEqual(len(self.schedule(wednesday)), 1)
+
+        response = self.client.post(f'/api/series/{series_id}/exceptions/', {'date': wednesday.isoformat()}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.schedule(wednesday), [])
+        self.assertEqual(self.create_booking(wednesday, 10).status_code, 201)
+
+    def test_paginated_schedule_includes_occurrences(self):
+        self.assertEqual(self.create_series(hour=12).status_code, 201)
+        other = User.objects.create(username='bob')
+        for hour in (9, 14):
+            Booking.objects.create(
+                space=self.space, user=other, duration=60, description='',
+                start_time=self.at(self.monday, hour), end_time=self.at(self.monday, hour + 1),
+            )
+        schedule = self.schedule(self.monday)
+        self.assertEqual([item['id'] is None for item in schedule], [False, True, False])
+
+        url = f'/api/spaces/{self.space.pk}/bookings/'
+        items, params = [], {'date': self.monday.isoformat(), 'page_size': 1}
+        while True:
+            page = self.client.get(url, params).data
+            items.extend(page['results'])
+            if page['next'] is None:
+                break
+            params['cursor'] = page['next'].split('cursor=')[1].split('&')[0]
+        self.assertEqual(items, schedule)
+
+    def test_exception_date_must_be_occurrence_day(self):
+        series_id = self.create_series().data['id']
+        url = f'/api/series/{series_id}/exceptions/'
+        for day in (self.monday - timedelta(days=7), self.monday + timedelta(weeks=2), self.monday + timedelta(days=1)):
+            response = self.client.post(url, {'date': day.isoformat()}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('date', response.data)
+        self.assertEqual(self.client.post(url, {'date': self.monday.isoformat()}, format='json').status_code, 201)
+
+    def test_booking_conflicts_with_occurrence(self):
+        self.assertEqual(self.create_series().status_code, 201)
+        # Ближе минимального промежутка к вхождению следующей недели
+        response = self.create_booking(self.monday + timedelta(weeks=1), 11)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], [OVERLAP_ERROR])
+        self.assertEqual(self.create_booking(self.monday + timedelta(days=1), 10).status_code, 201)
+
+    def test_series_conflicts_with_booking_and_series(self):
+        other = User.objects.create(username='bob')
+        Booking.objects.create(
+            space=self.space, user=other, duration=60, description='',
+            start_time=self.at(self.monday + timedelta(days=9), 10), end_time=self.at(self.monday + timedelta(days=9), 11),
+        )
+        response = self.create_series()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], [OVERLAP_ERROR])
+
+        self.assertEqual(self.create_series(weekdays='1').status_code, 201)
+        # Пересечение с вторничной серией только на второй неделе
+        response = self.create_series(weekdays='1', weeks=1, start_time=self.at(self.monday + timedelta(days=8), 10).isoformat())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(BookingSeries.objects.count(), 1)
+
+    def test_active_limit_counts_bookings_and_series_together(self):
+        self.assertEqual(self.create_booking(self.monday + timedelta(days=1), 10).status_code, 201)
+        self.assertEqual(self.create_series().status_code, 201)
+
+        response = self.create_booking(self.monday + timedelta(days=1), 14)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], [ACTIVE_LIMIT_ERROR])
+
+        response = self.create_series(hour=14, weekdays='4')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], [SERIES_LIMIT_ERROR])
+
+        # Пакет учитывает серии так же, как одиночная бронь
+        item = {'space': self.space.pk, 'start_time': self.at(self.monday + timedelta(days=3), 10).isoformat(), 'duration': 60, 'description': ''}
+        response = self.client.post('/api/bookings/batch/', {'mode': 'atomic', 'bookings': [item]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class ScheduleETagTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.space = Space.objects.create(
+            name='Переговорная', description='', image='spaces/room.png', work_start=time(0, 0), work_end=time(23, 59)
+        )
+        self.user = User.objects.create(username='alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.url = f'/api/spaces/{self.space.pk}/bookings/?date={self.day.isoformat()}'
+
+    def create(self, hour):
+        start = timezone.make_aware(datetime.combine(self.day, time(hour, 0)))
+        return self.client.post('/api/bookings/', {
+            'space': self.space.pk, 'start_time': start.isoformat(), 'duration': 60, 'description': 'планерка',
+        }, format='json')
+
+    def insert_elsewhere(self, hour):
+        """Бронь, созданная другим процессом: без сигналов этого процесса"""
+        start = timezone.make_aware(datetime.combine(self.day, time(hour, 0)))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO booking_booking (user_id, space_id, start_time, end_time, duration, description) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                [self.user.pk, self.space.pk, start, start + timedelta(hours=1), 60, '']
+            )
+
+    def test_per_process_cache_etag_follows_content(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.insert_elsewhere(9)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_shared_cache_version_changes_on_create_and_delete(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(CACHES=shared_cache(directory)):
+            etag = self.client.get(self.url)['ETag']
+            # Версия из кеша: 304 без запроса броней
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+            booking_id = self.create(10).data['id']
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([item['id'] for item in response.data], [booking_id])
+            etag = response['ETag']
+            # Ответ из кеша по той же версии
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(self.url).data, response.data)
+
+            self.assertEqual(self.client.delete(f'/api/bookings/{booking_id}/').status_code, 200)
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, [])
+
+
+class StartupTimingTests(SimpleTestCase):
+    def test_startup_opens_no_database_connections(self):
+        output = StringIO()
+        call_command('startup_timing', runs=1, json=True, stdout=output)
+        report = json.loads(output.getvalue())
+        self.assertIn('booking', report['apps'])
+        self.assertGreater(report['total'], 0)
@@ -1,11 +1,46 @@
+from django.conf import settings
 from django.urls import path
-from .views import SpaceListView, BookingCreateView, BookingDeleteView, SpaceBookingsView, UserBookingsListView, SpaceDetailView
-
-urlpatterns = [
-    path('spaces/', SpaceListView.as_view(), name='space-list'),
-    path('spaces/<int:pk>/', SpaceDetailView.as_view(), name='space-detail'),
-    path('spaces/<int:space_id>/bookings/', SpaceBookingsView.as_view(), name='space-bookings'),
-    path('bookings/', BookingCreateView.as_view(), name='booking-create'),
-    path('bookings/<int:pk>/', BookingDeleteView.as_view(), name='booking-delete'),
-    path('bookings/my/', UserBookingsListView.as_view(), name='my-bookings'),
-]
+from .feeds import FeedLinksView, FeedTokenRegenerateView, space_feed, user_feed
+from .streams import booking_events
+from .views import SpaceListView, BookingCreateView, BookingDeleteView, SpaceBookingsView, UserBookingsListView, SpaceDetailView, AvailabilityView, AdminBookingListView, CalendarView, UtilizationView, BookingExportView, BookingBatchCreateView, BookingSeriesListCreateView, BookingSeriesDetailView, SeriesExceptionCreateView
+
+
+def read_views(async_views):
+    """Представления чтения: асинхронные (booking/async_views.py) или DRF"""
+    if async_views:
+        from . import async_views as views
+        return views.space_list, views.space_detail, views.space_bookings, views.user_bookings
+    return (
+        SpaceListView.as_view(), SpaceDetailView.as_view(), SpaceBookingsView.as_view(),
+        UserBookingsListView.as_view()
+    )
+
+
+def build_urlpatterns(async_views=False):
+    space_list, space_detail, space_bookings, user_bookings = read_views(async_views)
+    return [
+        path('spaces/', space_list, name='space-list'),
+        path('spaces/<int:pk>/', space_detail, name='space-detail'),
+        path('spaces/<int:space_id>/bookings/', space_bookings, name='space-bookings'),
+        path('bookings/', BookingCreateView.as_view(), name='booking-create'),
+        path('bookings/batch/', BookingBatchCreateView.as_view(), name='booking-batch-create'),
+        path('bookings/<int:pk>/', BookingDeleteView.as_view(), name='booking-delete'),
+        path('bookings/my/', user_bookings, name='my-bookings'),
+        path('bookings/all/', AdminBookingListView.as_view(), name='all-bookings'),
+        path('series/', BookingSeriesListCreateView.as_view(), name='series-list'),
+        path('series/<int:pk>/', BookingSeriesDetailView.as_view(), name='series-detail'),
+        path('series/<int:pk>/exceptions/', SeriesExceptionCreateView.as_view(), name='series-exceptions'),
+        path('events/', booking_events, name='booking-events'),
+        path('availability/', AvailabilityView.as_view(), name='availability'),
+        path('calendar/', CalendarView.as_view(), name='calendar'),
+        path('analytics/utilization/', UtilizationView.as_view(), name='analytics-utilization'),
+        path('export/bookings.csv', BookingExportView.as_view(), {'fmt': 'csv'}, name='booking-export-csv'),
+        path('export/bookings.ics', BookingExportView.as_view(), {'fmt': 'ics'}, name='booking-export-ics'),
+        path('feeds/', FeedLinksView.as_view(), name='feed-links'),
+        path('feeds/regenerate/', FeedTokenRegenerateView.as_view(), name='feed-token-regenerate'),
+        path('feeds/spaces/<int:space_id>.ics', space_feed, name='space-feed'),
+        path('feeds/users/<str:token>.ics', user_feed, name='user-feed'),
+    ]
+
+
+urlpatterns = build_urlpatterns(settings.API_ASYNC_VIEWS)
@@ -0,0 +1,206 @@
+"""
+Сводки использования пространств для аналитики (GET /api/analytics/utilization/).
+
+Таблица SpaceUtilization хранит по каждому пространству и часу местного
+времени занятые минуты и число броней, начавшихся в этот час. Бронь через
+границу часа делит минуты между часами. Строка с hour=DAY_TOTAL - итог
+дня: отчет по дням читает одну строку на пространство и день, по часам -
+до 24 строк, без обхода таблицы броней.
+
+Сводки обновляются прибавлением изменений (apply) в той же транзакции, что
+и бронь: сигналы создания, переноса и удаления брони (booking/signals.py)
+и пакетного создания. Воркер очистки удаляет старые брони в обход сигналов,
+поэтому история использования остается в сводках и после удаления броней.
+
+Вхождения серий (booking/recurrence.py) в таблице броней не хранятся и в
+сводки не входят.
+
+rebuild() пересчитывает сводки за диапазон дат из таблицы броней, читая
+ее порциями: ``python manage.py rebuild_utilization``. Пересчитать можно
+только дни, начиная с first_complete_day(): в более ранних днях часть броней
+уже удалена очисткой, и пересчет стер бы их историю.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .availability import days_between
+from .models import Booking, SpaceUtilization, BOOKING_MAX_DURATION
+
+DAY = 'day'
+HOUR = 'hour'
+GRANULARITIES = (DAY, HOUR)
+
+# Значение hour строки с итогом дня
+DAY_TOTAL = 24
+
+# Строк в одном INSERT ... ON CONFLICT
+UPSERT_BATCH_SIZE = 100
+
+
+def booking_hours(start_time, end_time):
+    """(дата, час, минуты) местного времени для интервала брони"""
+    current, end = timezone.localtime(start_time), timezone.localtime(end_time)
+    while current < end:
+        boundary = min(current.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1), end)
+        yield current.date(), current.hour, (boundary - current).total_seconds() / 60
+        current = boundary
+
+
+def deltas(rows, sign=1, into=None):
+    """
+    Изменения сводок для броней rows - кортежей (space_id, start_time, end_time):
+    {(space_id, дата, час): [минуты, число броней]} вместе с итогами дней.
+    sign=-1 - для удаленных броней
+    """
+    changes = into if into is not None else defaultdict(lambda: [0.0, 0])
+    for space_id, start_time, end_time in rows:
+        first = True
+        for day, hour, minutes in booking_hours(start_time, end_time):
+            for key in ((space_id, day, hour), (space_id, day, DAY_TOTAL)):
+                change = changes[key]
+                change[0] += sign * minutes
+                if first:
+                    change[1] += sign
+            first = False
+    return changes
+
+
+def booking_rows(bookings):
+    return [(booking.space_id, booking.start_time, booking.end_time) for booking in bookings]
+
+
+def apply(changes, using=None):
+    """Прибавляет изменения к сводкам: один INSERT ... ON CONFLICT на порцию строк"""
+    values = [
+        (space_id, day, hour, round(minutes), count)
+        for (space_id, day, hour), (minutes, count) in changes.items()
+        if round(minutes) or count
+    ]
+    if not values:
+        return
+    connection = connections[using or router.db_for_write(SpaceUtilization)]
+    quote = connection.ops.quote_name
+    table = quote(SpaceUtilization._meta.db_table)
+    minutes, bookings = quote('booked_minutes'), quote('bookings')
+    for start in range(0, len(values), UPSERT_BATCH_SIZE):
+        batch = values[start:start + UPSERT_BATCH_SIZE]
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))
+        sql = (
+            f"INSERT INTO {table} ({quote('space_id')}, {quote('date')}, {quote('hour')}, {minutes}, {bookings}) "
+            f"VALUES {placeholders} "
+            f"ON CONFLICT ({quote('space_id')}, {quote('date')}, {quote('hour')}) DO UPDATE SET "
+            f"{minutes} = {table}.{minutes} + EXCLUDED.{minutes}, "
+            f"{bookings} = {table}.{bookings} + EXCLUDED.{bookings}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for row in batch for value in row])
+
+
+def local_bounds(date_from, date_to):
+    start = timezone.make_aware(datetime.combine(date_from, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    return start, end
+
+
+def first_complete_day():
+    """
+    Первый день, все брони которого еще есть в таблице. Очистка удаляет брони,
+    начавшиеся раньше BOOKING_RETENTION_DAYS дней назад; бронь, начатая до этой
+    границы, занимает еще до BOOKING_MAX_DURATION минут
+    """
+    cutoff = timezone.now() - timedelta(days=settings.BOOKING_RETENTION_DAYS)
+    return timezone.localdate(cutoff + timedelta(minutes=BOOKING_MAX_DURATION)) + timedelta(days=1)
+
+
+def rebuild(date_from, date_to, chunk_size=2000, progress=None):
+    """
+    Пересчитывает сводки за дни [date_from, date_to] из таблицы броней.
+    Брони читаются порциями по chunk_size (iterator), изменения сводок
+    записываются после каждой порции. Возвращает число прочитанных броней.
+    ValueError - если диапазон начинается раньше first_complete_day()
+    """
+    complete = first_complete_day()
+    if date_from < complete:
+        raise ValueError(f'Брони до {complete} частично удалены очисткой, их сводки пересчитать нельзя')
+    start, end = local_bounds(date_from, date_to)
+    # И брони, начавшиеся накануне и закончившиеся в первый день диапазона
+    bookings = (
+        Booking.objects.filter(start_time__lt=end, end_time__gt=start)
+        .order_by().values_list('space_id', 'start_time', 'end_time')
+    )
+    processed = 0
+    with transaction.atomic():
+        SpaceUtilization.objects.filter(date__gte=date_from, date__lte=date_to).delete()
+        chunk = []
+        for row in bookings.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                processed += _flush(chunk, date_from, date_to, progress, processed)
+                chunk = []
+        if chunk:
+            processed += _flush(chunk, date_from, date_to, progress, processed)
+    return processed
+
+
+def _flush(chunk, date_from, date_to, progress, processed):
+    changes = deltas(chunk)
+    # Части броней через полночь на границах лежат вне пересчитываемого диапазона
+    apply({key: value for key, value in changes.items() if date_from <= key[1] <= date_to})
+    if progress is not None:
+        progress(processed + len(chunk))
+    return len(chunk)
+
+
+def work_minutes(space):
+    return int((
+        datetime.combine(datetime.min, space.work_end) - datetime.combine(datetime.min, space.work_start)
+    ).total_seconds() // 60)
+
+
+def report(spaces, date_from, date_to, granularity=DAY):
+    """
+    Использование пространств за дни [date_from, date_to] по сводкам:
+    итоги, доля занятого рабочего времени и периоды (дни или часы)
+    с ненулевыми значениями
+    """
+    rollups = SpaceUtilization.objects.filter(
+        space_id__in=[space.pk for space in spaces], date__gte=date_from, date__lte=date_to
+    )
+    if granularity == DAY:
+        rollups = rollups.filter(hour=DAY_TOTAL)
+    else:
+        rollups = rollups.exclude(hour=DAY_TOTAL)
+    periods = defaultdict(list)
+    rows = rollups.order_by('space_id', 'date', 'hour').values_list(
+        'space_id', 'date', 'hour', 'booked_minutes', 'bookings'
+    )
+    for space_id, day, hour, minutes, count in rows:
+        if not minutes and not count:
+            continue
+        period = {'date': day.isoformat()}
+        if granularity == HOUR:
+            period['hour'] = hour
+        period['booked_minutes'] = minutes
+        period['bookings'] = count
+        periods[space_id].append(period)
+
+    days = sum(1 for _ in days_between(date_from, date_to))
+    result = []
+    for space in spaces:
+        space_periods = periods[space.pk]
+        booked = sum(period['booked_minutes'] for period in space_periods)
+        available = work_minutes(space) * days
+        result.append({
+            'space': space.pk,
+            'booked_minutes': booked,
+            'bookings': sum(period['bookings'] for period in space_periods),
+            'available_minutes': available,
+            # Брони суперпользователей могут выходить за рабочие часы
+            'utilization': round(booked / available, 4) if available else None,
+            'periods': space_periods,
+        })
+    return result
@@ -1,10 +1,61 @@
 from rest_framework import generics, permissions
-from .models import Space, Booking
-from .serializers import SpaceSerializer, BookingSerializer
+from .models import Space, Booking, BookingSeries, SeriesException, BOOKING_MAX_DURATION
+from .availability import free_slots, days_between
+from .occupancy import occupancy, bookings_in_range
+from .serializers import (
+    SpaceSerializer, BookingSerializer, AdminBookingSerializer, BookingBatchSerializer,
+    BookingSeriesSerializer, SeriesExceptionSerializer, schedule_data
+)
+from .recurrence import occurrences_between, merge_by_start
+from .flat import BOOKING_FLAT
+from .batch import create_batch
+from .pagination import BookingCursorPagination, AdminBookingCursorPagination
 from rest_framework.exceptions import ValidationError
 from datetime import datetime
+from django.utils import timezone
 from .permissions import IsOwner
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from .catalogue import get_catalogue
+from .exceptions import BookingConflict
+from . import schedule, utilization
+from .export import csv_chunks, export_queryset, export_series, ics_chunks
+from .feeds import ICS_CONTENT_TYPE, streaming_response
+from booking_spaceses.metrics import BOOKING_CREATE
+
+
+def conditional_response(request, data, etag, last_modified=None):
+    """
+    Ответ с ETag/Last-Modified; если клиент прислал актуальные
+    If-None-Match/If-Modified-Since - 304 без тела
+    """
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    response = not_modified if not_modified is not None else Response(data)
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Браузер хранит ответ, но перед использованием проверяет его запросом
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def flat_list(view, flat):
+    """
+    Ответ списка через плоский сериализатор (booking/flat.py):
+    без пагинации строки читаются values_list() без создания моделей
+    """
+    queryset = view.filter_queryset(view.get_queryset())
+    page = view.paginate_queryset(queryset)
+    if page is not None:
+        return view.get_paginated_response(flat.objects(page))
+    if isinstance(queryset, list):
+        return Response(flat.objects(queryset))
+    return Response(flat.rows(queryset))
 
 
 class SpaceListView(generics.ListAPIView):
@@ -12,11 +63,87 @@ class SpaceListView(generics.ListAPIView):
     serializer_class = SpaceSerializer
     permission_classes = [permissions.AllowAny]
 
+    def list(self, request, *args, **kwargs):
+        # Каталог отдается из кеша (booking/catalogue.py)
+        catalogue = get_catalogue()
+        return conditional_response(request, catalogue['spaces'], catalogue['etag'], catalogue['last_modified'])
+
 
 class BookingCreateView(generics.CreateAPIView):
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def create(self, request, *args, **kwargs):
+        # Исходы создания по причинам отказа (booking_create_total)
+        try:
+            response = super().create(request, *args, **kwargs)
+        except ValidationError as error:
+            BOOKING_CREATE.inc(outcome=rejection_reason(error))
+            raise
+        except BookingConflict:
+            BOOKING_CREATE.inc(outcome='conflict')
+            raise
+        BOOKING_CREATE.inc(outcome='created')
+        return response
+
+
+def rejection_reason(error):
+    """Код проверки из BookingSerializer.validate или invalid для ошибок полей"""
+    codes = error.get_codes()
+    if isinstance(codes, dict):
+        codes = codes.get('non_field_errors')
+    if isinstance(codes, list) and codes and isinstance(codes[0], str):
+        return codes[0]
+    return 'invalid'
+
+
+class BookingBatchCreateView(APIView):
+    """
+    Создание нескольких броней одним запросом (booking/batch.py).
+    mode=atomic - все брони или ни одной, mode=partial - только прошедшие проверку
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = BookingBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        mode = serializer.validated_data['mode']
+        result = create_batch(request.user, serializer.validated_data['bookings'], mode)
+        errors = result.error_list()
+        if not result.created:
+            # atomic-пакет с ошибками не создает ничего
+            return Response({'created': [], 'errors': errors}, status=400)
+        created = BookingSerializer(result.created, many=True).data
+        return Response({'created': created, 'errors': errors}, status=201)
+
+
+class BookingSeriesListCreateView(generics.ListCreateAPIView):
+    """Серии повторяющихся броней текущего пользователя"""
+    serializer_class = BookingSeriesSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return BookingSeries.objects.filter(user=self.request.user).prefetch_related('exceptions')
+
+
+class BookingSeriesDetailView(generics.RetrieveDestroyAPIView):
+    queryset = BookingSeries.objects.prefetch_related('exceptions')
+    serializer_class = BookingSeriesSerializer
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
+
+
+class SeriesExceptionCreateView(APIView):
+    """Отмена одного вхождения серии: POST {"date": "YYYY-MM-DD"}"""
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
+
+    def post(self, request, pk):
+        series = get_object_or_404(BookingSeries, pk=pk)
+        self.check_object_permissions(request, series)
+        serializer = SeriesExceptionSerializer(data=request.data, context={'series': series})
+        serializer.is_valid(raise_exception=True)
+        SeriesException.objects.get_or_create(series=series, date=serializer.validated_data['date'])
+        return Response(serializer.data, status=201)
+
 
 class BookingDeleteView(generics.DestroyAPIView):
     queryset = Booking.objects.all()
@@ -37,38 +164,290 @@ class IsOwner(permissions.BasePermission):
         return obj.user == request.user
 
 
+def parse_day(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        raise ValidationError("Invalid date format. Use YYYY-MM-DD.")
+
+
+def day_bounds(date):
+    start = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(date, datetime.max.time()))
+    return start, end
+
+
+def day_bookings(space_id, date):
+    start, end = day_bounds(date)
+    return Booking.objects.filter(
+        space_id=space_id,
+        start_time__gte=start,
+        start_time__lte=end
+    ).order_by('start_time', 'id')
+
+
+def day_items(space_id, date):
+    """
+    Брони дня вместе с вхождениями серий, начинающимися в этот день,
+    в порядке курсора (pagination.cursor_key). Без вхождений - запрос броней
+    """
+    start, end = day_bounds(date)
+    occurrences = [
+        occurrence for occurrence in occurrences_between([space_id], start, end)[space_id]
+        if occurrence.start_time >= start
+    ]
+    bookings = day_bookings(space_id, date)
+    if occurrences:
+        return merge_by_start(occurrences, list(bookings))
+    return bookings
+
+
+def day_schedule(space_id, date):
+    """Расписание дня в формате ответа SpaceBookingsView"""
+    items = day_items(space_id, date)
+    if isinstance(items, list):
+        return schedule_data(items)
+    return BOOKING_FLAT.rows(items)
+
+
 class SpaceBookingsView(generics.ListAPIView):
     serializer_class = BookingSerializer
+    pagination_class = BookingCursorPagination
 
-    def get_queryset(self):
-        space_id = self.kwargs['space_id']
-        date_str = self.request.query_params.get('date')
+    def get_date(self):
+        return parse_day(self.request.query_params.get('date'))
 
-        try:
-            date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        except (ValueError, TypeError):
-            raise ValidationError("Invalid date format. Use YYYY-MM-DD.")
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        if self.paginator.cursor_query_param in params or self.paginator.page_size_query_param in params:
+            # Постраничная выдача не кешируется; вхождения серий - как в расписании дня
+            page = self.paginate_queryset(self.get_queryset())
+            return self.get_paginated_response(schedule_data(page))
 
-        start = datetime.combine(date, datetime.min.time())
-        end = datetime.combine(date, datetime.max.time())
+        # День целиком отдается по версии расписания (booking/schedule.py):
+        # при совпадении ETag - 304 без запроса броней, иначе - из кеша ответа
+        space_id = self.kwargs['space_id']
+        date = self.get_date()
+        if not schedule.versioned():
+            data = day_schedule(space_id, date)
+            return conditional_response(request, data, schedule.etag(space_id, date, schedule.content_version(data)))
+        version = schedule.get_version(space_id, date)
+        etag = schedule.etag(space_id, date, version)
+        data = None
+        if get_conditional_response(request, etag=etag) is None:
+            data = schedule.get_payload(space_id, date, version)
+            if data is None:
+                data = day_schedule(space_id, date)
+                schedule.set_payload(space_id, date, version, data)
+        return conditional_response(request, data, etag)
 
-        return Booking.objects.filter(
-            space_id=space_id,
-            start_time__gte=start,
-            start_time__lte=end
-        ).order_by('start_time')
+    def get_queryset(self):
+        return day_items(self.kwargs['space_id'], self.get_date())
 
 
 class UserBookingsListView(generics.ListAPIView):
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = BookingCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        return flat_list(self, BOOKING_FLAT)
 
     def get_queryset(self):
         # Возвращает только бронирования текущего пользователя, отсортированные по времени
-        return Booking.objects.filter(user=self.request.user).order_by('start_time')
+        return Booking.objects.filter(user=self.request.user).order_by('start_time', 'id')
+
+
+class AdminBookingListView(generics.ListAPIView):
+    """Все брони системы для администраторов, всегда постранично"""
+    serializer_class = AdminBookingSerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = AdminBookingCursorPagination
+
+    def get_queryset(self):
+        return Booking.objects.order_by('start_time', 'id')
 
 
 class SpaceDetailView(generics.RetrieveAPIView):
     queryset = Space.objects.all()
     serializer_class = SpaceSerializer
     permission_classes = [permissions.AllowAny]
+
+    def retrieve(self, request, *args, **kwargs):
+        catalogue = get_catalogue()
+        entry = catalogue['by_id'].get(self.kwargs['pk'])
+        if entry is None:
+            raise Http404
+        space, etag = entry
+        return conditional_response(request, space, etag, catalogue['last_modified'])
+
+
+def parse_date_range(request, max_days):
+    """Параметры ?from=&to= (YYYY-MM-DD, включительно) с ограничением длины диапазона"""
+    try:
+        date_from = datetime.strptime(request.query_params.get('from'), '%Y-%m-%d').date()
+        date_to = datetime.strptime(request.query_params.get('to'), '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        raise ValidationError("Invalid date format. Use YYYY-MM-DD.")
+    if date_to < date_from:
+        raise ValidationError("'to' must not be earlier than 'from'.")
+    if (date_to - date_from).days >= max_days:
+        raise ValidationError(f"Date range cannot exceed {max_days} days.")
+    return date_from, date_to
+
+
+class AvailabilityView(APIView):
+    """
+    Свободные слоты всех пространств за диапазон дат:
+    GET /api/availability/?from=YYYY-MM-DD&to=YYYY-MM-DD&min_duration=30
+    """
+
+    def get(self, request):
+        date_from, date_to = parse_date_range(request, settings.BOOKING_AVAILABILITY_MAX_DAYS)
+
+        try:
+            min_duration = int(request.query_params.get('min_duration', 15))
+        except ValueError:
+            raise ValidationError("min_duration must be an integer number of minutes.")
+        if not 0 < min_duration <= BOOKING_MAX_DURATION:
+            raise ValidationError(f"min_duration must be between 1 and {BOOKING_MAX_DURATION} minutes.")
+
+        spaces = Space.objects.only('id', 'work_start', 'work_end')
+        return Response(free_slots(spaces, date_from, date_to, min_duration))
+
+
+class CalendarView(APIView):
+    """
+    Календарь пространств за диапазон дат:
+    GET /api/calendar/?from=YYYY-MM-DD&to=YYYY-MM-DD&spaces=1,2&mode=bookings|bitmap&granularity=15
+
+    mode=bookings (по умолчанию) - брони по дням, mode=bitmap - занятость
+    рабочего дня в виде битовой карты ячеек по granularity минут.
+    """
+
+    def get(self, request):
+        date_from, date_to = parse_date_range(request, settings.BOOKING_CALENDAR_MAX_DAYS)
+        mode = request.query_params.get('mode', 'bookings')
+        if mode not in ('bookings', 'bitmap'):
+            raise ValidationError("mode must be 'bookings' or 'bitmap'.")
+
+        spaces = Space.objects.only('id', 'work_start', 'work_end').order_by('id')
+        space_ids = request.query_params.get('spaces')
+        if space_ids:
+            try:
+                spaces = spaces.filter(id__in=[int(space_id) for space_id in space_ids.split(',')])
+            except ValueError:
+                raise ValidationError("spaces must be a comma-separated list of ids.")
+        spaces = list(spaces)
+
+        if mode == 'bitmap':
+            try:
+                granularity = int(request.query_params.get('granularity', 15))
+            except ValueError:
+                raise ValidationError("granularity must be an integer number of minutes.")
+            if not 5 <= granularity <= 240:
+                raise ValidationError("granularity must be between 5 and 240 minutes.")
+            return Response({
+                'granularity': granularity,
+                'spaces': occupancy(spaces, date_from, date_to, granularity),
+            })
+
+        grouped = bookings_in_range([space.pk for space in spaces], date_from, date_to)
+        result = []
+        for space in spaces:
+            by_day = {day: [] for day in days_between(date_from, date_to)}
+            for booking in grouped[space.pk]:
+                day = timezone.localtime(booking.start_time).date()
+                if day in by_day:
+                    by_day[day].append(booking)
+            result.append({
+                'space': space.pk,
+                'days': [
+                    {'date': day.isoformat(), 'bookings': schedule_data(bookings)}
+                    for day, bookings in by_day.items()
+                ],
+            })
+        return Response({'spaces': result})
+
+
+class UtilizationView(APIView):
+    """
+    Использование пространств по сводкам (booking/utilization.py):
+    GET /api/analytics/utilization/?from=YYYY-MM-DD&to=YYYY-MM-DD&spaces=1,2&granularity=day|hour
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        date_from, date_to = parse_date_range(request, settings.BOOKING_ANALYTICS_MAX_DAYS)
+        granularity = request.query_params.get('granularity', utilization.DAY)
+        if granularity not in utilization.GRANULARITIES:
+            raise ValidationError("granularity must be 'day' or 'hour'.")
+
+        spaces = Space.objects.only('id', 'work_start', 'work_end').order_by('id')
+        space_ids = request.query_params.get('spaces')
+        if space_ids:
+            try:
+                spaces = spaces.filter(id__in=[int(space_id) for space_id in space_ids.split(',')])
+            except ValueError:
+                raise ValidationError("spaces must be a comma-separated list of ids.")
+        return Response({
+            'from': date_from.isoformat(),
+            'to': date_to.isoformat(),
+            'granularity': granularity,
+            'spaces': utilization.report(list(spaces), date_from, date_to, granularity),
+        })
+
+
+class BookingExportView(APIView):
+    """
+    Выгрузка броней потоком (booking/export.py):
+    GET /api/export/bookings.csv|ics?spaces=1,2&user=3&from=YYYY-MM-DD&to=YYYY-MM-DD
+
+    Пользователь выгружает свои брони, администратор - все или брони
+    пользователя ?user=. Без from/to - все брони. Вместе с бронями
+    выгружаются вхождения серий с теми же условиями.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, fmt):
+        filters = {}
+        if request.user.is_staff:
+            user_id = request.query_params.get('user')
+            if user_id:
+                try:
+                    filters['user_id'] = int(user_id)
+                except ValueError:
+                    raise ValidationError("user must be an integer id.")
+        else:
+            filters['user_id'] = request.user.pk
+
+        space_ids = request.query_params.get('spaces')
+        if space_ids:
+            try:
+                filters['space_id__in'] = [int(space_id) for space_id in space_ids.split(',')]
+            except ValueError:
+                raise ValidationError("spaces must be a comma-separated list of ids.")
+
+        bookings = Booking.objects.filter(**filters)
+        start = end = None
+        if 'from' in request.query_params or 'to' in request.query_params:
+            date_from, date_to = parse_date_range(request, settings.BOOKING_EXPORT_MAX_DAYS)
+            start, end = utilization.local_bounds(date_from, date_to)
+            bookings = bookings.filter(start_time__gte=start, start_time__lt=end)
+        # Как и брони, вхождения попадают в выгрузку по времени начала
+        occurrences = [
+            occurrence for occurrence in export_series(BookingSeries.objects.filter(**filters), start, end)
+            if start is None or occurrence.start_time >= start
+        ]
+
+        queryset = export_queryset(bookings)
+        if fmt == 'csv':
+            return streaming_response(
+                request._request, csv_chunks(queryset, occurrences=occurrences),
+                'text/csv; charset=utf-8', 'bookings.csv'
+            )
+        name = 'Брони' if request.user.is_staff else request.user.username
+        chunks = ics_chunks(
+            queryset, name, lambda booking: booking.space.name, request.get_host(), occurrences=occurrences
+        )
+        return streaming_response(request._request, chunks, ICS_CONTENT_TYPE, 'bookings.ics')
@@ -0,0 +1,341 @@
+"""
+Метрики горячих путей в текстовом формате Prometheus (GET /api/metrics/).
+
+Реестр хранит счетчики и гистограммы в памяти процесса: обновление -
+сложение под блокировкой, без ввода-вывода. Чтобы метрики всех воркеров
+gunicorn (и процесса очистки) были видны с любого из них, при заданном
+METRICS_DIR каждый процесс раз в METRICS_FLUSH_INTERVAL секунд сбрасывает
+свои значения в файл ``<хост>-<pid>-<id запуска>.json`` этого каталога, а
+эндпоинт складывает файлы всех процессов. Id запуска - случайный, новый в
+каждом процессе и после fork: воркер, получивший pid завершившегося, не
+перезапишет его файл.
+
+Счетчики завершившихся процессов входят в суммы, и суммы не уменьшаются
+при перезапуске воркеров. Файлы, которые не обновлялись дольше
+METRICS_RETIRE_AFTER секунд, эндпоинт складывает в ``retired.json`` и
+удаляет, поэтому каталог не растет с каждым перезапуском. Без METRICS_DIR
+эндпоинт отдает метрики только своего процесса.
+
+Эндпоинт - booking_spaceses/views.py.
+"""
+import atexit
+import glob
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+try:
+    import fcntl
+except ImportError:  # Windows: файлы завершившихся процессов не сливаются
+    fcntl = None
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Сумма метрик завершившихся процессов и блокировка каталога на время слияния
+RETIRED_FILE = 'retired.json'
+LOCK_FILE = 'metrics.lock'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry or REGISTRY
+        self._values = {}
+        self.registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, **extra):
+        return {**dict(zip(self.labelnames, key)), **extra}
+
+    def reset(self):
+        self._values = {}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self.registry.touch()
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name, self._labels(key), value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        position = len(self.buckets)
+        for number, bound in enumerate(self.buckets):
+            if value <= bound:
+                position = number
+                break
+        with self.registry.lock:
+            # Счетчики по корзинам (последняя - +Inf) и сумма наблюдений
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[position] += 1
+            counts[-1] += value
+        self.registry.touch()
+
+    def samples(self):
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        for key, counts in self._values.items():
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', self._labels(key, le=bound), cumulative
+            yield f'{self.name}_sum', self._labels(key), counts[-1]
+            yield f'{self.name}_count', self._labels(key), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+        self.start_id = uuid.uuid4().hex[:12]
+        if hasattr(os, 'register_at_fork'):
+            # Дочерний процесс начинает с нуля: значения родителя уже учтены в его файле
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.flush)
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def _after_fork(self):
+        self.lock = threading.Lock()
+        self._flusher_lock = threading.Lock()
+        self._flusher = None
+        self.start_id = uuid.uuid4().hex[:12]
+        for metric in self.metrics.values():
+            metric.reset()
+
+    @staticmethod
+    def directory():
+        return getattr(settings, 'METRICS_DIR', '') if settings.configured else ''
+
+    def touch(self):
+        """Запускает поток сброса в файл при первом обновлении метрик в процессе"""
+        if self._flusher is None and self.directory():
+            with self._flusher_lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        stop = threading.Event()
+        while not stop.wait(settings.METRICS_FLUSH_INTERVAL):
+            self.flush()
+
+    def local_samples(self):
+        with self.lock:
+            return [
+                (name, labels, value)
+                for metric in self.metrics.values()
+                for name, labels, value in metric.samples()
+            ]
+
+    def path(self, directory):
+        return os.path.join(directory, f'{socket.gethostname()}-{os.getpid()}-{self.start_id}.json')
+
+    def flush(self):
+        directory = self.directory()
+        if not directory:
+            return
+        samples = self.local_samples()
+        if not samples:
+            return
+        os.makedirs(directory, exist_ok=True)
+        write_samples(self.path(directory), samples)
+
+    def retire(self, directory):
+        """
+        Складывает в RETIRED_FILE и удаляет файлы процессов, которые не
+        обновлялись дольше METRICS_RETIRE_AFTER секунд. Пропускается, если
+        каталог сейчас читает или сливает другой процесс
+        """
+        if fcntl is None:
+            return
+        cutoff = time.time() - settings.METRICS_RETIRE_AFTER
+        with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            stale = []
+            for path in process_files(directory):
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        stale.append(path)
+                except OSError:
+                    continue
+            if not stale:
+                return
+            retired = os.path.join(directory, RETIRED_FILE)
+            totals = sum_samples(read_samples(path) for path in [retired, *stale])
+            write_samples(retired, [
+                (name, dict(labels), value) for (name, labels), value in sorted(totals.items(), key=sample_order)
+            ])
+            for path in stale:
+                os.remove(path)
+
+    def collect(self):
+        """Значения всех процессов: {(имя, метки): значение}"""
+        directory = self.directory()
+        if not directory:
+            return sum_samples([self.local_samples()])
+        self.flush()
+        os.makedirs(directory, exist_ok=True)
+        self.retire(directory)
+        paths = [os.path.join(directory, RETIRED_FILE), *process_files(directory)]
+        if fcntl is None:
+            return sum_samples(read_samples(path) for path in paths)
+        # Слияние не идет, пока файлы читаются: иначе сумма учла бы процесс дважды
+        with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            return sum_samples(read_samples(path) for path in paths)
+
+    def exposition(self):
+        totals = self.collect()
+        families = defaultdict(list)
+        for (name, labels), value in sorted(totals.items(), key=sample_order):
+            families[self._family(name)].append((name, labels, value))
+        for name, labels, value in cache_hit_ratios(totals):
+            families['booking_cache_hit_ratio'].append((name, labels, value))
+
+        lines = []
+        for family in sorted(families):
+            metric = self.metrics.get(family)
+            if metric is not None:
+                documentation, metric_type = metric.documentation, metric.type
+            else:
+                documentation, metric_type = 'Доля попаданий в кеш', 'gauge'
+            lines.append(f'# HELP {family} {documentation}')
+            lines.append(f'# TYPE {family} {metric_type}')
+            for name, labels, value in families[family]:
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def _family(self, name):
+        if name in self.metrics:
+            return name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in self.metrics:
+                return name[:-len(suffix)]
+        return name
+
+
+def process_files(directory):
+    """Файлы процессов каталога (без суммы завершившихся)"""
+    return [
+        path for path in glob.glob(os.path.join(directory, '*.json'))
+        if os.path.basename(path) != RETIRED_FILE
+    ]
+
+
+def read_samples(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return []
+
+
+def write_samples(path, samples):
+    # Запись через временный файл: читатель не увидит файл наполовину
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as file:
+        json.dump(samples, file)
+    os.replace(temporary, path)
+
+
+def sum_samples(sources):
+    totals = defaultdict(float)
+    for samples in sources:
+        for name, labels, value in samples:
+            totals[(name, tuple(sorted(labels.items())))] += value
+    return totals
+
+
+def sample_order(item):
+    # Корзины гистограммы - подряд для одного набора меток и по возрастанию границы
+    (name, labels), _ = item
+    bounds = [float(value) for label, value in labels if label == 'le']
+    return name, [pair for pair in labels if pair[0] != 'le'], bounds
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    # Граница корзины le - последней меткой, как принято в формате
+    labels = sorted(labels, key=lambda pair: pair[0] == 'le')
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def cache_hit_ratios(totals):
+    """Доля попаданий по каждому кешу из счетчика booking_cache_requests_total"""
+    requests = defaultdict(lambda: [0.0, 0.0])
+    for (name, labels), value in totals.items():
+        if name == CACHE_REQUESTS.name:
+            labels = dict(labels)
+            requests[labels['cache']][labels['result'] == 'hit'] += value
+    return [
+        ('booking_cache_hit_ratio', (('cache', cache),), hits / (hits + misses))
+        for cache, (misses, hits) in sorted(requests.items()) if hits + misses
+    ]
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = Histogram(
+    'booking_http_request_duration_seconds', 'Время обработки запроса API по представлениям',
+    ('view', 'method', 'status'),
+)
+DB_DURATION = Histogram(
+    'booking_db_duration_seconds', 'Время SQL-запросов за один запрос API по представлениям', ('view',),
+)
+DB_QUERIES = Counter('booking_db_queries_total', 'Число SQL-запросов по представлениям', ('view',))
+BOOKING_CREATE = Counter(
+    'booking_create_total', 'Исходы создания брони: created или причина отказа', ('outcome',),
+)
+RETENTION_DELETED = Counter('booking_retention_deleted_total', 'Броней удалено очисткой')
+CACHE_REQUESTS = Counter('booking_cache_requests_total', 'Обращения к кешам', ('cache', 'result'))
+
+
+def cache_lookup(cache_name, value):
+    """Учитывает обращение к кешу (промах - None) и возвращает значение"""
+    CACHE_REQUESTS.inc(cache=cache_name, result='miss' if value is None else 'hit')
+    return value
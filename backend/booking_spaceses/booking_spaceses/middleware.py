@@ -0,0 +1,248 @@
+"""
+Инструментирование запросов API.
+
+Middleware проекта работают и под WSGI, и под ASGI (без перехода в поток
+на каждый запрос). Обертки выполнения SQL при ASGI ставятся в потоке
+запроса, где Django выполняет синхронный код и асинхронный ORM
+(sync_to_async с thread_sensitive).
+
+StaticFilesMiddleware - WhiteNoise с асинхронным путем для запросов не к статике.
+
+RequestMetricsMiddleware записывает время обработки и время в базе по
+представлениям в метрики процесса (booking_spaceses/metrics.py).
+
+QueryInstrumentationMiddleware включается настройкой SQL_INSTRUMENTATION и
+для доли запросов SQL_INSTRUMENTATION_SAMPLE_RATE считает число SQL-запросов,
+суммарное время в базе и самые медленные выражения. Результат уходит:
+
+- в заголовок Server-Timing (видно во вкладке Network браузера):
+  ``Server-Timing: db;dur=12.4;desc="7 queries", app;dur=30.1, total;dur=42.5``
+- в лог booking_spaceses.sql одной JSON-строкой на запрос; запросы дольше
+  SQL_SLOW_REQUEST_MS пишутся с уровнем WARNING.
+
+Для каждого выражения учитывается только текст SQL без параметров: в лог
+не попадают данные пользователей. Повторяющиеся выражения (``repeated``)
+обычно означают N+1 - запрос в цикле по объектам.
+"""
+import heapq
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .metrics import DB_DURATION, DB_QUERIES, REQUEST_DURATION
+
+logger = logging.getLogger('booking_spaceses.sql')
+
+# Длинные выражения (IN со списком, пакетные INSERT) в логе обрезаются
+SQL_MAX_LENGTH = 500
+
+
+class HybridMiddleware:
+    """
+    Основа middleware с синхронным (__call__) и асинхронным (__acall__)
+    путями, как django.utils.deprecation.MiddlewareMixin
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+def wrap_connections(wrapper):
+    """Ставит обертку выполнения SQL на соединения текущего потока"""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+    return stack
+
+
+async def get_response_wrapped(get_response, request, wrapper):
+    """Асинхронный вызов get_response с оберткой SQL в потоке запроса"""
+    stack = await sync_to_async(wrap_connections)(wrapper)
+    try:
+        return await get_response(request)
+    finally:
+        await sync_to_async(stack.close)()
+
+
+class StaticFilesMiddleware(HybridMiddleware, WhiteNoiseMiddleware):
+    def __init__(self, get_response):
+        WhiteNoiseMiddleware.__init__(self, get_response)
+        HybridMiddleware.__init__(self, get_response)
+
+    def handle(self, request):
+        return WhiteNoiseMiddleware.__call__(self, request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class QueryTimer:
+    """Минимальная обертка выполнения запросов: только число и суммарное время"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class RequestMetricsMiddleware(HybridMiddleware):
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with wrap_connections(timer):
+            response = self.get_response(request)
+        self.record(request, response, timer, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        response = await get_response_wrapped(self.get_response, request, timer)
+        self.record(request, response, timer, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def record(request, response, timer, elapsed):
+        # Имя маршрута, а не путь: число значений меток ограничено
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+        REQUEST_DURATION.observe(
+            elapsed, view=view, method=request.method, status=f'{response.status_code // 100}xx'
+        )
+        DB_DURATION.observe(timer.duration, view=view)
+        if timer.count:
+            DB_QUERIES.inc(timer.count, view=view)
+
+
+class QueryRecorder:
+    """Обертка выполнения запросов (connection.execute_wrapper) для одного запроса API"""
+
+    def __init__(self, top):
+        self.top = top
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self._slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            self.statements[sql] += 1
+            item = (elapsed, self.count, sql)
+            if len(self._slowest) < self.top:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heappushpop(self._slowest, item)
+
+    def slowest(self):
+        return [
+            {'ms': round(elapsed * 1000, 2), 'sql': sql[:SQL_MAX_LENGTH]}
+            for elapsed, _, sql in sorted(self._slowest, reverse=True)
+        ]
+
+    def repeated(self):
+        return [
+            {'count': count, 'sql': sql[:SQL_MAX_LENGTH]}
+            for sql, count in self.statements.most_common(self.top) if count > 1
+        ]
+
+
+class QueryInstrumentationMiddleware(HybridMiddleware):
+    def __init__(self, get_response):
+        if not settings.SQL_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.sample_rate = settings.SQL_INSTRUMENTATION_SAMPLE_RATE
+        self.slow_ms = settings.SQL_SLOW_REQUEST_MS
+        self.top = settings.SQL_INSTRUMENTATION_TOP
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def handle(self, request):
+        if not self.sampled():
+            return self.get_response(request)
+        recorder = QueryRecorder(self.top)
+        started = time.perf_counter()
+        with wrap_connections(recorder):
+            response = self.get_response(request)
+        return self.report(request, response, recorder, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        recorder = QueryRecorder(self.top)
+        started = time.perf_counter()
+        response = await get_response_wrapped(self.get_response, request, recorder)
+        return self.report(request, response, recorder, time.perf_counter() - started)
+
+    def report(self, request, response, recorder, elapsed):
+        total_ms = elapsed * 1000
+        db_ms = recorder.duration * 1000
+
+        timing = (
+            f'db;dur={db_ms:.1f};desc="{recorder.count} queries", '
+            f'app;dur={max(total_ms - db_ms, 0):.1f}, total;dur={total_ms:.1f}'
+        )
+        if response.has_header('Server-Timing'):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response['Server-Timing'] = timing
+
+        slow = total_ms >= self.slow_ms
+        level = logging.WARNING if slow else logging.INFO
+        if logger.isEnabledFor(level):
+            record = {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'view': getattr(getattr(request, 'resolver_match', None), 'view_name', None),
+                'queries': recorder.count,
+                'db_ms': round(db_ms, 2),
+                'total_ms': round(total_ms, 2),
+                'slow': slow,
+                'slowest': recorder.slowest(),
+                'repeated': recorder.repeated(),
+            }
+            logger.log(level, json.dumps(record, ensure_ascii=False), extra={'sql': record})
+        return response
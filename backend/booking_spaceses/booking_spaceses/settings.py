@@ -12,22 +12,18 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
-import logging
-
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-# Проверка и логирование критических переменных окружения
+# Импорт настроек ничего не пишет в лог и не настраивает логирование:
+# модуль импортирует каждый воркер и каждая команда manage.py, а логирование
+# настраивает Django по LOGGING (см. ниже)
 def get_env_var(var_name, default=None, required=False):
     value = os.getenv(var_name, default)
     if required and not value:
-        logger.error(f"Required environment variable {var_name} is not set!")
         raise ValueError(f"Required environment variable {var_name} is not set!")
-    logger.info(f"Environment variable {var_name}: {value if not var_name.endswith('PASSWORD') else '***'}")
     return value
 
 # SECURITY WARNING: keep the secret key used in production secret!
@@ -105,17 +101,23 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'UPLOADED_FILES_USE_URL': False,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
-    ]
+    ],
+    # Быстрый JSON (orjson, если установлен) и браузерный API для отладки
+    'DEFAULT_RENDERER_CLASSES': [
+        'booking.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise с асинхронным путем для ASGI (booking_spaceses/middleware.py)
+    'booking_spaceses.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -125,6 +127,36 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Сжатие ответов gzip для клиентов с Accept-Encoding: gzip (большие списки броней)
+API_GZIP = get_env_var('API_GZIP', 'False').lower() == 'true'
+if API_GZIP:
+    # Сразу после SecurityMiddleware: сжимается уже готовый ответ
+    MIDDLEWARE.insert(1, 'django.middleware.gzip.GZipMiddleware')
+
+# Учет SQL-запросов по запросам API (booking_spaceses/middleware.py):
+# заголовок Server-Timing и JSON-строка в лог booking_spaceses.sql.
+# Доля инструментируемых запросов, порог медленного запроса (мс, пишется
+# с уровнем WARNING) и число самых медленных выражений в логе
+SQL_INSTRUMENTATION = get_env_var('SQL_INSTRUMENTATION', 'False').lower() == 'true'
+SQL_INSTRUMENTATION_SAMPLE_RATE = float(get_env_var('SQL_INSTRUMENTATION_SAMPLE_RATE', '1.0'))
+SQL_SLOW_REQUEST_MS = int(get_env_var('SQL_SLOW_REQUEST_MS', '500'))
+SQL_INSTRUMENTATION_TOP = int(get_env_var('SQL_INSTRUMENTATION_TOP', '5'))
+if SQL_INSTRUMENTATION:
+    # Первым: время запроса включает все остальные middleware
+    MIDDLEWARE.insert(0, 'booking_spaceses.middleware.QueryInstrumentationMiddleware')
+
+# Метрики процесса (booking_spaceses/metrics.py, GET /api/metrics/).
+# METRICS_DIR - общий каталог процессов: при нескольких воркерах gunicorn
+# каждый сбрасывает туда свои метрики раз в METRICS_FLUSH_INTERVAL секунд;
+# файлы процессов, не обновлявшиеся METRICS_RETIRE_AFTER секунд, сливаются в один.
+# METRICS_TOKEN - токен сборщика метрик (Authorization: Bearer <токен>)
+METRICS_ENABLED = get_env_var('METRICS_ENABLED', 'True').lower() == 'true'
+METRICS_DIR = get_env_var('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = int(get_env_var('METRICS_FLUSH_INTERVAL', '5'))
+METRICS_RETIRE_AFTER = int(get_env_var('METRICS_RETIRE_AFTER', '600'))
+METRICS_TOKEN = get_env_var('METRICS_TOKEN', '')
+MIDDLEWARE.insert(0, 'booking_spaceses.middleware.RequestMetricsMiddleware')
+
 ROOT_URLCONF = 'booking_spaceses.urls'
 
 TEMPLATES = [
@@ -224,6 +256,110 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'http')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Кеш: по умолчанию в памяти процесса. Для нескольких воркеров gunicorn
+# укажите общий бэкенд, например django.core.cache.backends.redis.RedisCache
+CACHES = {
+    'default': {
+        'BACKEND': get_env_var('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': get_env_var('DJANGO_CACHE_LOCATION', 'booking-spaces'),
+    }
+}
+
+# Кеш аутентификации по токену (accounts/authentication.py):
+# время жизни в общем кеше, время жизни и размер кеша в памяти процесса
+AUTH_TOKEN_CACHE_TTL = int(get_env_var('AUTH_TOKEN_CACHE_TTL', '300'))
+AUTH_TOKEN_LOCAL_CACHE_TTL = int(get_env_var('AUTH_TOKEN_LOCAL_CACHE_TTL', '10'))
+AUTH_TOKEN_LOCAL_CACHE_SIZE = int(get_env_var('AUTH_TOKEN_LOCAL_CACHE_SIZE', '1024'))
+
+# Уменьшенные копии изображений пространств (booking/images.py):
+# размер -> ширина в пикселях и число фоновых потоков обработки
+SPACE_IMAGE_SIZES = {
+    'small': 320,
+    'medium': 800,
+    'large': 1600,
+}
+SPACE_IMAGE_WORKERS = int(get_env_var('SPACE_IMAGE_WORKERS', '1'))
+# Строить копии в фоне при сохранении пространства. В тестах (manage.py test)
+# по умолчанию выключено; без фона копии строит команда generate_space_images
+TESTING = sys.argv[1:2] == ['test']
+SPACE_IMAGE_VARIANTS = get_env_var('SPACE_IMAGE_VARIANTS', 'False' if TESTING else 'True').lower() == 'true'
+
+# Настройки бронирования
+# Число попыток создать бронь при взаимной блокировке транзакций
+BOOKING_CREATE_ATTEMPTS = int(get_env_var('BOOKING_CREATE_ATTEMPTS', '3'))
+# Очистка старых бронирований: возраст (дни) и интервал между проходами (секунды)
+BOOKING_RETENTION_DAYS = int(get_env_var('BOOKING_RETENTION_DAYS', '1'))
+BOOKING_RETENTION_INTERVAL = int(get_env_var('BOOKING_RETENTION_INTERVAL', '3600'))
+# Размер порции удаления, пауза между порциями (секунды) и лимит времени прохода
+BOOKING_RETENTION_BATCH_SIZE = int(get_env_var('BOOKING_RETENTION_BATCH_SIZE', '1000'))
+BOOKING_RETENTION_BATCH_SLEEP = float(get_env_var('BOOKING_RETENTION_BATCH_SLEEP', '0.1'))
+BOOKING_RETENTION_TIME_BUDGET = float(get_env_var('BOOKING_RETENTION_TIME_BUDGET', '300'))
+# Файл межпроцессной блокировки очистки, если нет ни PostgreSQL, ни общего кеша
+BOOKING_RETENTION_LOCK_FILE = get_env_var('BOOKING_RETENTION_LOCK_FILE', os.path.join(BASE_DIR, '.retention.lock'))
+# Архив удаляемых бронирований: сохранять ли брони перед удалением,
+# каталог архива и размер порции чтения из базы
+BOOKING_RETENTION_ARCHIVE = get_env_var('BOOKING_RETENTION_ARCHIVE', 'False').lower() == 'true'
+BOOKING_ARCHIVE_DIR = get_env_var('BOOKING_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+BOOKING_ARCHIVE_CHUNK_SIZE = int(get_env_var('BOOKING_ARCHIVE_CHUNK_SIZE', '500'))
+# Запускать воркер очистки потоком внутри процессов веб-сервера
+# (иначе - отдельным процессом: python manage.py run_retention)
+BOOKING_RETENTION_IN_PROCESS = get_env_var('BOOKING_RETENTION_IN_PROCESS', 'False').lower() == 'true'
+# Время жизни кеша каталога пространств (секунды)
+BOOKING_CATALOGUE_CACHE_TTL = int(get_env_var('BOOKING_CATALOGUE_CACHE_TTL', '300'))
+# Время жизни версий расписания по дням и кеша ответов расписания (секунды)
+BOOKING_SCHEDULE_CACHE_TTL = int(get_env_var('BOOKING_SCHEDULE_CACHE_TTL', '60'))
+# Максимальный диапазон дат для поиска свободных слотов (дни)
+BOOKING_AVAILABILITY_MAX_DAYS = int(get_env_var('BOOKING_AVAILABILITY_MAX_DAYS', '31'))
+# Максимальный диапазон дат календаря (дни)
+BOOKING_CALENDAR_MAX_DAYS = int(get_env_var('BOOKING_CALENDAR_MAX_DAYS', '62'))
+# Максимальный диапазон дат отчета об использовании пространств (дни)
+BOOKING_ANALYTICS_MAX_DAYS = int(get_env_var('BOOKING_ANALYTICS_MAX_DAYS', '366'))
+# Выгрузка броней (booking/export.py): броней в одной порции чтения и ответа,
+# максимальный диапазон дат выгрузки (дни)
+BOOKING_EXPORT_CHUNK_SIZE = int(get_env_var('BOOKING_EXPORT_CHUNK_SIZE', '2000'))
+BOOKING_EXPORT_MAX_DAYS = int(get_env_var('BOOKING_EXPORT_MAX_DAYS', '366'))
+# Календарные ленты (booking/feeds.py): сколько дней прошлых броней в ленте,
+# время жизни версий лент (секунды)
+BOOKING_FEED_PAST_DAYS = int(get_env_var('BOOKING_FEED_PAST_DAYS', '30'))
+BOOKING_FEED_CACHE_TTL = int(get_env_var('BOOKING_FEED_CACHE_TTL', '900'))
+# Максимальное число броней в одном пакетном запросе
+BOOKING_BATCH_MAX_SIZE = int(get_env_var('BOOKING_BATCH_MAX_SIZE', '100'))
+# Максимальная длина серии повторяющихся броней (дни)
+BOOKING_SERIES_MAX_DAYS = int(get_env_var('BOOKING_SERIES_MAX_DAYS', '366'))
+# Push-канал расписания (booking/events.py, booking/streams.py): брокер событий
+# (booking.events.PostgresBroker - для нескольких процессов), пинг и время
+# жизни соединения (секунды), размер очереди событий одного клиента
+BOOKING_EVENT_BROKER = get_env_var('BOOKING_EVENT_BROKER', 'booking.events.InProcessBroker')
+BOOKING_EVENTS_HEARTBEAT = int(get_env_var('BOOKING_EVENTS_HEARTBEAT', '15'))
+BOOKING_EVENTS_MAX_AGE = int(get_env_var('BOOKING_EVENTS_MAX_AGE', '600'))
+BOOKING_EVENTS_QUEUE_SIZE = int(get_env_var('BOOKING_EVENTS_QUEUE_SIZE', '100'))
+# Логирование: сообщения приложений уровня LOG_LEVEL и выше - в консоль
+LOG_LEVEL = get_env_var('LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{levelname}:{name}:{message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': LOG_LEVEL,
+    },
+}
+# Асинхронные представления чтения (booking/async_views.py) вместо DRF:
+# каталог, расписание дня, свои брони и /api/auth/me/. Имеет смысл под
+# ASGI-сервером (uvicorn), под WSGI каждый запрос выполняется в своем цикле событий
+API_ASYNC_VIEWS = get_env_var('API_ASYNC_VIEWS', 'False').lower() == 'true'
+
 # # Security settings
 # if not DEBUG:
 #     CSRF_COOKIE_SECURE = True
@@ -0,0 +1,28 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import permissions
+from rest_framework.views import APIView
+
+from .metrics import REGISTRY
+
+
+class CanScrapeMetrics(permissions.BasePermission):
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+class MetricsView(APIView):
+    """
+    Метрики всех процессов в текстовом формате Prometheus. Доступ: сотрудники
+    (is_staff) или заголовок ``Authorization: Bearer <METRICS_TOKEN>``
+    """
+    permission_classes = [CanScrapeMetrics]
+
+    def get(self, request):
+        return HttpResponse(REGISTRY.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')